@@ -0,0 +1,51 @@
+import fire
+from components import batch, pipeline
+from components.manifest import Manifest
+from components.munisource import nj_millburn
+
+
+def _sources(stage, reprocess):
+    manifest = Manifest()
+    if not len(manifest):
+        manifest.backfill(
+            source
+            for doctype in nj_millburn.DOCTYPES
+            for year in nj_millburn.YEARS_TO_PROCESS
+            for source in nj_millburn.get_sources(doctype, year)
+        )
+
+    sources = manifest.sources(
+        nj_millburn.DOCTYPES,
+        nj_millburn.YEARS_TO_PROCESS,
+        pending_stage=None if reprocess else stage,
+        fingerprints=lambda source, sha256: pipeline.expected_fingerprints(
+            source, sha256, batch.config_through(stage)
+        ),
+    )
+    return manifest, sources
+
+
+def export(stage="addresses", reprocess=False):
+    # Phase one: write the requests of every source pending stage that are
+    # not in the response cache to batches/<stage>-<timestamp>.jsonl
+    manifest, sources = _sources(stage, reprocess)
+    job = batch.BatchJob()
+    counts = batch.run(sources, stage, job, manifest=manifest)
+    print(f"{stage}: {counts}")
+    if len(job):
+        print(f"{len(job)} requests: {job.write(batch.job_path(stage))}")
+    else:
+        print("nothing left to request")
+
+
+def ingest(responses, stage="addresses", reprocess=False):
+    # Phase two: cache a batch output file and write the stage artifacts of
+    # every source it completes. Requests that depend on these responses,
+    # e.g. summaries of streets missing from a batched response, go to a
+    # follow-up job
+    print(f"{responses}: {batch.ingest_responses(responses)}")
+    export(stage, reprocess)
+
+
+if __name__ == "__main__":
+    fire.Fire({"export": export, "ingest": ingest})
@@ -0,0 +1,125 @@
+import os
+import time
+import random
+import tracemalloc
+import tempfile
+import fire
+from dataclasses import asdict
+from tabulate import tabulate
+
+from components.artifact import Artifact, ColumnarArtifact
+from components.processors.pdf2text import PROCESSOR_NAME, TextPage
+from components.wordtable import HEADERS, WordTable
+
+WORDS = "the board resolved application for variance at main street lot block".split()
+
+
+def synthetic_pages(source, n_pages, words_per_page, seed=0):
+    # Tesseract-like pages, values are strings as parsed from image_to_data
+    rng = random.Random(seed)
+    pages = []
+    for pp in range(n_pages):
+        table = []
+        for ww in range(words_per_page):
+            block, line, word = ww // 100 + 1, ww // 10 + 1, ww % 10 + 1
+            table.append(
+                [
+                    "5",
+                    "1",
+                    str(block),
+                    "1",
+                    str(line),
+                    str(word),
+                    str(word * 80),
+                    str(line * 30),
+                    str(rng.randint(20, 120)),
+                    "24",
+                    f"{rng.uniform(60, 99):.6f}",
+                    rng.choice(WORDS),
+                ]
+            )
+        table = WordTable.from_rows(HEADERS, table)
+        pages.append(TextPage(pp, table.to_text(), HEADERS, table, source))
+
+    return pages
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def bench_artifacts(n_pages=60, words_per_page=400):
+    """
+    Size and load time of json vs columnar pdf2text artifacts.
+
+    Usage: python -m benchmarks.bench_artifacts [--n_pages=60]
+    """
+    source = {
+        "state_abbrv": "NJ",
+        "city": "Millburn",
+        "doctype": "ZONING",
+        "year": "2023",
+        "date": "2023-01-01",
+        "id": "bench",
+    }
+    pages = synthetic_pages(source, n_pages, words_per_page)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as root:
+        for artifact in [
+            Artifact(source, PROCESSOR_NAME, root=root),
+            ColumnarArtifact(source, PROCESSOR_NAME, root=root),
+        ]:
+            if isinstance(artifact, ColumnarArtifact):
+                write_s, _ = _timed(lambda: artifact.write(pages))
+            else:
+                write_s, _ = _timed(
+                    lambda: artifact.write(
+                        [asdict(p) | {"table": list(p.table)} for p in pages]
+                    )
+                )
+            load_s, data = _timed(artifact.read)
+            table_s, _ = _timed(lambda: [len(TextPage(**p).table.words) for p in data])
+
+            # memory held by loaded pages with tables materialized, json
+            # artifacts as the previous lists of string rows per page
+            tracemalloc.start()
+            loaded = artifact.read()
+            if isinstance(artifact, ColumnarArtifact):
+                loaded = [TextPage(**p) for p in loaded]
+                [p.table.values for p in loaded]
+            memory_mb = tracemalloc.get_traced_memory()[0] / 1024**2
+            tracemalloc.stop()
+            del loaded
+            rows.append(
+                [
+                    type(artifact).__name__,
+                    os.path.getsize(artifact.filepath) / 1024**2,
+                    write_s,
+                    load_s,
+                    load_s + table_s,
+                    memory_mb,
+                ]
+            )
+
+    print(f"{n_pages} pages x {words_per_page} words")
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "format",
+                "MB",
+                "write s",
+                "load text s",
+                "load + tables s",
+                "in memory MB",
+            ],
+            floatfmt=".3f",
+        )
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(bench_artifacts)
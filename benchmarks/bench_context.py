@@ -0,0 +1,152 @@
+import difflib
+import fire
+from tabulate import tabulate
+
+from components.artifact import ARTIFACT_ROOT, Artifact
+from components.metrics import reset_metrics
+from components.processors import context, llm, pdf2text, summarize
+from components.processors.address import PROCESSOR_NAME as ADDRESS_NAME
+from components.processors.address import AddressDetection
+from components.processors.tokens import count_tokens
+from benchmarks.bench_prefilter import _artifact_dirs
+
+
+def _summaries_by_page(summaries):
+    # Returns: {(street, page): Summary, ...}
+    return {(s.street, s.page): s for v in summaries.values() for s in v}
+
+
+def _agreement(reference, candidate):
+    # Returns: (status match, tag jaccard, summary text similarity)
+    tags = set(reference.tags or []), set(candidate.tags or [])
+    jaccard = len(tags[0] & tags[1]) / len(tags[0] | tags[1]) if any(tags) else 1.0
+    similarity = difflib.SequenceMatcher(
+        None, reference.summary or "", candidate.summary or ""
+    ).ratio()
+    return reference.status == candidate.status, jaccard, similarity
+
+
+def _run(source, pages, addresses, context_tokens):
+    # Returns: ({street: [Summary, ...]}, llm metrics of the run)
+    metrics = reset_metrics()
+    processor = summarize.Summarize(source, pages, context_tokens=context_tokens)
+    summaries = processor.extract(addresses)
+    return summaries, metrics
+
+
+def bench_context(
+    root=ARTIFACT_ROOT,
+    context_tokens=summarize.CONTEXT_TOKENS,
+    run_llm=False,
+    limit=10,
+):
+    """
+    Prompt text of relevance windows vs whole pages on existing artifacts:
+    tokens per (street, page) and how often a mention was found. With
+    --run_llm the first `limit` documents are summarized again, uncached, from
+    whole pages and from windows. Window summaries are compared with the
+    whole page summaries of the same run (status agreement, tag overlap,
+    summary text similarity), both runs by prompt tokens and latency.
+
+    Usage: python -m benchmarks.bench_context [--context_tokens=600]
+           [--run_llm --limit=10]
+    """
+    windows = found = full_tokens = window_tokens = 0
+    compared = []
+    for source, _ in _artifact_dirs(root):
+        detections = Artifact(source, ADDRESS_NAME)
+        pages = pdf2text.PDF2Text(source)
+        if not detections.exists or not pages.artifact_exists:
+            continue
+
+        pages = pages.load()
+        addresses = {k: AddressDetection(**v) for k, v in detections.read().items()}
+        units = context.paragraphs(pages, context_tokens)
+        for street, detection in addresses.items():
+            for pp in sorted(set(detection.pages)):
+                page_tokens = count_tokens(pages[pp].text)
+                text = context.window(
+                    units, pp, [street], min(context_tokens, page_tokens)
+                )
+                windows += 1
+                found += text is not None
+                full_tokens += page_tokens
+                window_tokens += page_tokens if text is None else count_tokens(text)
+
+        if run_llm and len(compared) < limit:
+            compared.append((source, pages, addresses))
+
+    print(
+        tabulate(
+            [
+                [
+                    windows,
+                    found / max(windows, 1),
+                    full_tokens / max(windows, 1),
+                    window_tokens / max(windows, 1),
+                    full_tokens / max(window_tokens, 1),
+                ]
+            ],
+            headers=[
+                "street pages",
+                "mention found",
+                "page tokens",
+                "window tokens",
+                "reduction",
+            ],
+            floatfmt=".3f",
+        )
+    )
+    if not compared:
+        return
+
+    # uncached, so latencies are of real requests
+    llm.set_cache(False)
+    rows = []
+    for source, pages, addresses in compared:
+        reference, full = _run(source, pages, addresses, None)
+        reference = _summaries_by_page(reference)
+        summaries, metrics = _run(source, pages, addresses, context_tokens)
+        scores = [
+            _agreement(reference[key], summary)
+            for key, summary in _summaries_by_page(summaries).items()
+            if key in reference
+        ]
+        full_latency = full.timings("llm_request")
+        latency = metrics.timings("llm_request")
+        rows.append(
+            [
+                f"{source['doctype']} {source['date']}",
+                len(scores),
+                sum(s[0] for s in scores) / max(len(scores), 1),
+                sum(s[1] for s in scores) / max(len(scores), 1),
+                sum(s[2] for s in scores) / max(len(scores), 1),
+                full.counter("llm_prompt_tokens"),
+                metrics.counter("llm_prompt_tokens"),
+                sum(full_latency) / max(len(full_latency), 1),
+                sum(latency) / max(len(latency), 1),
+            ]
+        )
+
+    print()
+    print(
+        tabulate(
+            rows,
+            headers=[
+                "source",
+                "summaries",
+                "status agree",
+                "tag jaccard",
+                "text sim",
+                "page tokens",
+                "window tokens",
+                "page s/req",
+                "window s/req",
+            ],
+            floatfmt=".3f",
+        )
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(bench_context)
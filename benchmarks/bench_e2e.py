@@ -0,0 +1,397 @@
+import os
+import glob
+import json
+import time
+import random
+import resource
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+import duckdb
+import fire
+import openai
+from tabulate import tabulate
+
+from components import pipeline, streaming
+from components.dbwriter import DBWriter
+from components.metrics import reset_metrics
+from components.munisource.nj_millburn import DOCTYPES, METADATA
+from components.normalize import normalize_street
+from components.processors import pdf2text
+from components.processors.candidates import MILLBURN_STREETS
+from utils.standins import start_nominatim, start_openai
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_ROOT = os.path.join(REPO_ROOT, "benchmarks", "results")
+TABLES = ["source", "address", "source_address_assoc", "summary"]  # fk order
+
+DOCTYPE = "PLANNING"  # must be one of DOCTYPES, other sources are not processed
+STREET_TYPES = ["Road", "Avenue", "Street", "Drive", "Lane", "Place", "Way"]
+FILLER = [
+    "The meeting was called to order at 7:30 PM and the flag salute was led.",
+    "Adequate notice of this meeting was provided to the press as required.",
+    "Roll call was taken and a quorum of the board members was present.",
+    "The minutes of the previous meeting were approved as amended.",
+    "The board discussed the proposed amendments to the master plan.",
+    "Public comment was opened and with no one wishing to speak was closed.",
+    "Correspondence from the county planning board was received and filed.",
+    "The board attorney reviewed the resolution memorializing the decision.",
+]
+LINES_PER_PAGE = 40
+
+# Change of a metric beyond this fraction of its baseline is a regression
+REGRESSION_THRESHOLD = 0.1
+# Metrics compared between runs, True when higher is better
+COMPARED = {
+    "docs_per_min": True,
+    "pages_per_sec.pages": True,
+    "pages_per_sec.addresses": True,
+    "pages_per_sec.summaries": True,
+    "pages_per_sec.coords": True,
+    "db_rows_per_sec": True,
+    "peak_rss_mb": False,
+}
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(filepath, pages):
+    # Minimal pdf with a Helvetica text layer, one line per row
+    # Input: [[line, ...], ...], one list of lines per page
+    n_pages = len(pages)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [{}] /Count {} >>".format(
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(n_pages)), n_pages
+        ),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, lines in enumerate(pages):
+        stream = "BT /F1 10 Tf 14 TL 54 750 Td\n" + "".join(
+            f"({_pdf_escape(line)}) '\n" for line in lines
+        )
+        stream += "ET"
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        objects.append(
+            f"<< /Length {len(stream.encode('latin-1'))} >>\n"
+            f"stream\n{stream}\nendstream"
+        )
+
+    body = b"%PDF-1.4\n"
+    offsets = []
+    for n, obj in enumerate(objects, 1):
+        offsets.append(len(body))
+        body += f"{n} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    body += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode("latin-1")
+
+    with open(filepath, "wb") as f:
+        f.write(body)
+
+
+def synthetic_minutes(rng, n_pages, addresses_per_page):
+    # Returns: ([[line, ...], ...], [address, ...]) pages of minutes with the
+    # addresses that are mentioned on them, about half the pages have none
+    pages = []
+    addresses = []
+    for _ in range(n_pages):
+        lines = [rng.choice(FILLER) for _ in range(LINES_PER_PAGE)]
+        if rng.random() < 0.5:
+            for _ in range(addresses_per_page):
+                address = "{} {} {}".format(
+                    rng.randint(1, 999),
+                    MILLBURN_STREETS[rng.randrange(len(MILLBURN_STREETS))].title(),
+                    rng.choice(STREET_TYPES),
+                )
+                addresses.append(address)
+                at = rng.randrange(LINES_PER_PAGE - 2)
+                lines[at : at + 2] = [
+                    f"Application of {address}, Block {rng.randint(1, 5000)} "
+                    f"Lot {rng.randint(1, 40)}, for a variance.",
+                    f"The application for {address} was approved with conditions.",
+                ]
+        pages.append(lines)
+
+    return pages, addresses
+
+
+def generate_corpus(root, n_docs, n_pages, addresses_per_page, seed=0):
+    # Returns: [(source, [address, ...]), ...]
+    if DOCTYPE not in DOCTYPES:
+        raise ValueError(f"{DOCTYPE} is not one of {DOCTYPES}")
+
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    corpus = []
+    for n in range(n_docs):
+        date = f"2022-{1 + n // 28 % 12:02d}-{1 + n % 28:02d}"
+        filepath = os.path.join(root, f"{DOCTYPE}-{n:04d}-{date}.pdf")
+        pages, addresses = synthetic_minutes(rng, n_pages, addresses_per_page)
+        write_pdf(filepath, pages)
+        source = METADATA | {
+            "filepath": filepath,
+            "doctype": DOCTYPE,
+            "year": "2022",
+            "date": date,
+            "id": str(n),
+            "url": f"http://bench.invalid/{n}",
+        }
+        corpus.append((source, addresses))
+
+    return corpus
+
+
+def _config(nominatim, ocr):
+    return [
+        stage
+        | {
+            "kwargs": stage["kwargs"]
+            | (
+                {"requests_per_second": 1000, "domain": nominatim, "scheme": "http"}
+                if stage["output"] == "coords"
+                else {"use_text_layer": not ocr}
+                if stage["output"] == "pages"
+                else {}
+            )
+        }
+        for stage in pipeline.PIPELINE_CONFIG
+    ]
+
+
+def _create_db(db_filepath):
+    con = duckdb.connect(db_filepath)
+    for table in TABLES:
+        with open(os.path.join(REPO_ROOT, "tables", f"{table}.sql")) as f:
+            con.execute(f.read())
+    con.close()
+
+
+def _peak_rss_mb():
+    # ru_maxrss is kilobytes on linux, children are the ocr worker processes
+    return (
+        max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        )
+        / 1024
+    )
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextlib.contextmanager
+def _workdir(path):
+    # Artifacts, caches and the database are relative to the working directory
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def _flatten(results, prefix=""):
+    flat = dict()
+    for k, v in results.items():
+        if isinstance(v, dict):
+            flat |= _flatten(v, f"{prefix}{k}.")
+        else:
+            flat[f"{prefix}{k}"] = v
+    return flat
+
+
+def _recall(corpus, results):
+    expected = found = 0
+    for (_, addresses), result in zip(corpus, results):
+        detected = {normalize_street(street) for street in result.addresses}
+        known = {normalize_street(address) for address in addresses}
+        expected += len(known)
+        found += len(known & detected)
+    return found / expected if expected else 1.0
+
+
+def run(docs, pages, addresses_per_page, llm_latency, geocode_latency, ocr, stream):
+    # Returns: results dict, every stage cold, in a scratch directory
+    openai_server = start_openai(latency=llm_latency)
+    nominatim_server = start_nominatim(latency=geocode_latency)
+    openai.api_base = f"{openai_server.url}/v1"
+    os.environ.setdefault("OPENAI_KEY", "bench")
+
+    config = _config(nominatim_server.domain, ocr)
+    run_pipeline = streaming.streaming_pipeline if stream else pipeline.pipeline
+    with tempfile.TemporaryDirectory() as tmp, _workdir(tmp):
+        corpus = generate_corpus("sources", docs, pages, addresses_per_page)
+        _create_db(os.path.join(tmp, "bench.db"))
+
+        metrics = reset_metrics()
+        start = time.perf_counter()
+        results = [run_pipeline(source, config) for source, _ in corpus]
+        pipeline_s = time.perf_counter() - start
+
+        reshaped = [pipeline.reshape_to_pipeline_result(r) for r in results]
+        start = time.perf_counter()
+        DBWriter(os.path.join(tmp, "bench.db")).insert_many(reshaped)
+        db_s = time.perf_counter() - start
+
+    openai_server.shutdown()
+    nominatim_server.shutdown()
+
+    n_pages = sum(len(r.pages) for r in results)
+    stage_s = {
+        stage["output"]: sum(metrics.timings("stage", stage=stage["output"]))
+        for stage in config
+    }
+    return {
+        "docs": docs,
+        "pages": n_pages,
+        "wall_s": pipeline_s + db_s,
+        "docs_per_min": docs / (pipeline_s + db_s) * 60,
+        "stage_s": stage_s,
+        "pages_per_sec": {
+            stage: n_pages / seconds if seconds else None
+            for stage, seconds in stage_s.items()
+        },
+        "db_rows": metrics.counter("db_rows"),
+        "db_s": db_s,
+        "db_rows_per_sec": metrics.counter("db_rows") / db_s if db_s else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "llm_requests": metrics.counter("llm_requests"),
+        "geocode_requests": nominatim_server.requests,
+        "address_recall": _recall(corpus, results),
+        "errors": metrics.counter("processor_errors"),
+    }
+
+
+def _latest_result(config, exclude=None):
+    # Most recent saved run with the same benchmark config
+    for path in sorted(glob.glob(os.path.join(RESULTS_ROOT, "e2e-*.json")))[::-1]:
+        if path == exclude:
+            continue
+        with open(path) as f:
+            saved = json.loads(f.read())
+        if saved["config"] == config:
+            return path, saved
+
+    return None, None
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    # Returns: (table rows, [regressed metric, ...])
+    baseline, current = _flatten(baseline), _flatten(current)
+    rows = []
+    regressions = []
+    for metric, higher_is_better in COMPARED.items():
+        before, after = baseline.get(metric), current.get(metric)
+        if not before or after is None:
+            continue
+
+        change = (after - before) / before
+        regressed = (-change if higher_is_better else change) > threshold
+        if regressed:
+            regressions.append(metric)
+        rows.append([metric, before, after, f"{change:+.1%}", "!" if regressed else ""])
+
+    return rows, regressions
+
+
+def bench_e2e(
+    docs=20,
+    pages=12,
+    addresses_per_page=2,
+    llm_latency=0.2,
+    geocode_latency=0.05,
+    ocr=False,
+    stream=False,
+    baseline=None,
+    save=True,
+):
+    """
+    End-to-end throughput on synthetic minutes against local OpenAI and
+    Nominatim stand-ins: pages/sec per stage, docs/min, peak RSS and DuckDB
+    ingest rows/sec. Runs are saved to benchmarks/results and compared with
+    the last run of the same config, or --baseline=<results json>.
+
+    Run every benchmark in a fresh process, peak RSS is per process.
+
+    Usage: python -m benchmarks.bench_e2e [--docs=20] [--pages=12]
+           [--llm_latency=0.2] [--ocr] [--stream]
+    """
+    config = {
+        "docs": docs,
+        "pages": pages,
+        "addresses_per_page": addresses_per_page,
+        "llm_latency": llm_latency,
+        "geocode_latency": geocode_latency,
+        "ocr": ocr,
+        "stream": stream,
+        "ocr_workers": pdf2text.OCR_WORKERS,
+    }
+    results = run(
+        docs, pages, addresses_per_page, llm_latency, geocode_latency, ocr, stream
+    )
+
+    rows = [[k, v] for k, v in _flatten(results).items()]
+    print(tabulate(rows, headers=["metric", "value"], floatfmt=".3f"))
+
+    path = None
+    if save:
+        os.makedirs(RESULTS_ROOT, exist_ok=True)
+        path = os.path.join(RESULTS_ROOT, f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json")
+        with open(path, "w") as f:
+            saved = {
+                "started": str(datetime.now()),
+                "revision": _git_revision(),
+                "config": config,
+                "results": results,
+            }
+            f.write(json.dumps(saved, indent=2))
+        print(f"saved: {path}")
+
+    if baseline:
+        with open(baseline) as f:
+            baseline_path, previous = baseline, json.loads(f.read())
+    else:
+        baseline_path, previous = _latest_result(config, exclude=path)
+
+    if previous is None:
+        print("no baseline run with the same config to compare with")
+        return
+
+    rows, regressions = compare(previous["results"], results)
+    print(f"\nvs {baseline_path} ({previous.get('revision')})")
+    print(
+        tabulate(
+            rows,
+            headers=["metric", "baseline", "current", "change", ""],
+            floatfmt=".3f",
+        )
+    )
+    if regressions:
+        print(f"regressions over {REGRESSION_THRESHOLD:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    fire.Fire(bench_e2e)
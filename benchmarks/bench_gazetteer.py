@@ -0,0 +1,77 @@
+import os
+import csv
+import time
+import random
+import tempfile
+import fire
+from tabulate import tabulate
+
+from components.processors.gazetteer import Gazetteer
+
+STREET_NAMES = ["Main", "Millburn", "Essex", "Glen", "Highland", "Wyoming", "Taylor"]
+SUFFIXES = ["Street", "Avenue", "Road", "Drive", "Lane", "Place", "Terrace"]
+
+
+def _synthetic_points(n_points, seed=0):
+    # Returns: [(street, lat, lon), ...] scattered around Millburn, NJ
+    rng = random.Random(seed)
+    points = dict()
+    while len(points) < n_points:
+        street = (
+            f"{rng.randint(1, 999)} {rng.choice(STREET_NAMES)} "
+            f"{rng.randint(1, n_points // 50 + 1)}th {rng.choice(SUFFIXES)}"
+        )
+        points[street] = (40.72 + rng.random() * 0.05, -74.33 + rng.random() * 0.05)
+
+    return [(street, lat, lon) for street, (lat, lon) in points.items()]
+
+
+def _rate(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    elapsed = time.perf_counter() - start
+    return len(items) / elapsed
+
+
+def bench_gazetteer(n_points=50000, n_queries=5000, seed=0):
+    """
+    Gazetteer load time and lookups/sec on synthetic address points.
+
+    Usage: python -m benchmarks.bench_gazetteer [--n_points=50000]
+    """
+    points = _synthetic_points(n_points, seed=seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "points.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["street", "lat", "lon"])
+            writer.writerows(points)
+
+        start = time.perf_counter()
+        gazetteer = Gazetteer(path)
+        load_s = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    sample = rng.sample(points, min(n_queries, len(points)))
+    exact = [street for street, _, _ in sample]
+    # abbreviated suffixes and dropped letters, as seen in OCR'd minutes
+    noisy = [s.replace("Street", "St.").replace("Avenue", "Ave")[:-1] for s in exact]
+    reverse = [(lat + 1e-5, lon - 1e-5) for _, lat, lon in sample]
+
+    rows = [
+        ["load", f"{len(gazetteer)} points in {load_s:.2f}s"],
+        ["exact lookups/sec", _rate(gazetteer.geocode, exact)],
+        ["noisy lookups/sec", _rate(gazetteer.geocode, noisy[: n_queries // 10])],
+        ["reverse lookups/sec", _rate(lambda p: gazetteer.reverse(*p), reverse)],
+        [
+            "noisy lookup hit rate",
+            sum(gazetteer.geocode(s) is not None for s in noisy[:500])
+            / len(noisy[:500]),
+        ],
+    ]
+    print(tabulate(rows, floatfmt=".1f"))
+
+
+if __name__ == "__main__":
+    fire.Fire(bench_gazetteer)
@@ -0,0 +1,61 @@
+import time
+import difflib
+import fire
+import pytesseract
+from tabulate import tabulate
+from pdf2image import convert_from_path
+
+from components.processors.pdf2text import POPPLER_PATH, _ocr_image
+from components.wordtable import HEADERS, WordTable
+
+
+def _two_pass(image):
+    # Previous behavior: image_to_string and image_to_data on the same image
+    text = pytesseract.image_to_string(image)
+    table = WordTable.from_tesseract(pytesseract.image_to_data(image))
+    return text, HEADERS, table
+
+
+def _timed(fn, image):
+    start = time.perf_counter()
+    result = fn(image)
+    return time.perf_counter() - start, result
+
+
+def bench_ocr(pdf, max_pages=5, poppler_path=POPPLER_PATH):
+    """
+    Per-page OCR time for two tesseract passes vs a single pass.
+
+    Usage: python -m benchmarks.bench_ocr <minutes.pdf> [--max_pages=5]
+    """
+    images = convert_from_path(
+        pdf, poppler_path=poppler_path, first_page=1, last_page=max_pages
+    )
+    rows = []
+    for pp, image in enumerate(images):
+        before_s, (before_text, _, _) = _timed(_two_pass, image)
+        after_s, (after_text, _, _) = _timed(_ocr_image, image)
+        similarity = difflib.SequenceMatcher(None, before_text, after_text).ratio()
+        rows.append([pp, before_s, after_s, before_s / after_s, similarity])
+
+    n = len(rows)
+    rows.append(
+        [
+            "mean",
+            sum(r[1] for r in rows) / n,
+            sum(r[2] for r in rows) / n,
+            sum(r[3] for r in rows) / n,
+            sum(r[4] for r in rows) / n,
+        ]
+    )
+    print(
+        tabulate(
+            rows,
+            headers=["page", "two pass (s)", "single pass (s)", "speedup", "text sim"],
+            floatfmt=".3f",
+        )
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(bench_ocr)
@@ -0,0 +1,86 @@
+import os
+import json
+import fire
+from collections import defaultdict
+from tabulate import tabulate
+
+from components.artifact import ARTIFACT_ROOT, Artifact
+from components.processors import address, pdf2text
+from components.processors.candidates import has_candidates
+
+
+def _artifact_dirs(root):
+    # Yields (source, dirpath) for every source with address and page artifacts
+    for dirpath, _, filenames in os.walk(root):
+        if f"{address.PROCESSOR_NAME}.json" not in filenames:
+            continue
+
+        with open(os.path.join(dirpath, f"{address.PROCESSOR_NAME}.json")) as f:
+            source = json.loads(f.read())["source"]
+        yield source, dirpath
+
+
+def bench_prefilter(root=ARTIFACT_ROOT, show_missed=20):
+    """
+    Recall of the local address candidate filter against existing address.json
+    artifacts, i.e. how many LLM detected addresses would still be found.
+
+    Usage: python -m benchmarks.bench_prefilter [--root=artifacts]
+    """
+    counts = defaultdict(lambda: defaultdict(int))
+    missed = []
+    for source, dirpath in _artifact_dirs(root):
+        processor = pdf2text.PDF2Text(source)
+        if not processor.artifact_exists:
+            continue
+
+        kept = {p.page: has_candidates(p.text) for p in processor.load()}
+        detections = Artifact(source, address.PROCESSOR_NAME).read()
+
+        stats = counts[source["doctype"]]
+        stats["documents"] += 1
+        stats["pages"] += len(kept)
+        stats["skipped pages"] += sum(not k for k in kept.values())
+        for street, detection in detections.items():
+            for alias, page in zip(detection["aliases"], detection["pages"]):
+                stats["addresses"] += 1
+                if kept.get(page):
+                    stats["recalled"] += 1
+                else:
+                    missed.append([source["doctype"], source["date"], page, alias])
+
+    counts["all"] = defaultdict(int)
+    for doctype in list(counts)[:-1]:
+        for k, v in counts[doctype].items():
+            counts["all"][k] += v
+
+    rows = [
+        [
+            doctype,
+            stats["documents"],
+            stats["pages"],
+            stats["skipped pages"] / max(stats["pages"], 1),
+            stats["addresses"],
+            stats["recalled"] / max(stats["addresses"], 1),
+        ]
+        for doctype, stats in counts.items()
+    ]
+
+    print(
+        tabulate(
+            rows,
+            headers=["doctype", "docs", "pages", "skip rate", "addresses", "recall"],
+            floatfmt=".3f",
+        )
+    )
+    if missed and show_missed:
+        print("\nmissed addresses:")
+        print(
+            tabulate(
+                missed[:show_missed], headers=["doctype", "date", "page", "address"]
+            )
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(bench_prefilter)
@@ -0,0 +1,187 @@
+import os
+import json
+import threading
+from collections import defaultdict
+
+from .cache import cache_key
+from .normalize import VERSION, ORDINAL_PATTERN, STREET_SUFFIXES, normalize_street
+
+
+ALIASES_FILEPATH = "address_aliases.json"
+
+_SUFFIXES = set(STREET_SUFFIXES.values())
+
+_index = None
+
+
+def _scope(city, state):
+    return f"{city.lower()}|{state.lower()}"
+
+
+def _alias(street):
+    return " ".join(street.lower().split())
+
+
+def _extends(canonical, street):
+    # canonical is street followed by a suffix, "12 main st" of "12 main"
+    return (
+        canonical.startswith(f"{street} ")
+        and canonical[len(street) + 1 :].split()[0] in _SUFFIXES
+    )
+
+
+class AliasIndex(object):
+    """
+    Persistent index of every street spelling seen to its canonical street,
+    per city. Shared by Address, Geocode and DBWriter so all variants of an
+    address are summarized, geocoded and stored once.
+
+    New spellings resolve to their normalize_street() form, or to the one
+    known street it is a shortened form of ("12 Main" -> "12 main st"), in
+    whichever order they are seen. Entries can be edited in the json file to
+    merge streets by hand.
+    """
+
+    def __init__(self, filepath=ALIASES_FILEPATH):
+        self.filepath = filepath
+        self._lock = threading.RLock()
+        self._aliases = defaultdict(dict)  # scope: {alias: canonical street}
+        self._added = defaultdict(dict)  # entries not saved yet
+        self._revisions = dict()  # scope: revision, dropped on changes
+        self._aliases.update(self._read())
+
+    def __len__(self):
+        return sum(len(aliases) for aliases in self._aliases.values())
+
+    def _read(self):
+        # Returns: {scope: {alias: canonical street}}, canonical streets of an
+        # older normalization are normalized again, merges are kept
+        if not os.path.exists(self.filepath):
+            return {}
+
+        with open(self.filepath, "r") as f:
+            data = json.loads(f.read())
+
+        if data.get("version") == VERSION:
+            return data["aliases"]
+
+        migrated = defaultdict(dict)
+        for scope, aliases in data["aliases"].items():
+            for alias, canonical in aliases.items():
+                first = alias.split()[0] if alias.strip() else ""
+                if data.get("version") == 2 and ORDINAL_PATTERN.fullmatch(first):
+                    # version 2 read ordinal street names as house numbers
+                    canonical = alias
+                migrated[scope][alias] = normalize_street(canonical)
+
+        return migrated
+
+    def _expand(self, aliases, street):
+        # The only known street that street is missing the suffix of
+        words = street.split()
+        if len(words) < 2 or not words[0][0].isdigit() or words[-1] in _SUFFIXES:
+            return street
+
+        matches = {known for known in aliases.values() if _extends(known, street)}
+        return matches.pop() if len(matches) == 1 else street
+
+    def _repoint(self, scope, canonical):
+        # Streets recorded without a suffix that canonical is the only known
+        # suffixed form of resolve to canonical too, as if it had been seen
+        # before them
+        aliases = self._aliases[scope]
+        words = canonical.split()
+        for i in range(2, len(words)):
+            street = " ".join(words[:i])
+            if words[i] not in _SUFFIXES or self._expand(aliases, street) != canonical:
+                continue
+
+            for alias, known in aliases.items():
+                if known == street:
+                    aliases[alias] = self._added[scope][alias] = canonical
+
+    def resolve(self, street, city, state):
+        # Returns: canonical street of a spelling, recorded on first sight
+        scope = _scope(city, state)
+        alias = _alias(street)
+        with self._lock:
+            aliases = self._aliases[scope]
+            if alias in aliases:
+                return aliases[alias]
+
+            normalized = normalize_street(street)
+            canonical = aliases.get(normalized) or self._expand(aliases, normalized)
+            new = canonical not in aliases.values()
+            for key in (alias, normalized):
+                if key not in aliases:
+                    aliases[key] = self._added[scope][key] = canonical
+            if new:
+                self._repoint(scope, canonical)
+            self._revisions.pop(scope, None)
+
+            return canonical
+
+    def merge(self, street, into, city, state):
+        # Resolve street, and every spelling of it, to the canonical street of
+        # into from now on
+        scope = _scope(city, state)
+        with self._lock:
+            source = self.resolve(street, city, state)
+            target = self.resolve(into, city, state)
+            aliases = self._aliases[scope]
+            for alias, canonical in aliases.items():
+                if canonical == source:
+                    aliases[alias] = self._added[scope][alias] = target
+            self._revisions.pop(scope, None)
+
+    def revision(self, city, state):
+        # Hash of the city's entries normalization and suffix expansion do not
+        # derive, i.e. merges. Part of the version of the stages that resolve
+        # streets, so merging streets recomputes them
+        scope = _scope(city, state)
+        with self._lock:
+            if scope not in self._revisions:
+                self._revisions[scope] = cache_key(
+                    sorted(
+                        (alias, canonical)
+                        for alias, canonical in self._aliases[scope].items()
+                        if canonical != normalize_street(alias)
+                        and not _extends(canonical, normalize_street(alias))
+                    )
+                )
+
+            return self._revisions[scope]
+
+    def save(self):
+        # Write new entries, merged with the ones other processes saved since
+        # this index was read
+        with self._lock:
+            if not any(self._added.values()):
+                return
+
+            aliases = defaultdict(dict, self._read())
+            for scope, added in self._added.items():
+                aliases[scope].update(added)
+            self._aliases = aliases
+            self._revisions = dict()
+
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+            tmp_path = f"{self.filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(json.dumps({"version": VERSION, "aliases": aliases}, indent=1))
+            os.replace(tmp_path, self.filepath)
+            self._added = defaultdict(dict)
+
+
+def get_alias_index():
+    # Alias index of this process, shared by every stage
+    global _index
+    if _index is None:
+        _index = AliasIndex()
+
+    return _index
+
+
+def set_alias_index(index):
+    global _index
+    _index = index
@@ -1,16 +1,33 @@
 import os
 import json
+import hashlib
+import zipfile
+import functools
+import numpy as np
 from datetime import datetime
 
+from .wordtable import DTYPE, HEADERS, TEXT_COLUMN, WordTable
+
 
 ARTIFACT_ROOT = "artifacts"
 
 
+def file_hash(filepath, chunk_size=1024**2):
+    h = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
 class Artifact(object):
     """
     Class for interacting with json processing artifacts.
     """
 
+    extension = "json"
+
     def __init__(self, source, document_processor_name, root=ARTIFACT_ROOT):
         self.source = source
         self.document_processor_name = document_processor_name
@@ -30,7 +47,7 @@ class Artifact(object):
         )
         os.makedirs(self._artifact_dir, exist_ok=True)
         self._filepath = os.path.join(
-            self._artifact_dir, f"{self.document_processor_name}.json"
+            self._artifact_dir, f"{self.document_processor_name}.{self.extension}"
         )
 
     @property
@@ -41,7 +58,13 @@ class Artifact(object):
     def exists(self):
         return os.path.exists(self._filepath)
 
-    def write(self, data, overwrite=False):
+    @property
+    def fingerprint(self):
+        # Fingerprint of the inputs the artifact was computed from, None for
+        # artifacts written before fingerprints were recorded
+        return self.read(metadata=True).get("fingerprint")
+
+    def write(self, data, overwrite=False, fingerprint=None, **metadata):
         if not overwrite and self.exists:
             return self._filepath
 
@@ -52,7 +75,9 @@ class Artifact(object):
                         "data": data,
                         "timestamp": str(datetime.now()),
                         "source": self.source,
+                        "fingerprint": fingerprint,
                     }
+                    | metadata
                 )
             )
 
@@ -68,4 +93,138 @@ class Artifact(object):
         return data
 
     def delete(self):
-        os.path.delete(self._filepath)
+        os.remove(self._filepath)
+
+
+class _ColumnReader(object):
+    # Reads every word table column of a columnar artifact on first use
+    def __init__(self, filepath, headers, pages):
+        self._filepath = filepath
+        self._headers = headers
+        self._n_rows = pages[-1]["rows"][1] if pages else 0
+        self._columns = None
+
+    def _read(self):
+        values = np.zeros(self._n_rows, DTYPE)
+        with zipfile.ZipFile(self._filepath) as z:
+            offsets = np.frombuffer(z.read("columns/text.offsets"), "<i8")
+            text = z.read("columns/text.utf8").decode("utf-8")
+            for column in self._headers:
+                if column != TEXT_COLUMN:
+                    values[column] = np.frombuffer(
+                        z.read(f"columns/{column}"), DTYPE[column]
+                    )
+
+        return values, text, offsets
+
+    def page(self, start, end):
+        # Returns: (values, text, offsets) of rows [start, end)
+        if self._columns is None:
+            self._columns = self._read()
+
+        values, text, offsets = self._columns
+        return (
+            values[start:end],
+            text[offsets[start] : offsets[end]],
+            offsets[start : end + 1] - offsets[start],
+        )
+
+
+class ColumnarArtifact(Artifact):
+    """
+    Class for interacting with columnar pdf2text artifacts.
+
+    A zip of meta.json (source, fingerprint, page text and headers) and one
+    little endian array per word table column (WordTable layout), so page
+    text loads without parsing the word tables and tables are only read when
+    accessed.
+    """
+
+    extension = "zip"
+
+    def _read_meta(self):
+        with zipfile.ZipFile(self._filepath) as z:
+            return json.loads(z.read("meta.json"))
+
+    @property
+    def fingerprint(self):
+        return self._read_meta().get("fingerprint")
+
+    def write(self, pages, overwrite=False, fingerprint=None, timestamp=None):
+        # Input: [TextPage, ...]
+        if not overwrite and self.exists:
+            return self._filepath
+
+        tables = [page.table for page in pages]
+        values = np.concatenate([t.values for t in tables] + [np.empty(0, DTYPE)])
+        buffers = [t.text_buffer for t in tables]
+        offsets = np.concatenate(
+            [np.zeros(1, np.int64)]
+            + [
+                page_offsets[1:] + start
+                for (_, page_offsets), start in zip(
+                    buffers, np.cumsum([0] + [len(text) for text, _ in buffers])
+                )
+            ]
+        ).astype("<i8")
+
+        meta_pages = []
+        n_rows = 0
+        for page in pages:
+            meta_pages.append(
+                {
+                    "page": page.page,
+                    "text": page.text,
+                    "method": page.method,
+                    "headers": page.headers,
+                    "rows": [n_rows, n_rows + len(page.table)],
+                }
+            )
+            n_rows += len(page.table)
+
+        meta = {
+            "timestamp": timestamp or str(datetime.now()),
+            "source": self.source,
+            "fingerprint": fingerprint,
+            "headers": HEADERS,
+            "pages": meta_pages,
+        }
+
+        # write then rename so readers never see a partial artifact
+        tmp_path = f"{self._filepath}.tmp"
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr("meta.json", json.dumps(meta))
+            for column in DTYPE.names:
+                z.writestr(f"columns/{column}", values[column].tobytes())
+            z.writestr(
+                "columns/text.utf8", "".join(t for t, _ in buffers).encode("utf-8")
+            )
+            z.writestr("columns/text.offsets", offsets.tobytes())
+        os.replace(tmp_path, self._filepath)
+
+        return self._filepath
+
+    def read(self, metadata=False):
+        # Returns: [{page, text, method, headers, table, source}, ...] with
+        # lazily loaded WordTables, and the source dict shared by every page
+        meta = self._read_meta()
+        reader = _ColumnReader(self._filepath, meta["headers"], meta["pages"])
+        data = [
+            {
+                "page": p["page"],
+                "text": p["text"],
+                "headers": p["headers"],
+                "table": WordTable.lazy(
+                    functools.partial(reader.page, *p["rows"]),
+                    p["rows"][1] - p["rows"][0],
+                ),
+                "source": meta["source"],
+                "method": p["method"],
+            }
+            for p in meta["pages"]
+        ]
+
+        if not metadata:
+            return data
+
+        return meta | {"data": data}
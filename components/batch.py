@@ -0,0 +1,126 @@
+import os
+import json
+import threading
+from datetime import datetime
+from tqdm import tqdm
+
+from . import pipeline
+from .processors import llm
+
+
+BATCH_ROOT = "batches"
+ENDPOINT = "/v1/chat/completions"
+
+# Stages that send chat completion requests
+LLM_STAGES = ["addresses", "summaries"]
+
+
+class BatchJob(object):
+    """
+    Chat completion requests collected instead of sent, written as JSONL in
+    the OpenAI batch input format. The custom_id of every request is its
+    response cache key, so the same prompt is only asked once and responses
+    can be ingested in any order.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = dict()
+        self.deferred = 0
+
+    def __len__(self):
+        return len(self._requests)
+
+    def add(self, key, model, messages, temperature, max_tokens):
+        with self._lock:
+            self.deferred += 1
+            self._requests[key] = {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for key, body in self._requests.items():
+                line = {"custom_id": key, "method": "POST", "url": ENDPOINT}
+                f.write(json.dumps(line | {"body": body}) + "\n")
+
+        return path
+
+
+def job_path(stage, root=BATCH_ROOT):
+    return os.path.join(root, f"{stage}-{datetime.now():%Y%m%d-%H%M%S}.jsonl")
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def ingest_responses(path):
+    # Store the responses of a batch output file in the llm response cache,
+    # where the stages find them on their next run
+    # Input:   JSONL of {"custom_id": key, "response": {"status_code": 200,
+    #          "body": chat completion}, "error": ...}
+    # Returns: {"stored": n, "failed": n}
+    cache = llm.get_cache()
+    if cache is None:
+        raise ValueError("batch responses are ingested into the response cache")
+
+    counts = {"stored": 0, "failed": 0}
+    for line in read_jsonl(path):
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code") != 200:
+            counts["failed"] += 1
+            continue
+
+        cache.put(line["custom_id"], response["body"])
+        counts["stored"] += 1
+
+    return counts
+
+
+def config_through(stage, config=pipeline.PIPELINE_CONFIG):
+    # Pipeline config up to and including the stage with output stage
+    outputs = [s["output"] for s in config]
+    return config[: outputs.index(stage) + 1]
+
+
+def run(sources, stage, job, manifest=None, config=pipeline.PIPELINE_CONFIG):
+    """
+    Run sources through stage with every request missing from the response
+    cache added to job instead of sent.
+
+    Sources with all their responses cached get their artifacts written as
+    usual, the others stop at the first stage with deferred requests and
+    write nothing for it.
+    Returns: {"done": n, "deferred": n, "failed": n}
+    """
+    if stage not in LLM_STAGES:
+        raise ValueError(f"{stage} sends no llm requests, one of {LLM_STAGES}")
+
+    config = config_through(stage, config)
+    counts = {"done": 0, "deferred": 0, "failed": 0}
+    llm.set_batch_job(job)
+    try:
+        for source in tqdm(sources, desc=f"Batching {stage}..."):
+            try:
+                result = pipeline.pipeline(source, config)
+            except llm.Deferred:
+                counts["deferred"] += 1
+                continue
+            except Exception as err:
+                print(f"{source['filepath']}: {type(err).__name__}: {err}")
+                counts["failed"] += 1
+                continue
+
+            if manifest is not None:
+                manifest.record_result(result)
+            counts["done"] += 1
+    finally:
+        llm.set_batch_job(None)
+
+    return counts
@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import threading
+
+from .metrics import get_metrics
+
+CACHE_ROOT = "cache"
+MAX_BYTES = 512 * 1024**2
+
+
+def cache_key(*parts):
+    # Content address for json serializable parts
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class DiskCache(object):
+    """
+    Size bounded on-disk cache of json values with least recently used eviction.
+
+    Entries are files named by key, their mtime marks the last use.
+    """
+
+    def __init__(self, name, root=CACHE_ROOT, max_bytes=MAX_BYTES):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._dir = os.path.join(root, name)
+        self._lock = threading.Lock()
+        self._size = None
+        os.makedirs(self._dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self._dir, key[:2], f"{key}.json")
+
+    def _entries(self):
+        # Returns: [(mtime, size, path), ...]
+        entries = []
+        for dirpath, _, filenames in os.walk(self._dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        return entries
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+
+        return self._size
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self.size,
+        }
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                value = json.loads(f.read())
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            with self._lock:
+                self.misses += 1
+            get_metrics().count("cache_misses", cache=self.name)
+            return default
+
+        with self._lock:
+            self.hits += 1
+        get_metrics().count("cache_hits", cache=self.name)
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value)
+
+        # write then rename so concurrent readers never see partial entries
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._size = self.size + len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries down to 90% of max_bytes
+        entries = sorted(self._entries())
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= 0.9 * self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                os.remove(path)
+            self._size = 0
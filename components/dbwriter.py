@@ -1,106 +1,218 @@
+import time
 import duckdb
 import uuid
 from datetime import datetime
 
+from .aliases import get_alias_index
+from .metrics import get_metrics
+
 
 DB_FILEPATH = "property_activity.db"
 
 
-Q_GET = """SELECT id
+# Set based lookup, keys are compared as text without quotes: rows written
+# before quotes were kept in user text have them stripped
+Q_GET_MANY = """SELECT id, {columns}
 FROM {table}
-WHERE {filters}
+WHERE list_contains(?, replace({first_column}::VARCHAR, '''', ''))
+"""
+
+# Existing addresses get the coords they are missing. Their aliases are left
+# as is, duckdb rewrites list updates as a delete and insert, which the
+# foreign keys of referenced rows reject. The alias index keeps every spelling
+Q_FILL_COORDS = """UPDATE address
+SET lat = ?, lon = ?
+WHERE id = ? AND lat IS NULL
 """
 
+INSERT_BATCH_SIZE = 1000  # rows per multi-row INSERT statement
 
-def _fmt_row(row):
-    return ",".join(
-        [f"'{uuid.uuid4()}'::UUID", f"'{datetime.now()}'"]
-        + [f"'{c}'" if isinstance(c, str) and c != "NULL" else str(c) for c in row]
-    )
+KEY_COLUMNS = {
+    "source": ["url", "local_path"],
+    "address": ["street", "city"],
+    "source_address_assoc": ["source_id", "address_id"],
+    "summary": ["source_id", "address_id", "status", "page", "summary"],
+}
+
+
+def _match_key(key):
+    # Key as compared with the keys of existing rows
+    return tuple(v.replace("'", "") if isinstance(v, str) else v for v in key)
 
 
 class DBWriter(object):
     def __init__(self, db_filepath=DB_FILEPATH):
         self._con = duckdb.connect(db_filepath)
+        self._aliases = get_alias_index()
 
-    def _get_or_create(self, table, filtrows, row):
-        filters = " AND ".join([f"{k}='{v}'" for k, v in filtrows.items()])
-        record_id = self._con.sql(Q_GET.format(table=table, filters=filters)).fetchone()
-        if not record_id:
-            self._con.sql(f"INSERT INTO {table} VALUES ({_fmt_row(row)})")
-            record_id = self._con.sql(
-                Q_GET.format(table=table, filters=filters)
-            ).fetchone()
+    def _street(self, street, source):
+        # Canonical street, one address row for every spelling of it
+        return self._aliases.resolve(street, source["city"], source["state"])
 
-        return record_id[0]
+    def _get_or_create_many(self, table, rows, created):
+        # Input:   {key: [column, ...], ...}, key holds KEY_COLUMNS[table] as text
+        # Returns: {key: id, ...}
+        if not rows:
+            return {}
 
-    def insert(self, source, parsed_street):
-        # Source
-        row = [
-            source["doctype"],
-            source["url"],
-            source["date"],
-            source["filepath"],
-            source["municipal"],
-            source["city"],
-            source["state"],
-        ]
-        filtrows = {
-            "url": source["url"],
-            "local_path": source["filepath"],
+        columns = KEY_COLUMNS[table]
+        existing = {
+            _match_key(record[1:]): record[0]
+            for record in self._con.execute(
+                Q_GET_MANY.format(
+                    table=table,
+                    columns=", ".join(f"{c}::VARCHAR" for c in columns),
+                    first_column=columns[0],
+                ),
+                [sorted(set(_match_key(key)[0] for key in rows))],
+            ).fetchall()
         }
-        source_id = self._get_or_create("source", filtrows, row)
-
-        # Address
-        row = [
-            parsed_street.street.replace("'", ""),
-            parsed_street.coords.lat if parsed_street.coords else "NULL",
-            parsed_street.coords.lon if parsed_street.coords else "NULL",
-            [a.replace("'", "") for a in parsed_street.addresses.aliases],
-            source["city"],
-            source["state"],
-        ]
-        filtrows = {
-            "street": parsed_street.street.replace("'", ""),
-            "city": source["city"],
+        ids = {
+            key: existing[_match_key(key)]
+            for key in rows
+            if _match_key(key) in existing
         }
-        address_id = self._get_or_create("address", filtrows, row)
+        new = {key: uuid.uuid4() for key in rows if key not in ids}
+
+        values = [[str(new[key]), created] + rows[key] for key in new]
+        get_metrics().count("db_rows", len(values), table=table)
+        for start in range(0, len(values), INSERT_BATCH_SIZE):
+            batch = values[start : start + INSERT_BATCH_SIZE]
+            placeholders = f"({', '.join(['?'] * len(batch[0]))})"
+            self._con.execute(
+                f"INSERT INTO {table} VALUES {', '.join([placeholders] * len(batch))}",
+                [v for row in batch for v in row],
+            )
 
-        # Association
-        row = [
-            str(source_id),
-            str(address_id),
+        return ids | new
+
+    def _fill_coords(self, rows, ids):
+        # Input: address rows and their ids, as passed to and returned by
+        #        _get_or_create_many
+        values = [
+            [row[1], row[2], str(ids[key])]
+            for key, row in rows.items()
+            if row[1] is not None
         ]
-        filtrows = {
-            "source_id": source_id,
-            "address_id": address_id,
-        }
-        association_id = self._get_or_create("source_address_assoc", filtrows, row)
-
-        # Summaries
-        summary_ids = []
-        for summary in parsed_street.summaries:
-            row = [
-                str(source_id),
-                str(address_id),
-                summary.status,
-                summary.page,
-                summary.summary.replace("'", ""),
-                summary.tags,
-            ]
-            filtrows = {
+        if values:
+            self._con.executemany(Q_FILL_COORDS, values)
+
+    def insert(self, source, parsed_street):
+        # Single parsed street, stored the same way as by insert_many
+        return self._insert([(source, [parsed_street])])[0]
+
+    def insert_many(self, results):
+        # Bulk insert of PipelineResults: one lookup and a few batched,
+        # parameterized inserts per table, values are never formatted into sql
+        # Input:  [PipelineResult, ...]
+        # Return: [{"source_id": ..., ...} per parsed street, ...]
+        return self._insert([(result.source, result.parsed) for result in results])
+
+    def _insert(self, results):
+        # Input:  [(source, [ParsedStreet, ...]), ...]
+        # Return: [{"source_id": ..., ...} per parsed street, ...]
+        start = time.perf_counter()
+        created = datetime.now()
+        self._con.begin()
+        try:
+            # Source
+            rows = dict()
+            for source, _ in results:
+                rows[(source["url"], source["filepath"])] = [
+                    source["doctype"],
+                    source["url"],
+                    source["date"],
+                    source["filepath"],
+                    source["municipal"],
+                    source["city"],
+                    source["state"],
+                ]
+            source_ids = self._get_or_create_many("source", rows, created)
+
+            # Address, aliases and coords are merged across results, existing
+            # addresses get missing coords
+            rows = dict()
+            for source, parsed_streets in results:
+                for parsed in parsed_streets:
+                    street = self._street(parsed.street, source)
+                    key = (street, source["city"])
+                    if key not in rows:
+                        rows[key] = [
+                            street,
+                            None,
+                            None,
+                            [],
+                            source["city"],
+                            source["state"],
+                        ]
+                    row = rows[key]
+                    if parsed.coords and row[1] is None:
+                        row[1], row[2] = parsed.coords.lat, parsed.coords.lon
+                    row[3] += [a for a in parsed.addresses.aliases if a not in row[3]]
+            address_ids = self._get_or_create_many("address", rows, created)
+            self._fill_coords(rows, address_ids)
+
+            # Association
+            rows = dict()
+            for source, parsed_streets in results:
+                source_id = source_ids[(source["url"], source["filepath"])]
+                for parsed in parsed_streets:
+                    address_id = address_ids[
+                        (self._street(parsed.street, source), source["city"])
+                    ]
+                    rows[(str(source_id), str(address_id))] = [
+                        str(source_id),
+                        str(address_id),
+                    ]
+            association_ids = self._get_or_create_many(
+                "source_address_assoc", rows, created
+            )
+
+            # Summaries
+            rows = dict()
+            inserted = []
+            for source, parsed_streets in results:
+                source_id = source_ids[(source["url"], source["filepath"])]
+                for parsed in parsed_streets:
+                    address_id = address_ids[
+                        (self._street(parsed.street, source), source["city"])
+                    ]
+                    summary_keys = []
+                    for summary in parsed.summaries:
+                        key = (
+                            str(source_id),
+                            str(address_id),
+                            summary.status,
+                            str(summary.page),
+                            summary.summary,
+                        )
+                        rows[key] = [
+                            str(source_id),
+                            str(address_id),
+                            summary.status,
+                            summary.page,
+                            summary.summary,
+                            summary.tags,
+                        ]
+                        summary_keys.append(key)
+                    inserted.append((source_id, address_id, summary_keys))
+            summary_ids = self._get_or_create_many("summary", rows, created)
+
+            self._con.commit()
+        except:
+            self._con.rollback()
+            raise
+
+        self._aliases.save()
+
+        get_metrics().observe("db_insert", time.perf_counter() - start)
+
+        return [
+            {
                 "source_id": source_id,
                 "address_id": address_id,
-                "status": summary.status,
-                "page": summary.page,
-                "summary": summary.summary.replace("'", ""),
+                "association_id": association_ids[(str(source_id), str(address_id))],
+                "summary_ids": [summary_ids[key] for key in summary_keys],
             }
-            summary_id = self._get_or_create("summary", filtrows, row)
-            summary_ids.append(summary_id)
-
-        return {
-            "source_id": source_id,
-            "address_id": address_id,
-            "association_id": association_id,
-            "summary_ids": summary_ids,
-        }
+            for source_id, address_id, summary_keys in inserted
+        ]
@@ -0,0 +1,207 @@
+import os
+import json
+import duckdb
+from datetime import datetime
+
+from .source import SOURCE_ROOT
+from .artifact import file_hash
+
+
+MANIFEST_FILEPATH = os.path.join(SOURCE_ROOT, "manifest.db")
+
+# Pipeline stage outputs and the final database write
+STAGES = ["pages", "addresses", "summaries", "coords", "db"]
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+Q_CREATE = """CREATE TABLE IF NOT EXISTS manifest (
+    filepath       VARCHAR PRIMARY KEY,
+    doctype        VARCHAR NOT NULL,
+    year           VARCHAR NOT NULL,
+    record_date    VARCHAR NOT NULL,
+    doc_id         VARCHAR,
+    url            VARCHAR,
+    source         VARCHAR NOT NULL, -- json of the source dict
+    sha256         VARCHAR NOT NULL,
+    size           BIGINT NOT NULL,
+    n_pages        INTEGER,
+    updated        TIMESTAMP NOT NULL,
+    {stage_columns}
+);
+"""
+
+Q_INSERT = """INSERT INTO manifest
+    (filepath, doctype, year, record_date, doc_id, url, source, sha256, size, updated)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+Q_SOURCES = """SELECT source, sha256, {columns}
+FROM manifest
+WHERE list_contains(?, doctype)
+    AND list_contains(?, year)
+ORDER BY doctype, record_date
+"""
+
+
+def _stage_columns():
+    return ",\n    ".join(
+        f"{stage}_status VARCHAR, {stage}_updated TIMESTAMP, {stage}_fingerprint VARCHAR"
+        for stage in STAGES
+    )
+
+
+def _check_stage(stage):
+    if stage not in STAGES:
+        raise ValueError(f"unknown stage {stage}, one of {STAGES}")
+
+
+class Manifest(object):
+    """
+    Index of downloaded sources with their content hash and how far each one
+    got through the pipeline, so pending work is one query instead of a scan
+    of the sources tree.
+    """
+
+    def __init__(self, db_filepath=MANIFEST_FILEPATH):
+        os.makedirs(os.path.dirname(db_filepath) or ".", exist_ok=True)
+        self._con = duckdb.connect(db_filepath)
+        self._con.execute(Q_CREATE.format(stage_columns=_stage_columns()))
+
+    def __len__(self):
+        return self._con.execute("SELECT count(*) FROM manifest").fetchone()[0]
+
+    def add(self, source, rehash=True):
+        # Insert or update a downloaded source, a changed file hash resets
+        # every stage. Without rehash sources already indexed are left as is
+        # Input: source dict as returned by get_sources
+        recorded = self._con.execute(
+            "SELECT sha256 FROM manifest WHERE filepath = ?", [source["filepath"]]
+        ).fetchone()
+        if recorded and not rehash:
+            return
+
+        sha256 = file_hash(source["filepath"])
+        if recorded and recorded[0] == sha256:
+            self._con.execute(
+                "UPDATE manifest SET url = ?, source = ? WHERE filepath = ?",
+                [source.get("url"), json.dumps(source), source["filepath"]],
+            )
+            return
+
+        # changed files are replaced by a fresh row, with every stage pending
+        self._con.execute(
+            "DELETE FROM manifest WHERE filepath = ?", [source["filepath"]]
+        )
+        self._con.execute(
+            Q_INSERT,
+            [
+                source["filepath"],
+                source["doctype"],
+                source["year"],
+                source["date"],
+                source.get("id"),
+                source.get("url"),
+                json.dumps(source),
+                sha256,
+                os.path.getsize(source["filepath"]),
+                datetime.now(),
+            ],
+        )
+
+    def backfill(self, sources):
+        # Index sources downloaded before the manifest existed
+        for source in sources:
+            self.add(source, rehash=False)
+
+    def record_stage(
+        self, source, stage, status=STATUS_DONE, fingerprint=None, n_pages=None
+    ):
+        _check_stage(stage)
+        if stage != "db" and fingerprint is not None:
+            # recomputed with other inputs, the database has the old output
+            self._con.execute(
+                f"""UPDATE manifest SET db_status = NULL
+WHERE filepath = ? AND {stage}_fingerprint IS DISTINCT FROM ?""",
+                [source["filepath"], fingerprint],
+            )
+
+        self._con.execute(
+            f"""UPDATE manifest
+SET {stage}_status = ?, {stage}_updated = ?, {stage}_fingerprint = ?,
+    n_pages = coalesce(?, n_pages)
+WHERE filepath = ?""",
+            [status, datetime.now(), fingerprint, n_pages, source["filepath"]],
+        )
+
+    def record_result(self, result):
+        # Every stage output of a PipelineStageResults as done
+        for stage, fingerprint in result.fingerprints.items():
+            if stage in STAGES:
+                self.record_stage(
+                    result.source,
+                    stage,
+                    STATUS_DONE,
+                    fingerprint,
+                    n_pages=len(result.pages) if stage == "pages" else None,
+                )
+
+    def sources(self, doctypes, years, pending_stage=None, fingerprints=None):
+        """
+        Sources as returned by get_sources. With pending_stage only the ones
+        not yet done with that stage, or, given fingerprints, done from inputs
+        that changed since: a stage up to pending_stage whose recorded
+        fingerprint differs from the current one is pending again.
+
+        fingerprints: function(source, sha256) -> {stage: fingerprint, ...},
+                      e.g. pipeline.expected_fingerprints
+        """
+        stages = STAGES
+        if pending_stage is not None:
+            _check_stage(pending_stage)
+            stages = STAGES[: STAGES.index(pending_stage) + 1]
+
+        rows = self._con.execute(
+            Q_SOURCES.format(
+                columns=", ".join(
+                    [f"{pending_stage or 'db'}_status"]
+                    + [f"{stage}_fingerprint" for stage in stages]
+                )
+            ),
+            [list(doctypes), list(years)],
+        ).fetchall()
+
+        sources = []
+        for source, sha256, status, *recorded in rows:
+            source = json.loads(source)
+            if pending_stage is not None and status == STATUS_DONE:
+                if fingerprints is None:
+                    continue
+
+                current = fingerprints(source, sha256)
+                if all(
+                    current.get(stage, fingerprint) == fingerprint
+                    for stage, fingerprint in zip(stages, recorded)
+                ):
+                    continue
+
+            sources.append(source)
+
+        return sources
+
+    def pending(self, doctypes, years, stage="db", fingerprints=None):
+        return self.sources(
+            doctypes, years, pending_stage=stage, fingerprints=fingerprints
+        )
+
+    def status(self):
+        # Returns: {stage: {status: count, ...}, ...}
+        return {
+            stage: dict(
+                self._con.execute(
+                    f"SELECT coalesce({stage}_status, 'pending'), count(*) "
+                    f"FROM manifest GROUP BY 1"
+                ).fetchall()
+            )
+            for stage in STAGES
+        }
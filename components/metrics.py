@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import threading
+import contextlib
+from datetime import datetime
+from collections import defaultdict
+from tabulate import tabulate
+
+
+METRICS_ROOT = "metrics"
+PREFIX = "muni"  # prometheus metric name prefix
+QUANTILES = (0.5, 0.9, 0.99)
+
+_metrics = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _quantile(values, q):
+    # Nearest rank on sorted values
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _prometheus_labels(labels, **extra):
+    labels = list(labels) + list(extra.items())
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics(object):
+    """
+    Counters and timings of a run, labeled like prometheus metrics.
+
+    Thread safe. Worker processes take a snapshot() of their own metrics and
+    the parent merge()s it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._timings = defaultdict(list)
+        self.started = datetime.now()
+
+    def count(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        with self._lock:
+            self._timings[_key(name, labels)].append(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        # Records wall seconds as name and the calling thread's cpu seconds
+        # as name_cpu, cpu of worker processes is not included
+        start, start_cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+            self.observe(f"{name}_cpu", time.thread_time() - start_cpu, **labels)
+
+    def counter(self, name, **labels):
+        # Sum of a counter over every label set matching labels
+        with self._lock:
+            return sum(
+                value
+                for (n, key_labels), value in self._counters.items()
+                if n == name and set(labels.items()) <= set(key_labels)
+            )
+
+    def timings(self, name, **labels):
+        with self._lock:
+            return [
+                seconds
+                for (n, key_labels), values in self._timings.items()
+                if n == name and set(labels.items()) <= set(key_labels)
+                for seconds in values
+            ]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": list(self._counters.items()),
+                "timings": list(self._timings.items()),
+            }
+
+    def merge(self, snapshot):
+        with self._lock:
+            for key, value in snapshot["counters"]:
+                self._counters[key] += value
+            for key, values in snapshot["timings"]:
+                self._timings[key] += values
+
+    def to_dict(self):
+        def _name(name, labels):
+            return name + _prometheus_labels(labels)
+
+        with self._lock:
+            timings = dict()
+            for (name, labels), values in sorted(self._timings.items()):
+                values = sorted(values)
+                timings[_name(name, labels)] = {
+                    "count": len(values),
+                    "sum": sum(values),
+                    "max": values[-1],
+                } | {f"p{int(q * 100)}": _quantile(values, q) for q in QUANTILES}
+
+            return {
+                "started": str(self.started),
+                "counters": {
+                    _name(name, labels): value
+                    for (name, labels), value in sorted(self._counters.items())
+                },
+                "timings": timings,
+            }
+
+    def to_prometheus(self):
+        # Text exposition format, counters as counters and timings as summaries
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timings = sorted(self._timings.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_prometheus_labels(labels)} {value}")
+
+        for (name, labels), values in timings:
+            metric = f"{PREFIX}_{name}_seconds"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            values = sorted(values)
+            for q in QUANTILES:
+                lines.append(
+                    f"{metric}{_prometheus_labels(labels, quantile=q)} "
+                    f"{_quantile(values, q)}"
+                )
+            lines.append(f"{metric}_sum{_prometheus_labels(labels)} {sum(values)}")
+            lines.append(f"{metric}_count{_prometheus_labels(labels)} {len(values)}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, root=METRICS_ROOT):
+        # Returns: (json path, prometheus path) of this run's export
+        os.makedirs(root, exist_ok=True)
+        name = f"run-{self.started:%Y%m%d-%H%M%S}"
+        json_path = os.path.join(root, f"{name}.json")
+        with open(json_path, "w") as f:
+            f.write(json.dumps(self.to_dict(), indent=2))
+
+        prometheus_path = os.path.join(root, f"{name}.prom")
+        with open(prometheus_path, "w") as f:
+            f.write(self.to_prometheus())
+
+        return json_path, prometheus_path
+
+    def report(self):
+        # Stages ranked by wall time, with per page cost and the llm, cache,
+        # geocode and db totals
+        stages = sorted(
+            {
+                dict(labels)["stage"]
+                for (name, labels) in list(self._timings)
+                if name == "stage"
+            }
+        )
+        n_pages = self.counter("pages") or 0
+        rows = []
+        for stage in stages:
+            wall = sum(self.timings("stage", stage=stage))
+            cpu = sum(self.timings("stage_cpu", stage=stage))
+            rows.append(
+                [
+                    stage,
+                    len(self.timings("stage", stage=stage)),
+                    wall,
+                    cpu,
+                    wall / n_pages if n_pages else 0.0,
+                    self.counter("stage_loaded", stage=stage),
+                    self.counter("processor_errors", stage=stage),
+                ]
+            )
+        rows.sort(key=lambda row: row[2], reverse=True)
+        total = sum(row[2] for row in rows)
+        rows = [row[:3] + [row[2] / total if total else 0.0] + row[3:] for row in rows]
+
+        stage_table = tabulate(
+            rows,
+            headers=[
+                "stage",
+                "runs",
+                "wall s",
+                "share",
+                "cpu s",
+                "wall s/page",
+                "loaded",
+                "errors",
+            ],
+            floatfmt=".3f",
+        )
+
+        lines = [stage_table, ""]
+        ocr = sorted(self.timings("ocr_page"))
+        if ocr:
+            lines.append(
+                f"ocr: {len(ocr)} pages, p50 {_quantile(ocr, 0.5):.2f}s/page, "
+                f"p90 {_quantile(ocr, 0.9):.2f}s/page"
+            )
+
+        llm = sorted(self.timings("llm_request"))
+        lines.append(
+            f"llm: {int(self.counter('llm_requests'))} requests, "
+            f"{int(self.counter('llm_prompt_tokens'))} prompt + "
+            f"{int(self.counter('llm_completion_tokens'))} completion tokens, "
+            f"{int(self.counter('llm_retries'))} retries"
+            + (
+                f", p50 {_quantile(llm, 0.5):.2f}s p90 {_quantile(llm, 0.9):.2f}s "
+                f"p99 {_quantile(llm, 0.99):.2f}s"
+                if llm
+                else ""
+            )
+        )
+
+        caches = sorted(
+            {
+                dict(labels)["cache"]
+                for (name, labels) in list(self._counters)
+                if name in ("cache_hits", "cache_misses")
+            }
+        )
+        for cache in caches:
+            hits = self.counter("cache_hits", cache=cache)
+            lookups = hits + self.counter("cache_misses", cache=cache)
+            lines.append(f"{cache} cache: {hits / lookups:.1%} of {int(lookups)} hits")
+
+        geocode = sorted(self.timings("geocode_request"))
+        if geocode:
+            lines.append(
+                f"geocode: {len(geocode)} lookups, p50 {_quantile(geocode, 0.5):.2f}s"
+            )
+
+        lines.append(f"db: {int(self.counter('db_rows'))} rows written")
+        return "\n".join(lines)
+
+
+def get_metrics():
+    # Metrics of the current run, shared by every stage of this process
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+
+    return _metrics
+
+
+def reset_metrics():
+    # Start a new run, e.g. in worker processes before their first task
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
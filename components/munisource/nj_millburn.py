@@ -1,20 +1,33 @@
 import os
+import re
 import json
 from datetime import datetime
 from tabulate import tabulate
 import time
+import requests
 import contextlib
 import urllib.parse
-from collections import defaultdict
+from html.parser import HTMLParser
+from tqdm import tqdm
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 
-from ..source import Source
+from ..source import DOWNLOADED, EMPTY, Source, http_session
+from ..manifest import Manifest
 
 
 DOCUMENTS_INDEX_URL = "https://twp.millburn.nj.us/agendacenter"
 DOCUMENTS_ROOT = "https://twp.millburn.nj.us"
 
+# CivicPlus AgendaCenter endpoint the year links call to list a section's
+# documents, on the index url's host
+CATEGORY_LIST_PATH = "/AgendaCenter/UpdateCategoryList"
+YEAR_LINK_ONCLICK = re.compile(r"changeYear\(\s*(\d{4})\s*,\s*(\d+)")
+HTTP_WORKERS = 8
+HTTP_TIMEOUT = 30
+
 METADATA = {
     "city": "Millburn",
     "municipal": "Millburn Township",
@@ -64,6 +77,12 @@ DOCTYPES = [
     "ZONING",
 ]  # doctypes we actually want to process later
 YEARS_TO_PROCESS = [str(y) for y in range(2013, 2024)][::-1]
+# Years a delta crawl revisits, older years' minutes no longer change. Two so
+# that minutes of last december's meetings approved in january are picked up
+MUTABLE_YEARS = YEARS_TO_PROCESS[:2]
+
+CHANGE_NEW = "new"
+CHANGE_CHANGED = "changed"
 
 
 def get_sources(doctype, year):
@@ -86,6 +105,15 @@ def get_sources(doctype, year):
     return sources
 
 
+def _source_dict(source, doc):
+    # Same as the get_sources entry of the document once downloaded
+    return (
+        METADATA
+        | doc
+        | {"filepath": source.source_path(doc["date"]), "doctype": source.doctype}
+    )
+
+
 def year_table_to_doctype(label):
     for doctype, hints in PAGE_SECTIONS.items():
         if hints["keyword"].lower() in label.lower():
@@ -113,6 +141,50 @@ def minutes_docid_to_date_YYYYMMDD(doc_id):
     return f"{d[4:]}-{d[:2]}-{d[2:4]}"
 
 
+class _LinkParser(HTMLParser):
+    """
+    Collects (attrs, text) of every <a> and the text of every element with an
+    id, enough to read the agenda center's year links and document rows.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self.texts = dict()
+        self._open = []  # [(tag, id or None, [text, ...]), ...]
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a":
+            self.links.append((attrs, []))
+        if tag == "a" or "id" in attrs:
+            self._open.append(
+                (tag, attrs.get("id"), self.links[-1][1] if tag == "a" else [])
+            )
+
+    def handle_endtag(self, tag):
+        for ii in range(len(self._open) - 1, -1, -1):
+            if self._open[ii][0] == tag:
+                _, element_id, text = self._open.pop(ii)
+                if element_id:
+                    self.texts[element_id] = " ".join("".join(text).split())
+                break
+
+    def handle_data(self, data):
+        for _, _, text in self._open:
+            text.append(data)
+
+    @classmethod
+    def parse(cls, html):
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        parser.links = [
+            (attrs, " ".join("".join(text).split())) for attrs, text in parser.links
+        ]
+        return parser
+
+
 @contextlib.contextmanager
 def webdriver_session(url, wait_time=10):
     driver = webdriver.Chrome()
@@ -131,14 +203,34 @@ class NJMillburnCrawler(object):
         self._documents_index_url = documents_index_url
         self._minutes = None
         self._validation = None
+        self._changes = None
 
         self._crawlfile = None
         self._validationfile = None
+        self._changesfile = None
 
     @property
     def minutes(self):
         return self._minutes
 
+    @property
+    def changes(self):
+        # [doc | {"doctype": ..., "change": CHANGE_NEW or CHANGE_CHANGED}, ...]
+        # of a delta crawl, None for full crawls
+        return self._changes
+
+    @staticmethod
+    def latest():
+        # Returns: timestamp of the most recent saved crawl, or None
+        source = Source(METADATA["state_abbrv"], METADATA["city"], "crawler", "all")
+        prefix, suffix = "nj-millburn-crawl-", ".json"
+        timestamps = [
+            f[len(prefix) : -len(suffix)]
+            for f in os.listdir(source.source_dir)
+            if f.startswith(prefix) and f.endswith(suffix)
+        ]
+        return max(timestamps, default=None)
+
     def save(self, overwrite=False):
         source = Source(METADATA["state_abbrv"], METADATA["city"], "crawler", "all")
 
@@ -154,6 +246,12 @@ class NJMillburnCrawler(object):
         with open(validationpath, "w") as f:
             f.write(self._validation)
 
+        if self._changes is not None:
+            self._changesfile = f"nj-millburn-changes-{timestamp}.json"
+            changespath = os.path.join(source.source_dir, self._changesfile)
+            with open(changespath, "w") as f:
+                f.write(json.dumps(self._changes))
+
         return timestamp
 
     def load(self, timestamp):
@@ -169,6 +267,59 @@ class NJMillburnCrawler(object):
         with open(validationpath, "r") as f:
             self._validation = f.read()
 
+        self._changes = None
+        self._changesfile = f"nj-millburn-changes-{timestamp}.json"
+        changespath = os.path.join(source.source_dir, self._changesfile)
+        if os.path.exists(changespath):
+            with open(changespath, "r") as f:
+                self._changes = json.loads(f.read())
+
+    def crawl_delta(self, timestamp=None, years=MUTABLE_YEARS, verbose=True):
+        """
+        Recrawl only `years` and merge them into a saved crawl, the latest one
+        by default. Documents that are not in the saved crawl or whose entry
+        differs are listed in `changes`. Without a saved crawl every year is
+        crawled and every document is new.
+        """
+        timestamp = timestamp or self.latest()
+        previous = dict()
+        if timestamp is not None:
+            self.load(timestamp)
+            previous = self._minutes
+        else:
+            years = YEARS_TO_PROCESS
+
+        crawled = self.crawl(verbose=False, years=years)
+
+        self._changes = []
+        self._minutes = {
+            doctype: dict(by_year) for doctype, by_year in previous.items()
+        }
+        # years that could not be listed are not in crawled and keep their
+        # saved documents
+        for doctype, by_year in crawled.items():
+            for year, docs in by_year.items():
+                known = {d["id"]: d for d in previous.get(doctype, {}).get(year, [])}
+                for doc in docs:
+                    if doc["id"] not in known:
+                        change = CHANGE_NEW
+                    elif doc != known[doc["id"]]:
+                        change = CHANGE_CHANGED
+                    else:
+                        continue
+                    self._changes.append(doc | {"doctype": doctype, "change": change})
+
+                self._minutes.setdefault(doctype, {})[year] = docs
+
+        self._validation = NJMillburnCrawler.show_minutes_table(
+            YEARS_TO_PROCESS, self._minutes
+        )
+        if verbose:
+            print(self._validation)
+            print(f"{len(self._changes)} new or changed documents in {years}")
+
+        return self._changes
+
     def _year_table_index(self, driver):
         year_table = defaultdict(list)
         all_links = driver.find_elements(By.TAG_NAME, "a")
@@ -266,9 +417,9 @@ class NJMillburnCrawler(object):
 
         return minutes
 
-    def crawl(self, verbose=True):
+    def crawl(self, verbose=True, years=YEARS_TO_PROCESS):
         self._minutes = defaultdict(dict)
-        for year in YEARS_TO_PROCESS:
+        for year in years:
             if verbose:
                 print(f"Finding documents for the year: {year}")
 
@@ -326,13 +477,122 @@ class NJMillburnCrawler(object):
         return table
 
 
+class NJMillburnHTTPCrawler(NJMillburnCrawler):
+    """
+    Build a fresh index of all municipal documents urls from the agenda
+    center's http endpoints, no browser needed.
+
+    The index page lists every section's year links (including the ones behind
+    "View More"), each year's documents are then requested concurrently from
+    the endpoint those links call.
+    """
+
+    def __init__(
+        self,
+        documents_index_url=DOCUMENTS_INDEX_URL,
+        n_workers=HTTP_WORKERS,
+        session=None,
+    ):
+        super().__init__(documents_index_url)
+        self._n_workers = n_workers
+        self._session = session or http_session(pool_size=n_workers)
+
+    def _year_categories(self):
+        # Returns: {doctype: {year: category id, ...}, ...}
+        r = self._session.get(self._documents_index_url, timeout=HTTP_TIMEOUT)
+        r.raise_for_status()
+
+        table = defaultdict(dict)
+        for attrs, _ in _LinkParser.parse(r.text).links:
+            label = (attrs.get("aria-label") or "").lower()
+            match = YEAR_LINK_ONCLICK.search(attrs.get("onclick") or "")
+            doctype = year_table_to_doctype(label)
+            if match and doctype:
+                year, category_id = match.groups()
+                table[doctype][year] = category_id
+
+        return table
+
+    def _get_minutes(self, doctype, year, category_id):
+        # Returns: [{"id": ..., "label": ..., ...}, ...] minutes of one section
+        # and year, in the format of NJMillburnCrawler
+        try:
+            r = self._session.post(
+                urllib.parse.urljoin(self._documents_index_url, CATEGORY_LIST_PATH),
+                data={
+                    "year": year,
+                    "catID": category_id,
+                    "startDate": "",
+                    "endDate": "",
+                    "term": "",
+                    "prevVersionScreen": "false",
+                },
+                timeout=HTTP_TIMEOUT,
+            )
+            r.raise_for_status()
+        except requests.RequestException as err:
+            print(f"Unable to list {doctype}, {year} documents")
+            print(err)
+            return []
+
+        parser = _LinkParser.parse(r.text)
+        minutes = dict()
+        for attrs, _ in parser.links:
+            url = attrs.get("href") or ""
+            # skip the html renderings of the same pdfs, e.g. ?html=true
+            if "minutes" not in url.lower() or "?" in url:
+                continue
+
+            doc_id = url.split("/")[-1][1:]
+            if doc_id in minutes or minutes_docid_to_year(doc_id) != year:
+                continue
+
+            minutes[doc_id] = {
+                "id": doc_id,
+                "label": parser.texts.get(doc_id, PAGE_SECTIONS[doctype]["section"]),
+                "year": year,
+                "date": minutes_docid_to_date_YYYYMMDD(doc_id),
+                "url": urllib.parse.urljoin(self._documents_index_url, url),
+            }
+
+        return list(minutes.values())
+
+    def crawl(self, verbose=True, years=YEARS_TO_PROCESS):
+        categories = self._year_categories()
+        jobs = [
+            (doctype, year, categories[doctype][year])
+            for year in years
+            for doctype in PAGE_SECTIONS
+            if year in categories[doctype]
+        ]
+        if verbose:
+            print(f"Finding documents for {len(jobs)} sections and years")
+
+        with ThreadPoolExecutor(max_workers=self._n_workers) as executor:
+            results = list(executor.map(lambda job: self._get_minutes(*job), jobs))
+
+        self._minutes = defaultdict(dict)
+        for (doctype, year, _), minutes in zip(jobs, results):
+            if minutes:
+                self._minutes[doctype][year] = minutes
+
+        self._validation = NJMillburnCrawler.show_minutes_table(
+            YEARS_TO_PROCESS, self._minutes
+        )
+        if verbose:
+            print(self._validation)
+
+        return self._minutes
+
+
 class NJMillburnDownloader(object):
     """
     Download missing pdfs and metadata artifacts.
     """
 
-    def __init__(self, crawl_timestamp):
+    def __init__(self, crawl_timestamp, changes_only=False):
         self.crawl_timestamp = crawl_timestamp
+        self.changes_only = changes_only
         self._crawler = None
 
         self._init()
@@ -341,19 +601,82 @@ class NJMillburnDownloader(object):
         self._crawler = NJMillburnCrawler()
         self._crawler.load(self.crawl_timestamp)
 
-    def download(self, overwrite=False):
+    def _documents(self):
+        # Returns: [(Source, doc, change or None), ...] every document of the
+        # crawl, or only its new and changed ones with changes_only. A full
+        # crawl has no change list, all of its documents are new
+        documents = []
+        if self.changes_only and self._crawler.changes is not None:
+            for change in self._crawler.changes:
+                if change["doctype"] not in DOCTYPES:
+                    continue
+
+                source = Source(
+                    METADATA["state_abbrv"],
+                    METADATA["city"],
+                    change["doctype"],
+                    change["year"],
+                )
+                doc = {
+                    k: v for k, v in change.items() if k not in ("doctype", "change")
+                }
+                documents.append((source, doc, change["change"]))
+
+            return documents
+
         for doctype in DOCTYPES:
-            for year, docs in self._crawler.minutes[doctype].items():
+            for year, docs in self._crawler.minutes.get(doctype, {}).items():
                 source = Source(
                     METADATA["state_abbrv"],
                     METADATA["city"],
                     doctype,
                     year,
                 )
-                for doc in docs:
-                    source.write(
-                        doc["date"],
-                        doc["url"],
-                        METADATA | doc,
-                        overwrite=overwrite,
+                documents += [(source, doc, None) for doc in docs]
+
+        return documents
+
+    def download(
+        self, overwrite=False, refresh=False, n_workers=HTTP_WORKERS, manifest=None
+    ):
+        # refresh: re-check existing pdfs with conditional requests
+        # Returns: {outcome: count, ...}
+        documents = self._documents()
+        session = http_session(pool_size=n_workers)
+        manifest = Manifest() if manifest is None else manifest
+        outcomes = Counter()
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            futures = {
+                executor.submit(
+                    source.fetch,
+                    doc["date"],
+                    doc["url"],
+                    METADATA | doc,
+                    # the entry of a changed document may point to a new pdf
+                    overwrite=overwrite or change == CHANGE_CHANGED,
+                    refresh=refresh,
+                    session=session,
+                ): (source, doc)
+                for source, doc, change in documents
+            }
+            for future in tqdm(
+                as_completed(futures), total=len(futures), desc="Downloading..."
+            ):
+                source, doc = futures[future]
+                try:
+                    outcome = future.result()
+                except (requests.RequestException, OSError) as err:
+                    # partial downloads are resumed on the next run
+                    print(f"Unable to download {doc['url']}")
+                    print(err)
+                    outcomes["failed"] += 1
+                    continue
+
+                outcomes[outcome] += 1
+                if outcome != EMPTY:
+                    # only new content is rehashed
+                    manifest.add(
+                        _source_dict(source, doc), rehash=outcome == DOWNLOADED
                     )
+
+        return dict(outcomes)
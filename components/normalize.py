@@ -0,0 +1,149 @@
+import re
+
+
+# Bump when normalize_street changes, part of the Address version and the
+# alias index
+VERSION = 3
+
+# USPS Publication 28 suffix abbreviations, common variants included
+STREET_SUFFIXES = {
+    "street": "st",
+    "str": "st",
+    "st": "st",
+    "avenue": "ave",
+    "av": "ave",
+    "ave": "ave",
+    "road": "rd",
+    "rd": "rd",
+    "drive": "dr",
+    "drv": "dr",
+    "dr": "dr",
+    "lane": "ln",
+    "ln": "ln",
+    "place": "pl",
+    "pl": "pl",
+    "terrace": "ter",
+    "terr": "ter",
+    "ter": "ter",
+    "court": "ct",
+    "crt": "ct",
+    "ct": "ct",
+    "boulevard": "blvd",
+    "blvd": "blvd",
+    "parkway": "pkwy",
+    "pkwy": "pkwy",
+    "circle": "cir",
+    "cir": "cir",
+    "highway": "hwy",
+    "hwy": "hwy",
+    "square": "sq",
+    "sq": "sq",
+    "plaza": "plz",
+    "plz": "plz",
+    "trail": "trl",
+    "trl": "trl",
+    "way": "way",
+    "path": "path",
+}
+
+DIRECTIONALS = {
+    "north": "n",
+    "south": "s",
+    "east": "e",
+    "west": "w",
+    "northeast": "ne",
+    "northwest": "nw",
+    "southeast": "se",
+    "southwest": "sw",
+    "n": "n",
+    "s": "s",
+    "e": "e",
+    "w": "w",
+    "ne": "ne",
+    "nw": "nw",
+    "se": "se",
+    "sw": "sw",
+}
+
+# Secondary unit designators, dropped with the unit number that follows them
+UNIT_PATTERN = re.compile(
+    r"\s*(?:#|\b(?:unit|apt|apartment|suite|ste|fl|floor|bldg|building|rm|room)\b)"
+    r"\.?\s*#?\s*[\w-]*\s*$"
+)
+
+# House number ranges: "12 - 14", "12 & 14", "12 thru 14", "12 to 14"
+RANGE_PATTERN = re.compile(
+    r"^(\d+[a-z]?)\s*(?:-|&|and|thru|through|to)\s*(\d+[a-z]?)\b"
+)
+
+# Characters OCR reads instead of digits, fixed inside house numbers
+OCR_DIGITS = str.maketrans({"o": "0", "l": "1", "i": "1", "s": "5"})
+
+# Numbered street names, never house numbers: "1st ave", "21st street"
+ORDINAL_PATTERN = re.compile(r"\d+(?:st|nd|rd|th)")
+
+HOUSE_NUMBER_PATTERN = re.compile(r"\d+[a-z]?(?:-\d+[a-z]?)?")
+
+
+def _has_house_number(words):
+    # A first word followed by the street name that is not an ordinal
+    return len(words) > 1 and not ORDINAL_PATTERN.fullmatch(words[0])
+
+
+def _fix_house_number(word):
+    # "1O2" -> "102", "l2a" -> "12a", words without a digit are left alone
+    match = re.fullmatch(r"([\dolis]*\d[\dolis]*)([a-z]?)", word)
+    if not match:
+        return word
+
+    return match.group(1).translate(OCR_DIGITS) + match.group(2)
+
+
+def normalize_street(street):
+    """
+    Canonical form of a street address, e.g. "12 Main Street.",
+    "12 MAIN ST, Block 3 Lot 4" and "l2 Main St. Unit 2" -> "12 main st".
+
+    Drops everything after a comma and secondary units, cleans OCR noise,
+    normalizes house number ranges ("12 - 14" -> "12-14") and abbreviates
+    suffixes and directionals the USPS way. Words after the street suffix,
+    e.g. a trailing town or zip code, are dropped.
+    """
+    street = street.split(",")[0].lower()
+    street = re.sub(r"[|_*~`'\"“”‘’»«]", "", street)
+    street = re.sub(r"[^\w\s#&-]", " ", street)
+    street = re.sub(r"\s+", " ", street).strip()
+    street = UNIT_PATTERN.sub("", street)
+
+    words = street.split()
+    if _has_house_number(words):
+        words[0] = _fix_house_number(words[0])
+    street = RANGE_PATTERN.sub(r"\1-\2", " ".join(words))
+
+    words = [w for w in street.split() if w not in ("-", "&")]
+    # first street name word
+    name = (
+        1
+        if _has_house_number(words) and HOUSE_NUMBER_PATTERN.fullmatch(words[0])
+        else 0
+    )
+    normalized = []
+    for i, word in enumerate(words):
+        following = words[i + 1] if i + 1 < len(words) else None
+        if i > name and word in STREET_SUFFIXES:
+            normalized.append(STREET_SUFFIXES[word])
+            # a post directional is the only word kept after the suffix
+            if following in DIRECTIONALS:
+                normalized.append(DIRECTIONALS[following])
+            break
+
+        if i == name and word in DIRECTIONALS and following not in STREET_SUFFIXES:
+            # pre directional, unless it is the street's whole name
+            word = DIRECTIONALS[word] if following else word
+        normalized.append(word)
+
+    return " ".join(normalized)
+
+
+def location_key(street, city, state):
+    return "|".join([normalize_street(street), city.lower(), state.lower()])
@@ -1,11 +1,17 @@
 import pprint
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from components.processors.pdf2text import PDF2Text, TextPage
 from components.processors.address import Address, AddressDetection
 from components.processors.summarize import Summarize, Summary
 from components.processors.geocode import Geocode, Coord
+from components.processors.gazetteer import GazetteerGeocode
+from components.processors import llm
 from components.dbwriter import DBWriter
+from components.artifact import file_hash
+from components.cache import cache_key
+from components.manifest import STATUS_DONE, STATUS_FAILED
+from components.metrics import get_metrics
 
 
 PIPELINE_CONFIG = [
@@ -13,6 +19,7 @@ PIPELINE_CONFIG = [
         "processor": PDF2Text,
         "args": ["source"],
         "extract_args": [],
+        "kwargs": {},
         "output": "pages",
         "load_from_cache": True,
     },
@@ -20,6 +27,7 @@ PIPELINE_CONFIG = [
         "processor": Address,
         "args": ["source"],
         "extract_args": ["pages"],
+        "kwargs": {},
         "output": "addresses",
         "load_from_cache": True,
     },
@@ -27,6 +35,7 @@ PIPELINE_CONFIG = [
         "processor": Summarize,
         "args": ["source", "pages"],
         "extract_args": ["addresses"],
+        "kwargs": {},
         "output": "summaries",
         "load_from_cache": True,
     },
@@ -34,11 +43,51 @@ PIPELINE_CONFIG = [
         "processor": Geocode,
         "args": ["source"],
         "extract_args": ["summaries"],
+        "kwargs": {},
         "output": "coords",
         "load_from_cache": True,
     },
 ]
 
+# Reuse artifacts written before fingerprints were recorded instead of
+# recomputing the whole corpus
+TRUST_UNFINGERPRINTED = True
+
+GEOCODE_BACKENDS = {
+    "nominatim": Geocode,
+    "gazetteer": GazetteerGeocode,  # kwargs: gazetteer_path, columns
+}
+
+
+def with_geocoder(config, backend, **kwargs):
+    # Copy of config with the geocode stage swapped, e.g.
+    # with_geocoder(PIPELINE_CONFIG, "gazetteer", gazetteer_path="points.csv")
+    if backend not in GEOCODE_BACKENDS:
+        raise ValueError(f"unknown geocoder {backend}, one of {list(GEOCODE_BACKENDS)}")
+
+    return [
+        stage | {"processor": GEOCODE_BACKENDS[backend], "kwargs": kwargs}
+        if issubclass(stage["processor"], Geocode)
+        else stage
+        for stage in config
+    ]
+
+
+class StageIncomplete(Exception):
+    # Raised instead of saving a stage output that misses the results of
+    # failed requests, the next run extracts it again
+    pass
+
+
+def geocoder_config(geocoder="nominatim", gazetteer_path=None, config=PIPELINE_CONFIG):
+    # Pipeline config of the --geocoder and --gazetteer_path options, the same
+    # config has to be used for running and for the manifest's fingerprints
+    if geocoder == "gazetteer" and not gazetteer_path:
+        raise ValueError("the gazetteer geocoder needs a gazetteer_path")
+
+    kwargs = {"gazetteer_path": gazetteer_path} if geocoder == "gazetteer" else {}
+    return with_geocoder(config, geocoder, **kwargs)
+
 
 @dataclass
 class ParsedStreet:
@@ -62,27 +111,119 @@ class PipelineStageResults:
     addresses: dict[AddressDetection]  # key is street
     summaries: dict[list[Summary]]  # key is "street"
     coords: dict[Coord]  # key is "street"
+    fingerprints: dict = field(default_factory=dict)  # key is "source" or output
 
 
-def pipeline(source, config=PIPELINE_CONFIG, verbose=False):
-    result = PipelineStageResults(source, [], [], {}, {})
+def stage_fingerprint(stage, processor, result):
+    # Hash of the processor version and the fingerprints of every input: the
+    # source file and upstream stage outputs, so changes propagate downstream
+    if "source" not in result.fingerprints:
+        result.fingerprints["source"] = file_hash(result.source["filepath"])
+
+    inputs = sorted(
+        k for k in stage["args"] + stage["extract_args"] if k in result.fingerprints
+    )
+    return cache_key(processor.version, [(k, result.fingerprints[k]) for k in inputs])
+
+
+def _is_fresh(processor, fingerprint):
+    if not processor.artifact_exists:
+        return False
+
+    recorded = processor.artifact_fingerprint
+    if recorded is None:
+        return TRUST_UNFINGERPRINTED
+
+    return recorded == fingerprint
+
+
+def expected_fingerprints(source, sha256, config=PIPELINE_CONFIG):
+    # Fingerprints run_stage would record for every stage of source now,
+    # without running any. sha256 is the hash of the source file
+    # Returns: {output: fingerprint, ...}
+    result = PipelineStageResults(source, [], {}, {}, {}, {"source": sha256})
     for stage in config:
-        args = tuple(
-            getattr(result, k) if k in dir(result) else k for k in stage["args"]
+        processor = _processor(stage, result)
+        result.fingerprints[stage["output"]] = stage_fingerprint(
+            stage, processor, result
         )
-        extract_args = tuple(
-            getattr(result, k) if k in dir(result) else k for k in stage["extract_args"]
-        )
-        processor = stage["processor"](*args)
-        if processor.artifact_exists and stage["load_from_cache"]:
+
+    return {k: v for k, v in result.fingerprints.items() if k != "source"}
+
+
+def _processor(stage, result):
+    args = tuple(getattr(result, k) if k in dir(result) else k for k in stage["args"])
+    return stage["processor"](*args, **stage.get("kwargs", {}))
+
+
+def run_stage(stage, result):
+    # Load or extract one stage's output into result, artifacts are only
+    # reused when their recorded fingerprint matches the current inputs
+    extract_args = tuple(
+        getattr(result, k) if k in dir(result) else k for k in stage["extract_args"]
+    )
+    processor = _processor(stage, result)
+    fingerprint = stage_fingerprint(stage, processor, result)
+    metrics = get_metrics()
+    with metrics.timer("stage", stage=stage["output"]):
+        if stage["load_from_cache"] and _is_fresh(processor, fingerprint):
             setattr(result, stage["output"], processor.load())
+            metrics.count("stage_loaded", stage=stage["output"])
         else:
+            deferred = llm.deferred_count()
             setattr(result, stage["output"], processor.extract(*extract_args))
-            processor.save(overwrite=True)
+            if llm.deferred_count() > deferred:
+                # incomplete until the batch job's responses are ingested
+                raise llm.Deferred(f"{stage['output']} has requests in a batch job")
+            if not processor.complete:
+                record_stage_metrics(stage, processor, result)
+                raise StageIncomplete(_incomplete_message(stage, processor))
+            processor.save(overwrite=True, fingerprint=fingerprint)
+
+    record_stage_metrics(stage, processor, result)
+    result.fingerprints[stage["output"]] = fingerprint
+    return processor
+
+
+def _incomplete_message(stage, processor):
+    failed = [e for e in processor.errors if e in processor.transient_errors]
+    return f"{stage['output']} has {len(failed)} failed requests: {failed[0]}"
+
+
+def record_stage_metrics(stage, processor, result):
+    metrics = get_metrics()
+    for error in processor.errors:
+        metrics.count("processor_errors", stage=stage["output"], error=error)
+
+    if stage["output"] == "pages":
+        metrics.count("pages", len(result.pages))
+
+
+def pipeline(source, config=PIPELINE_CONFIG, verbose=False, manifest=None):
+    result = PipelineStageResults(source, [], [], {}, {})
+    for stage in config:
+        try:
+            processor = run_stage(stage, result)
+        except Exception:
+            if manifest is not None:
+                manifest.record_stage(source, stage["output"], STATUS_FAILED)
+            raise
+
+        if manifest is not None:
+            manifest.record_stage(
+                source,
+                stage["output"],
+                STATUS_DONE,
+                result.fingerprints[stage["output"]],
+                n_pages=len(result.pages) if stage["output"] == "pages" else None,
+            )
 
         if not isinstance(processor, PDF2Text) and verbose:
             pprint.pprint(getattr(result, stage["output"]))
 
+        if getattr(processor, "usage", None) and verbose:
+            print(f"{stage['output']} token usage: {processor.usage}")
+
     return result
 
 
@@ -115,10 +256,14 @@ def print_pipeline_results(result):
         print("\n\n")
 
 
-def persist(source, result):
-    ids = []
-    writer = DBWriter()
-    for parsed in result.parsed:
-        ids.append(writer.insert(result.source, parsed))
+def persist(source, result, manifest=None):
+    return persist_many([result], manifest=manifest)
+
+
+def persist_many(results, manifest=None):
+    ids = DBWriter().insert_many(results)
+    if manifest is not None:
+        for result in results:
+            manifest.record_stage(result.source, "db", STATUS_DONE)
 
     return ids
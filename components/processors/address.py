@@ -1,16 +1,25 @@
 import os
+import re
+import queue
 import openai
 import json
+import threading
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, asdict
 
-from . import get_openai_key
+from . import get_openai_key, llm, candidates
 from .base import DocumentProcessor
+from .tokens import count_tokens
 from .pdf2text import TextPage
 from ..artifact import Artifact
+from ..aliases import get_alias_index
+from ..cache import cache_key
+from .. import normalize
 
 
 PROCESSOR_NAME = "address"
+VERSION = 1
 
 SYSTEM_NUDGE = (
     "You are a helpful document parsing tool that only responds in json objects."
@@ -28,8 +37,26 @@ Rules:
 3. If you cannot find addresses return None (and no other text or information)
 
 Document: {text}"""
+PACKED_PROMPT = """Find property addresses in the document pages for which there is a memorialization.
+Each page starts with a line like "=== PAGE <page number> ===".
+Return the addresses and the number of the page they are on as a json object like:
+
+    {{
+        "addresses": [{{"address": <insert address 0>, "page": <insert page number>}}, ...],
+    }}
+
+Rules:
+1. Process each property address independently
+2. Think step by step for each property
+3. If you cannot find addresses return None (and no other text or information)
+
+Document: {text}"""
+PAGE_MARKER = "=== PAGE {page} ==="
 MAX_TOKENS = 1500
 TEMPERATURE = 0
+CONCURRENCY = 8  # requests in flight, 1 runs requests serially
+TOKEN_BUDGET = 2000  # prompt tokens per request when packing pages, None: 1 page
+PREFILTER = True  # only send pages with local address candidates to the LLM
 
 GPT_FALSE_ADDRESS_FILTER = [
     "none",
@@ -48,11 +75,24 @@ class AddressDetection:
 
 
 class Address(DocumentProcessor):
-    def __init__(self, source):
+    transient_errors = ("API_ERROR",)
+
+    def __init__(
+        self,
+        source,
+        concurrency=CONCURRENCY,
+        token_budget=TOKEN_BUDGET,
+        prefilter=PREFILTER,
+    ):
         self._source = source
+        self._concurrency = concurrency
+        self._token_budget = token_budget
+        self._prefilter = prefilter
+        self._usage = None
         self._errors = []
         self._addresses = None
         self._artifact = Artifact(source, PROCESSOR_NAME)
+        self._aliases = get_alias_index()
 
         openai.api_key = get_openai_key()
 
@@ -64,14 +104,41 @@ class Address(DocumentProcessor):
     def result(self):
         return self._addresses
 
+    @property
+    def usage(self):
+        # {"requests": ..., "prompt_tokens": ..., "completion_tokens": ...}
+        return self._usage
+
     @property
     def artifact_exists(self):
         return self._artifact.exists
 
+    @property
+    def version(self):
+        return cache_key(
+            PROCESSOR_NAME,
+            VERSION,
+            llm.MODEL,
+            SYSTEM_NUDGE,
+            PROMPT,
+            TEMPERATURE,
+            MAX_TOKENS,
+            GPT_FALSE_ADDRESS_FILTER,
+            [PACKED_PROMPT, PAGE_MARKER, self._token_budget]
+            if self._token_budget
+            else None,
+            candidates.VERSION if self._prefilter else None,
+            normalize.VERSION,
+            self._aliases.revision(self._source["city"], self._source["state"]),
+        )
+
     def _merge(self, addresses):
         merged = dict()
+        # spellings of the same street are merged under its canonical street
         for address in addresses:
-            street = address["address"].split(",")[0].lower()
+            street = self._aliases.resolve(
+                address["address"], self._source["city"], self._source["state"]
+            )
 
             if street not in merged:
                 merged[street] = AddressDetection(
@@ -89,30 +156,178 @@ class Address(DocumentProcessor):
             a for a in addresses if a["address"].lower() not in GPT_FALSE_ADDRESS_FILTER
         ]
 
-    def _extract_from_text(self, pages):
-        addresses = []
-        for page in tqdm(pages, desc=f"Addresses from {len(pages)} pages..."):
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": SYSTEM_NUDGE,
-                    },
-                    {"role": "user", "content": PROMPT.format(text=page.text)},
-                ],
-                temperature=TEMPERATURE,
-                max_tokens=MAX_TOKENS,
+    def _prefiltered(self, pages):
+        # Yields the pages worth sending to the model, counts skipped pages
+        for page in pages:
+            if not self._prefilter or candidates.has_candidates(page.text):
+                yield page
+            else:
+                self._usage["skipped_pages"] += 1
+
+    def _iter_pack(self, pages):
+        # Group consecutive pages into requests of at most token_budget prompt
+        # tokens, pages over budget are sent alone. A group is yielded as soon
+        # as the next page does not fit
+        # Yields: [TextPage, ...]
+        if not self._token_budget:
+            for page in pages:
+                yield [page]
+            return
+
+        overhead = count_tokens(SYSTEM_NUDGE + PACKED_PROMPT)
+        group = []
+        n_tokens = 0
+        for page in pages:
+            page_tokens = count_tokens(page.text) + count_tokens(
+                PAGE_MARKER.format(page=page.page)
             )
-            result = response["choices"][0]["message"]["content"]
+            if group and overhead + n_tokens + page_tokens <= self._token_budget:
+                group.append(page)
+                n_tokens += page_tokens
+            else:
+                if group:
+                    yield group
+                group = [page]
+                n_tokens = page_tokens
+
+        if group:
+            yield group
 
-            try:
-                data = json.loads(result)
-                addresses += [
-                    {"address": a, "page": page.page} for a in data["addresses"]
-                ]
-            except:
-                self._errors.append("INVALID_JSON")
+    def _pack(self, pages):
+        # Returns: [[TextPage, ...], ...]
+        return list(self._iter_pack(pages))
+
+    def _request(self, group):
+        # Single pages keep the original prompt
+        if len(group) == 1:
+            prompt = PROMPT.format(text=group[0].text)
+        else:
+            prompt = PACKED_PROMPT.format(
+                text="\n".join(
+                    f"{PAGE_MARKER.format(page=page.page)}\n{page.text}"
+                    for page in group
+                )
+            )
+
+        return {
+            "messages": [
+                {
+                    "role": "system",
+                    "content": SYSTEM_NUDGE,
+                },
+                {"role": "user", "content": prompt},
+            ],
+            "temperature": TEMPERATURE,
+            "max_tokens": MAX_TOKENS,
+        }
+
+    def _responses(self, groups):
+        # Yields (group, response) in page order, response is the raised
+        # OpenAIError if the request failed after retries
+        n_pages = sum(len(group) for group in groups)
+        desc = f"Addresses from {n_pages} pages in {len(groups)} requests..."
+        if self._concurrency <= 1:
+            for group in tqdm(groups, desc=desc):
+                try:
+                    yield group, llm.chat_completion(**self._request(group))
+                except openai.error.OpenAIError as err:
+                    yield group, err
+            return
+
+        with tqdm(total=len(groups), desc=desc) as progress:
+            responses = llm.chat_completions(
+                [self._request(group) for group in groups],
+                self._concurrency,
+                progress=progress,
+            )
+        yield from zip(groups, responses)
+
+    def _iter_responses(self, groups):
+        # Like _responses, but requests are sent as groups are produced, with up
+        # to concurrency requests in flight, and responses are yielded in page
+        # order as soon as they arrive
+        submitted = queue.Queue()
+        with ThreadPoolExecutor(max_workers=max(self._concurrency, 1)) as executor:
+
+            def submit():
+                try:
+                    for group in groups:
+                        request = self._request(group)
+                        submitted.put(
+                            (group, executor.submit(llm.chat_completion, **request))
+                        )
+                except BaseException as err:
+                    # e.g. pages failed upstream, raised on the consuming side
+                    submitted.put(err)
+                submitted.put(None)
+
+            threading.Thread(target=submit, daemon=True).start()
+            while (item := submitted.get()) is not None:
+                if isinstance(item, BaseException):
+                    raise item
+                yield self._result(*item)
+
+    def _result(self, group, future):
+        try:
+            return group, future.result()
+        except openai.error.OpenAIError as err:
+            return group, err
+
+    def _attribute(self, address, group):
+        # Page of a packed request an address is on: the page the model
+        # returned when valid, else the first page mentioning its house number
+        # and street name, else the first page of the request
+        if isinstance(address, dict):
+            page = address.get("page")
+            address = address.get("address") or ""
+            if page in [p.page for p in group]:
+                return address, page
+
+        words = re.findall(r"\w+", address.lower())[:2]
+        for page in group:
+            text = page.text.lower()
+            if words and all(w in text for w in words):
+                return address, page.page
+
+        return address, group[0].page
+
+    def _count_usage(self, response):
+        usage = response.get("usage") or {}
+        self._usage["requests"] += 1
+        self._usage["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        self._usage["completion_tokens"] += usage.get("completion_tokens", 0)
+
+    def _reset_usage(self):
+        self._usage = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "skipped_pages": 0,
+        }
+
+    def _parse_response(self, group, response):
+        # Returns: [{"address": ..., "page": ...}, ...]
+        if isinstance(response, openai.error.OpenAIError):
+            self._errors.append("API_ERROR")
+            return []
+
+        self._count_usage(response)
+        addresses = []
+        try:
+            data = json.loads(llm.response_content(response))
+            for address in data["addresses"]:
+                address, page = self._attribute(address, group)
+                addresses.append({"address": address, "page": page})
+        except:
+            self._errors.append("INVALID_JSON")
+
+        return addresses
+
+    def _extract_from_text(self, pages):
+        self._reset_usage()
+        addresses = []
+        for group, response in self._responses(self._pack(self._prefiltered(pages))):
+            addresses += self._parse_response(group, response)
 
         return addresses
 
@@ -122,13 +337,35 @@ class Address(DocumentProcessor):
         self._addresses = self._merge(self._filter(self._extract_from_text(pages)))
         return self._addresses
 
-    def save(self, overwrite=False):
+    def iter_extract(self, pages):
+        # Streaming extract, requests go out while pages are still produced
+        # Input:    iterable of TextPage in page order
+        # Yields:   {street: AddressDetection, ...} per request with addresses,
+        #           result is the merge of all of them once pages run out
+        self._reset_usage()
+        addresses = []
+        groups = self._iter_pack(self._prefiltered(pages))
+        for group, response in self._iter_responses(groups):
+            found = self._filter(self._parse_response(group, response))
+            addresses += found
+            if found:
+                yield self._merge(found)
+
+        self._addresses = self._merge(addresses)
+
+    def save(self, overwrite=False, fingerprint=None):
+        self._aliases.save()
         return self._artifact.write(
-            {k: asdict(v) for k, v in self._addresses.items()}, overwrite=overwrite
+            {k: asdict(v) for k, v in self._addresses.items()},
+            overwrite=overwrite,
+            fingerprint=fingerprint,
+            usage=self._usage,
         )
 
     def load(self):
+        artifact = self._artifact.read(metadata=True)
+        self._usage = artifact.get("usage")
         self._addresses = {
-            k: AddressDetection(**v) for k, v in self._artifact.read().items()
+            k: AddressDetection(**v) for k, v in artifact["data"].items()
         }
         return self._addresses
@@ -2,6 +2,10 @@ from abc import ABC, abstractmethod
 
 
 class DocumentProcessor(ABC):
+    # Errors of requests that failed after retries and may succeed on another
+    # run. Outputs with any of them are incomplete and never saved
+    transient_errors = ()
+
     def __init__(self, filepath):
         self._filepath = filepath
 
@@ -20,12 +24,26 @@ class DocumentProcessor(ABC):
     def artifact_exists(self):
         pass
 
+    @property
+    def complete(self):
+        return not any(e in self.transient_errors for e in self.errors)
+
+    @property
+    def artifact_fingerprint(self):
+        return self._artifact.fingerprint
+
+    @property
+    def version(self):
+        # Anything that changes the output for the same inputs (code version,
+        # prompts, models, engine versions) so stale artifacts are recomputed
+        return ""
+
     @abstractmethod
     def extract(self, data):
         pass
 
     @abstractmethod
-    def save(self, data):
+    def save(self, overwrite=False, fingerprint=None):
         pass
 
     @abstractmethod
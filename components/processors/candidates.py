@@ -0,0 +1,88 @@
+import re
+
+from ..normalize import STREET_SUFFIXES
+
+
+# Bump when the patterns, the street list or normalize.STREET_SUFFIXES
+# change, part of Address.version
+VERSION = 2
+
+# Seed list of Millburn / Short Hills street names (without suffix), catches
+# addresses where OCR mangled or dropped the suffix
+MILLBURN_STREETS = [
+    "baltusrol",
+    "bodwell",
+    "brookside",
+    "cedar",
+    "chatham",
+    "church",
+    "cypress",
+    "deer path",
+    "elm",
+    "essex",
+    "forest",
+    "fox hill",
+    "glen",
+    "great hills",
+    "hartshorn",
+    "highland",
+    "hobart",
+    "knollwood",
+    "lackawanna",
+    "linden",
+    "main",
+    "meadowbrook",
+    "millburn",
+    "minnisink",
+    "old hollow",
+    "old short hills",
+    "parsonage hill",
+    "ridgewood",
+    "sagamore",
+    "slope",
+    "spring",
+    "stewart",
+    "taylor",
+    "tennyson",
+    "western",
+    "white oak ridge",
+    "whittingham",
+    "woodland",
+    "wyoming",
+]
+
+_HOUSE_NUMBER = r"\b\d{1,5}[a-z]?(?:\s*-\s*\d{1,5}[a-z]?)?\s+"
+
+CANDIDATE_PATTERNS = [
+    # 12 Main Street, 12-14 Old Short Hills Rd.
+    re.compile(
+        _HOUSE_NUMBER
+        + r"(?:[a-z][\w'.]*\s+){0,3}(?:"
+        + "|".join(STREET_SUFFIXES)
+        + r")\b",
+        re.I,
+    ),
+    # 12 Wyoming
+    re.compile(
+        _HOUSE_NUMBER
+        + r"(?:"
+        + "|".join(name.replace(" ", r"\s+") for name in MILLBURN_STREETS)
+        + r")\b",
+        re.I,
+    ),
+    # Block 1203, Lot 5
+    re.compile(
+        r"\bblock\s*#?\s*\d+(?:\.\d+)?\s*,?\s*(?:and\s+)?lots?\s*#?\s*\d+", re.I
+    ),
+]
+
+
+def find_candidates(text):
+    # Returns: [matched text, ...] property address candidates
+    return [
+        m.group(0) for pattern in CANDIDATE_PATTERNS for m in pattern.finditer(text)
+    ]
+
+
+def has_candidates(text):
+    return any(pattern.search(text) for pattern in CANDIDATE_PATTERNS)
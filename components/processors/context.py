@@ -0,0 +1,132 @@
+import re
+
+from .tokens import count_tokens
+
+
+# Bump when paragraph splitting, mention matching or expansion change, part
+# of Summarize.version
+VERSION = 1
+
+GAP_MARKER = "[...]"
+
+
+def _table_paragraphs(table):
+    # Paragraph texts of a tesseract word table, lines joined by newlines
+    values = table.values
+    words = table.words
+    paragraphs = []
+    lines = []
+    line = []
+    for i, word in enumerate(words):
+        if i and (
+            values["block_num"][i] != values["block_num"][i - 1]
+            or values["par_num"][i] != values["par_num"][i - 1]
+        ):
+            lines.append(" ".join(line))
+            paragraphs.append("\n".join(lines))
+            lines, line = [], []
+        elif i and values["line_num"][i] != values["line_num"][i - 1]:
+            lines.append(" ".join(line))
+            line = []
+        line.append(word)
+
+    if line:
+        lines.append(" ".join(line))
+        paragraphs.append("\n".join(lines))
+
+    return paragraphs
+
+
+def _text_paragraphs(text, max_tokens):
+    # Text layer pages have no word table: blank line separated paragraphs,
+    # paragraphs over max_tokens are split into their lines
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text.strip("\f\n ")):
+        if count_tokens(paragraph) > max_tokens:
+            paragraphs += [line for line in paragraph.split("\n") if line.strip()]
+        elif paragraph.strip():
+            paragraphs.append(paragraph)
+
+    return paragraphs
+
+
+def paragraphs(pages, max_tokens):
+    # Every paragraph of a document in reading order
+    # Input:   [TextPage, ...]
+    # Returns: [(page, text, n_tokens), ...]
+    units = []
+    for page in pages:
+        if len(page.table):
+            texts = _table_paragraphs(page.table)
+        else:
+            texts = _text_paragraphs(page.text, max_tokens)
+        units += [(page.page, text, count_tokens(text)) for text in texts]
+
+    return units
+
+
+def _mention_pattern(street):
+    # House number followed by the first word of the street name, or the
+    # name alone for streets without a number. Suffixes are left out, OCR and
+    # writers abbreviate them
+    words = re.findall(r"\w+", street.lower())
+    if len(words) > 1 and words[0].isdigit():
+        return re.compile(
+            rf"\b{re.escape(words[0])}\W+{re.escape(words[1])}", re.IGNORECASE
+        )
+
+    return re.compile(rf"\b{re.escape(words[0])}\b", re.IGNORECASE) if words else None
+
+
+def window(units, page, streets, max_tokens):
+    """
+    The paragraphs mentioning the streets on page, expanded to the
+    paragraphs around them while the window fits max_tokens. Expansion crosses
+    into the neighbouring pages, resolutions often run over a page break.
+
+    Input:   units as returned by paragraphs(), streets as [str, ...]
+    Returns: window text, omitted paragraphs marked by GAP_MARKER, or None
+             when one of the streets is not found on the page
+    """
+    patterns = [_mention_pattern(street) for street in streets]
+    on_page = [i for i, unit in enumerate(units) if unit[0] == page]
+    found = [[i for i in on_page if p and p.search(units[i][1])] for p in patterns]
+    if not all(found):
+        return None
+
+    # every street's first mention even when over budget, then the other
+    # mentions that fit
+    selected = {street_mentions[0] for street_mentions in found}
+    n_tokens = sum(units[i][2] for i in selected)
+    for i in sorted(set(sum(found, [])) - selected):
+        if n_tokens + units[i][2] <= max_tokens:
+            selected.add(i)
+            n_tokens += units[i][2]
+
+    # then grow every mention by a paragraph at a time, following paragraphs
+    # first, they hold the motion and the vote
+    allowed = {page - 1, page, page + 1}
+    growing = True
+    while growing:
+        growing = False
+        for i in sorted(selected):
+            for j in (i + 1, i - 1):
+                if (
+                    0 <= j < len(units)
+                    and j not in selected
+                    and units[j][0] in allowed
+                    and n_tokens + units[j][2] <= max_tokens
+                ):
+                    selected.add(j)
+                    n_tokens += units[j][2]
+                    growing = True
+
+    parts = []
+    previous = None
+    for i in sorted(selected):
+        if previous is not None and i != previous + 1:
+            parts.append(GAP_MARKER)
+        parts.append(units[i][1])
+        previous = i
+
+    return "\n\n".join(parts)
@@ -0,0 +1,206 @@
+import os
+import re
+import csv
+import math
+import difflib
+import duckdb
+from collections import defaultdict
+
+from .geocode import Geocode
+from ..artifact import file_hash
+from ..cache import cache_key
+from ..normalize import normalize_street
+
+
+COLUMNS = {"street": "street", "lat": "lat", "lon": "lon"}
+FUZZY_CUTOFF = 0.85
+
+_gazetteers = {}
+
+
+def _split_number(street):
+    # "12a main st" -> ("12", "main st")
+    match = re.match(r"^(\d+)[a-z]?(?:-\d+[a-z]?)?\s+(.+)$", street)
+    if not match:
+        return None, street
+
+    return match.group(1), match.group(2)
+
+
+def _read_rows(path, columns):
+    # Returns: [(street, lat, lon), ...] from a csv or parquet file
+    if path.endswith(".parquet"):
+        select = ", ".join(
+            f'"{columns[c]}"'
+            for c in ("number", "street", "lat", "lon")
+            if c in columns
+        )
+        rows = duckdb.read_parquet(path).project(select).fetchall()
+    else:
+        with open(path, "r", newline="") as f:
+            rows = [
+                tuple(
+                    r[columns[c]]
+                    for c in ("number", "street", "lat", "lon")
+                    if c in columns
+                )
+                for r in csv.DictReader(f)
+            ]
+
+    if "number" in columns:
+        rows = [(f"{n} {s}", lat, lon) for n, s, lat, lon in rows]
+
+    return [(street, float(lat), float(lon)) for street, lat, lon in rows]
+
+
+class _KDTree(object):
+    """
+    2d tree over (lat, lon) for nearest neighbour queries.
+
+    Points are projected to an equirectangular plane around the mean latitude,
+    which is accurate enough at municipal scale.
+    """
+
+    def __init__(self, points):
+        # points: [(lat, lon, value), ...]
+        self._scale = math.cos(
+            math.radians(sum(p[0] for p in points) / max(len(points), 1))
+        )
+        self._root = self._build(
+            [(lon * self._scale, lat, value) for lat, lon, value in points], 0
+        )
+
+    def _build(self, points, depth):
+        if not points:
+            return None
+
+        axis = depth % 2
+        points.sort(key=lambda p: p[axis])
+        median = len(points) // 2
+        return (
+            points[median],
+            axis,
+            self._build(points[:median], depth + 1),
+            self._build(points[median + 1 :], depth + 1),
+        )
+
+    def nearest(self, lat, lon):
+        # Returns: (value, distance in degrees of latitude)
+        target = (lon * self._scale, lat)
+        best = [None, math.inf]
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            point, axis, left, right = node
+            distance = math.dist(target, point[:2])
+            if distance < best[1]:
+                best = [point[2], distance]
+
+            delta = target[axis] - point[axis]
+            near, far = (left, right) if delta < 0 else (right, left)
+            if abs(delta) < best[1]:
+                stack.append(far)
+            stack.append(near)
+
+        return best[0], best[1]
+
+
+class Gazetteer(object):
+    """
+    In memory index of a local address point file (csv or parquet).
+    """
+
+    def __init__(self, path, columns=COLUMNS):
+        self.path = path
+        self.hash = file_hash(path)
+        self._locations = dict()  # normalized street: (lat, lon)
+        self._numbers = defaultdict(dict)  # street name: {number: normalized street}
+        self._names = defaultdict(list)  # number: [street name, ...]
+
+        points = []
+        for street, lat, lon in _read_rows(path, columns):
+            key = normalize_street(street)
+            self._locations[key] = (lat, lon)
+            number, name = _split_number(key)
+            if number:
+                self._numbers[name][number] = key
+                self._names[number].append(name)
+            points.append((lat, lon, street))
+
+        self._tree = _KDTree(points)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _fuzzy(self, key):
+        # Closest street name with the same house number, else the nearest
+        # house number on the closest street name
+        number, name = _split_number(key)
+        if not number:
+            return None
+
+        match = difflib.get_close_matches(
+            name, self._names.get(number, []), n=1, cutoff=FUZZY_CUTOFF
+        )
+        if match:
+            return self._locations[self._numbers[match[0]][number]]
+
+        match = difflib.get_close_matches(
+            name, self._numbers.keys(), n=1, cutoff=FUZZY_CUTOFF
+        )
+        if match:
+            numbers = self._numbers[match[0]]
+            closest = min(numbers, key=lambda n: abs(int(n) - int(number)))
+            return self._locations[numbers[closest]]
+
+        return None
+
+    def geocode(self, street):
+        # Returns: (lat, lon) or None
+        key = normalize_street(street)
+        if key in self._locations:
+            return self._locations[key]
+
+        return self._fuzzy(key)
+
+    def reverse(self, lat, lon):
+        # Returns: (street, distance in degrees of latitude)
+        return self._tree.nearest(lat, lon)
+
+
+def get_gazetteer(path, columns=COLUMNS):
+    # Gazetteers are loaded once per process and shared by all sources
+    key = (os.path.abspath(path), tuple(sorted(columns.items())))
+    if key not in _gazetteers:
+        _gazetteers[key] = Gazetteer(path, columns=columns)
+
+    return _gazetteers[key]
+
+
+class GazetteerGeocode(Geocode):
+    """
+    Offline Geocode backend, looks streets up in a local gazetteer.
+    """
+
+    def __init__(self, source, gazetteer_path, columns=COLUMNS):
+        super().__init__(source)
+        self._gazetteer = get_gazetteer(gazetteer_path, columns=columns)
+
+    @property
+    def version(self):
+        return cache_key(super().version, self._gazetteer.hash)
+
+    def _lookup_cached(self, key):
+        # local lookups are cheaper than the cache
+        return False, None
+
+    def _lookup_batch(self, queries):
+        # Input:   {key: query, ...}
+        # Returns: {key: (lat, lon) or None, ...}
+        return {key: self._gazetteer.geocode(street) for key, street in queries.items()}
+
+    def _query(self, street):
+        return street
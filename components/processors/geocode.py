@@ -1,11 +1,56 @@
+import os
+import time
 from geopy.geocoders import Nominatim
+from geopy.extra.rate_limiter import RateLimiter
 from dataclasses import dataclass, asdict
 
 from .base import DocumentProcessor
+from ..aliases import get_alias_index
 from ..artifact import Artifact
+from ..cache import DiskCache, cache_key
+from ..metrics import get_metrics
+from ..normalize import location_key
 
 
 PROCESSOR_NAME = "geocode"
+VERSION = 1
+
+USER_AGENT = "app"
+REQUESTS_PER_SECOND = 1.0  # public nominatim usage policy
+TIMEOUT = 10
+
+# e.g. a local stand-in, NOMINATIM_DOMAIN=127.0.0.1:8002 NOMINATIM_SCHEME=http
+DOMAIN = os.environ.get("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+SCHEME = os.environ.get("NOMINATIM_SCHEME", "https")
+
+CACHE_NAME = "geocode"
+FOUND_TTL = 365 * 24 * 3600
+NOT_FOUND_TTL = 30 * 24 * 3600
+
+_geocoders = {}
+_cache = None
+
+
+def _get_geocoder(requests_per_second, domain=DOMAIN, scheme=SCHEME):
+    # Rate limited geocoders are shared so the limit holds across sources
+    key = (requests_per_second, domain, scheme)
+    if key not in _geocoders:
+        _geocoders[key] = RateLimiter(
+            Nominatim(user_agent=USER_AGENT, domain=domain, scheme=scheme).geocode,
+            min_delay_seconds=1 / requests_per_second,
+            swallow_exceptions=False,
+        )
+
+    return _geocoders[key]
+
+
+def _get_cache():
+    # Geocode results are shared by all sources and runs
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(CACHE_NAME)
+
+    return _cache
 
 
 @dataclass
@@ -16,12 +61,24 @@ class Coord:
 
 
 class Geocode(DocumentProcessor):
-    def __init__(self, source):
+    transient_errors = ("GEOCODE_ERROR",)
+
+    def __init__(
+        self,
+        source,
+        requests_per_second=REQUESTS_PER_SECOND,
+        domain=DOMAIN,
+        scheme=SCHEME,
+    ):
         self._source = source
+        self._domain = domain
+        self._scheme = scheme
         self._errors = []
         self._coordinates = None
         self._artifact = Artifact(source, PROCESSOR_NAME)
-        self._geolocator = Nominatim(user_agent="app")
+        self._requests_per_second = requests_per_second
+        self._cache = _get_cache()
+        self._aliases = get_alias_index()
 
     @property
     def errors(self):
@@ -35,27 +92,125 @@ class Geocode(DocumentProcessor):
     def artifact_exists(self):
         return self._artifact.exists
 
+    @property
+    def version(self):
+        return cache_key(
+            PROCESSOR_NAME,
+            VERSION,
+            type(self).__name__,
+            self._aliases.revision(self._source["city"], self._source["state"]),
+        )
+
+    def _canonical(self, street):
+        return self._aliases.resolve(
+            street, self._source["city"], self._source["state"]
+        )
+
+    def _query(self, street):
+        street = self._canonical(street)
+        return f"{street} {self._source['city']} {self._source['state']}"
+
+    def _key(self, street):
+        # every spelling of a street shares one cache entry, named by hash
+        return cache_key(
+            location_key(
+                self._canonical(street), self._source["city"], self._source["state"]
+            )
+        )
+
+    def _lookup_cached(self, key):
+        # Returns: (found, (lat, lon) or None)
+        entry = self._cache.get(key)
+        if entry is None or entry["expires"] < time.time():
+            return False, None
+
+        return True, entry["location"]
+
+    def _lookup_batch(self, queries):
+        # Live lookups for cache misses, throttled to the configured rate
+        # Input:   {key: query, ...}
+        # Returns: {key: (lat, lon) or None, ...}
+        geocode = _get_geocoder(self._requests_per_second, self._domain, self._scheme)
+        locations = dict()
+        for key, query in queries.items():
+            start = time.perf_counter()
+            try:
+                location = geocode(query, timeout=TIMEOUT)
+            except Exception:
+                # transient failures are not cached
+                self._errors.append("GEOCODE_ERROR")
+                continue
+            finally:
+                get_metrics().observe(
+                    "geocode_request", time.perf_counter() - start, backend="nominatim"
+                )
+
+            locations[key] = (
+                (location.latitude, location.longitude) if location else None
+            )
+            ttl = FOUND_TTL if location else NOT_FOUND_TTL
+            self._cache.put(
+                key, {"location": locations[key], "expires": time.time() + ttl}
+            )
+
+        return locations
+
     def extract(self, summaries):
         # Input:   {street: [Summary, ...], ...}, but just uses street keys
         # Returns: {street: Coord, ...}
+        keys = {street: self._key(street) for street in summaries}
+
+        locations = dict()
+        misses = dict()
+        for street, key in keys.items():
+            found, location = self._lookup_cached(key)
+            if found:
+                locations[key] = location
+            else:
+                misses[key] = self._query(street)
+
+        locations |= self._lookup_batch(misses)
+
         self._coordinates = dict()
-        for street in summaries:
-            location = self._geolocator.geocode(
-                f"{street} {self._source['city']} {self._source['state']}", timeout=10
-            )
+        for street, key in keys.items():
+            location = locations.get(key)
             if not location:
                 self._errors.append("GEOCODE_FAILED")
 
             else:
-                self._coordinates[street] = Coord(
-                    street, location.latitude, location.longitude
-                )
+                self._coordinates[street] = Coord(street, *location)
 
         return self._coordinates
 
-    def save(self, overwrite=False):
+    def iter_extract(self, summaries):
+        # Streaming extract, each street is looked up the first time it shows up
+        # Input:  iterable of {street: [Summary, ...], ...}
+        # Yields: Coord, result is set once the input runs out
+        self._coordinates = dict()
+        seen = set()
+        for batch in summaries:
+            for street in batch:
+                if street in seen:
+                    continue
+                seen.add(street)
+
+                key = self._key(street)
+                found, location = self._lookup_cached(key)
+                if not found:
+                    location = self._lookup_batch({key: self._query(street)}).get(key)
+
+                if not location:
+                    self._errors.append("GEOCODE_FAILED")
+                else:
+                    self._coordinates[street] = Coord(street, *location)
+                    yield self._coordinates[street]
+
+    def save(self, overwrite=False, fingerprint=None):
+        self._aliases.save()
         return self._artifact.write(
-            {k: asdict(v) for k, v in self._coordinates.items()}, overwrite=overwrite
+            {k: asdict(v) for k, v in self._coordinates.items()},
+            overwrite=overwrite,
+            fingerprint=fingerprint,
         )
 
     def load(self):
@@ -0,0 +1,226 @@
+import time
+import random
+import asyncio
+import openai
+from openai import error
+
+from ..cache import DiskCache, cache_key
+from ..metrics import get_metrics
+
+MODEL = "gpt-3.5-turbo"
+CONTEXT_LENGTH = 4096  # prompt and completion tokens of MODEL
+
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+CACHE_NAME = "llm"
+_cache = None
+_batch_job = None
+
+
+class Deferred(error.OpenAIError):
+    # Raised instead of sending a request that went to a batch job, processors
+    # handle it like any other failed request
+    pass
+
+
+def get_cache():
+    # Response cache shared by every LLM stage, None when disabled
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(CACHE_NAME)
+
+    return _cache or None
+
+
+def set_cache(cache):
+    # Pass False to disable response caching
+    global _cache
+    _cache = cache
+
+
+def get_batch_job():
+    return _batch_job
+
+
+def set_batch_job(job):
+    # While set, requests missing from the cache are added to job instead of
+    # being sent, see components/batch.py. Pass None to send requests again
+    global _batch_job
+    if job is not None and get_cache() is None:
+        raise ValueError("batch jobs need the response cache")
+
+    _batch_job = job
+
+
+def deferred_count():
+    # Requests deferred to the batch job so far
+    return _batch_job.deferred if _batch_job is not None else 0
+
+
+def _response_key(model, messages, temperature, max_tokens):
+    # messages hold both the system prompt and the rendered prompt
+    return cache_key(model, messages, temperature, max_tokens)
+
+
+def _is_retryable(err):
+    # 429s, 5xx and transport failures are retried, anything else is a bug.
+    # APIErrors without a status are not known to be transient
+    if isinstance(
+        err,
+        (
+            error.RateLimitError,
+            error.ServiceUnavailableError,
+            error.APIConnectionError,
+            error.Timeout,
+            error.TryAgain,
+        ),
+    ):
+        return True
+
+    return (
+        isinstance(err, error.APIError)
+        and err.http_status is not None
+        and err.http_status >= 500
+    )
+
+
+def _backoff(attempt):
+    # Exponential backoff with jitter
+    delay = min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2**attempt)
+    return delay * (0.5 + random.random() / 2)
+
+
+def _cached(model, messages, temperature, max_tokens):
+    # Returns: (key, cached response or None)
+    cache = get_cache()
+    if cache is None:
+        return None, None
+
+    key = _response_key(model, messages, temperature, max_tokens)
+    return key, cache.get(key)
+
+
+def _defer(key, model, messages, temperature, max_tokens):
+    _batch_job.add(key, model, messages, temperature, max_tokens)
+    raise Deferred(f"request {key} deferred to a batch job")
+
+
+def _store(key, response):
+    if key is not None:
+        get_cache().put(key, response)
+
+
+def _record(model, response, seconds):
+    metrics = get_metrics()
+    usage = response.get("usage") or {}
+    metrics.observe("llm_request", seconds, model=model)
+    metrics.count("llm_requests", model=model)
+    metrics.count("llm_prompt_tokens", usage.get("prompt_tokens", 0), model=model)
+    metrics.count(
+        "llm_completion_tokens", usage.get("completion_tokens", 0), model=model
+    )
+
+
+def _record_failure(model, err, retried):
+    metrics = get_metrics()
+    if retried:
+        metrics.count("llm_retries", model=model, error=type(err).__name__)
+    else:
+        metrics.count("llm_errors", model=model, error=type(err).__name__)
+
+
+def chat_completion(
+    messages, temperature, max_tokens, model=MODEL, max_retries=MAX_RETRIES
+):
+    key, response = _cached(model, messages, temperature, max_tokens)
+    if response is not None:
+        return response
+    if _batch_job is not None:
+        _defer(key, model, messages, temperature, max_tokens)
+
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            _record(model, response, time.perf_counter() - start)
+            break
+        except error.OpenAIError as err:
+            if attempt == max_retries or not _is_retryable(err):
+                _record_failure(model, err, retried=False)
+                raise
+
+            _record_failure(model, err, retried=True)
+            time.sleep(_backoff(attempt))
+
+    _store(key, response)
+    return response
+
+
+async def achat_completion(
+    messages, temperature, max_tokens, model=MODEL, max_retries=MAX_RETRIES
+):
+    key, response = _cached(model, messages, temperature, max_tokens)
+    if response is not None:
+        return response
+    if _batch_job is not None:
+        _defer(key, model, messages, temperature, max_tokens)
+
+    for attempt in range(max_retries + 1):
+        start = time.perf_counter()
+        try:
+            response = await openai.ChatCompletion.acreate(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            _record(model, response, time.perf_counter() - start)
+            break
+        except error.OpenAIError as err:
+            if attempt == max_retries or not _is_retryable(err):
+                _record_failure(model, err, retried=False)
+                raise
+
+            _record_failure(model, err, retried=True)
+            await asyncio.sleep(_backoff(attempt))
+
+    _store(key, response)
+    return response
+
+
+def chat_completions(requests, concurrency, progress=None):
+    """
+    Run many chat completions with at most `concurrency` in flight.
+
+    requests: [{"messages": ..., "temperature": ..., "max_tokens": ...}, ...]
+    Returns responses in request order, failed requests are returned as the
+    raised OpenAIError. Any other exception is a bug and is raised.
+    """
+
+    async def _run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(request):
+            async with semaphore:
+                try:
+                    return await achat_completion(**request)
+                except error.OpenAIError as err:
+                    return err
+                finally:
+                    if progress is not None:
+                        progress.update(1)
+
+        return await asyncio.gather(*[_one(r) for r in requests])
+
+    return asyncio.run(_run())
+
+
+def response_content(response):
+    return response["choices"][0]["message"]["content"]
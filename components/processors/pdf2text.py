@@ -1,44 +1,145 @@
+import os
+import time
+import functools
+import subprocess
 import pytesseract
 from tqdm import tqdm
-from pdf2image import convert_from_path
-from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor
+from pdf2image import convert_from_path, pdfinfo_from_path
+from dataclasses import dataclass
 
 from .base import DocumentProcessor
-from ..artifact import Artifact
+from ..artifact import Artifact, ColumnarArtifact
+from ..cache import cache_key
+from ..metrics import get_metrics
+from ..wordtable import HEADERS, WordTable
 
 POPPLER_PATH = "/usr/local/Cellar/poppler/23.01.0/bin"
 PROCESSOR_NAME = "pdf2text"
+VERSION = 1
 
+OCR_WORKERS = os.cpu_count() or 1
+PAGES_PER_CHUNK = 4  # pages rasterized at once per worker, bounds bitmap memory
 
-@dataclass
+# A page's embedded text layer is used instead of OCR when it looks like text
+TEXT_LAYER_MIN_CHARS = 40
+TEXT_LAYER_MIN_WORD_RATIO = 0.6
+
+METHOD_OCR = "ocr"
+METHOD_TEXT_LAYER = "text_layer"
+
+
+@dataclass(slots=True)
 class TextPage:
     page: int
     text: str
     headers: list[str]
-    table: list
+    table: WordTable
     source: dict
+    method: str = METHOD_OCR
+
+    def __post_init__(self):
+        # legacy json artifacts hold tables as lists of rows
+        if not isinstance(self.table, WordTable):
+            self.table = WordTable.from_rows(self.headers, self.table)
+
+
+@functools.lru_cache(maxsize=None)
+def _tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except (pytesseract.TesseractNotFoundError, OSError):
+        return "unknown"
+
+
+def _ocr_image(image):
+    # Single tesseract pass per page
+    # Returns: (text, headers, table)
+    table = WordTable.from_tesseract(pytesseract.image_to_data(image))
+    return table.to_text(), HEADERS, table
+
+
+def _is_usable_text(text):
+    # Empty or garbage (e.g. scanned pages with a broken font map) text layers
+    # are sent to OCR
+    if len(text.strip()) < TEXT_LAYER_MIN_CHARS:
+        return False
 
+    tokens = text.split()
+    words = [t for t in tokens if sum(c.isalnum() for c in t) >= len(t) / 2]
+    return len(words) / len(tokens) >= TEXT_LAYER_MIN_WORD_RATIO
 
-def _parse_tesseract_verbose(data):
-    # Parse pytesseract.image_to_data output into table
-    rows = data.split("\n")
-    headers = rows[0].split("\t")
-    table = []
-    for row in rows[1:]:
-        values = row.split("\t")
-        if values[-1] != "":
-            table.append(values)
 
-    return headers, table
+def _read_text_layer(filepath, poppler_path):
+    # Embedded text of every page via poppler's pdftotext
+    # Returns: [text, ...] indexed by page
+    binary = os.path.join(poppler_path, "pdftotext") if poppler_path else "pdftotext"
+    output = subprocess.run(
+        [binary, "-enc", "UTF-8", filepath, "-"], capture_output=True, check=True
+    ).stdout.decode("utf-8", errors="replace")
+
+    # pdftotext terminates every page with a form feed
+    return output.split("\f")[:-1]
+
+
+def _page_ranges(pages, pages_per_chunk):
+    # Group sorted 0-indexed pages into consecutive runs of at most
+    # pages_per_chunk, as 1-indexed inclusive (first_page, last_page) ranges
+    ranges = []
+    for pp in pages:
+        if (
+            ranges
+            and ranges[-1][1] == pp
+            and ranges[-1][1] - ranges[-1][0] + 1 < pages_per_chunk
+        ):
+            ranges[-1] = (ranges[-1][0], pp + 1)
+        else:
+            ranges.append((pp + 1, pp + 1))
+
+    return ranges
+
+
+def _ocr_page_range(filepath, poppler_path, first_page, last_page):
+    # Rasterize and OCR one chunk of pages, runs in a worker process
+    # Returns: [(page, text, headers, table, seconds), ...], seconds include
+    # the page's share of rasterizing the chunk
+    start = time.perf_counter()
+    images = convert_from_path(
+        filepath,
+        poppler_path=poppler_path,
+        first_page=first_page,
+        last_page=last_page,
+    )
+    rasterize_s = (time.perf_counter() - start) / max(len(images), 1)
+
+    pages = []
+    for offset, image in enumerate(images):
+        start = time.perf_counter()
+        text, headers, table = _ocr_image(image)
+        seconds = rasterize_s + time.perf_counter() - start
+        pages.append((first_page - 1 + offset, text, headers, table, seconds))
+
+    return pages
 
 
 class PDF2Text(DocumentProcessor):
-    def __init__(self, source, poppler_path=POPPLER_PATH):
+    def __init__(
+        self,
+        source,
+        poppler_path=POPPLER_PATH,
+        n_workers=OCR_WORKERS,
+        pages_per_chunk=PAGES_PER_CHUNK,
+        use_text_layer=True,
+    ):
         self._source = source
         self._poppler_path = poppler_path
+        self._n_workers = n_workers
+        self._pages_per_chunk = pages_per_chunk
+        self._use_text_layer = use_text_layer
         self._errors = []
         self._pages = None
-        self._artifact = Artifact(source, PROCESSOR_NAME)
+        self._artifact = ColumnarArtifact(source, PROCESSOR_NAME)
+        self._json_artifact = Artifact(source, PROCESSOR_NAME)  # legacy format
 
     @property
     def errors(self):
@@ -50,26 +151,118 @@ class PDF2Text(DocumentProcessor):
 
     @property
     def artifact_exists(self):
-        return self._artifact.exists
+        return self._artifact.exists or self._json_artifact.exists
+
+    @property
+    def artifact_fingerprint(self):
+        return self._readable_artifact.fingerprint
+
+    @property
+    def _readable_artifact(self):
+        # Columnar artifact, falling back to json artifacts not yet migrated
+        if self._artifact.exists or not self._json_artifact.exists:
+            return self._artifact
+
+        return self._json_artifact
+
+    @property
+    def version(self):
+        return cache_key(
+            PROCESSOR_NAME, VERSION, _tesseract_version(), self._use_text_layer
+        )
+
+    def _ocr_chunks(self, ranges):
+        # Yields OCR'd chunks in page order
+        filepath = self._source["filepath"]
+        if self._n_workers <= 1 or len(ranges) <= 1:
+            for first_page, last_page in ranges:
+                yield _ocr_page_range(
+                    filepath, self._poppler_path, first_page, last_page
+                )
+            return
+
+        with ProcessPoolExecutor(max_workers=self._n_workers) as executor:
+            yield from executor.map(
+                _ocr_page_range,
+                [filepath] * len(ranges),
+                [self._poppler_path] * len(ranges),
+                [first_page for first_page, _ in ranges],
+                [last_page for _, last_page in ranges],
+            )
+
+    def _text_layer_pages(self, n_pages):
+        # Returns: {page: TextPage, ...} for pages with a usable text layer
+        if not self._use_text_layer:
+            return {}
+
+        try:
+            texts = _read_text_layer(self._source["filepath"], self._poppler_path)
+        except (OSError, subprocess.CalledProcessError):
+            self._errors.append("TEXT_LAYER_FAILED")
+            return {}
+
+        if len(texts) != n_pages:
+            self._errors.append("TEXT_LAYER_PAGE_MISMATCH")
+            return {}
+
+        return {
+            pp: TextPage(
+                pp,
+                text + "\f",
+                [],
+                WordTable.empty(),
+                self._source,
+                METHOD_TEXT_LAYER,
+            )
+            for pp, text in enumerate(texts)
+            if _is_usable_text(text)
+        }
+
+    def iter_extract(self):
+        # Yields TextPage in page order as soon as each page and every page
+        # before it is done, result is set once all pages are yielded
+        n_pages = pdfinfo_from_path(
+            self._source["filepath"], poppler_path=self._poppler_path
+        )["Pages"]
+        pages = self._text_layer_pages(n_pages)
+
+        ocr_pages = [pp for pp in range(n_pages) if pp not in pages]
+        ranges = _page_ranges(ocr_pages, self._pages_per_chunk)
+        next_page = 0
+        with tqdm(
+            total=len(ocr_pages), desc=f"OCR {len(ocr_pages)} pages..."
+        ) as progress:
+            for chunk in self._ocr_chunks(ranges):
+                for pp, text, headers, table, seconds in chunk:
+                    pages[pp] = TextPage(pp, text, headers, table, self._source)
+                    get_metrics().observe("ocr_page", seconds)
+
+                progress.update(len(chunk))
+                while next_page in pages:
+                    yield pages[next_page]
+                    next_page += 1
+
+        # text layer pages after the last OCR'd page
+        while next_page in pages:
+            yield pages[next_page]
+            next_page += 1
+
+        self._pages = [pages[pp] for pp in range(n_pages)]
 
     def extract(self):
         # Returns: [TextPage, ...]
-        self._pages = []
-        images = convert_from_path(
-            self._source["filepath"], poppler_path=self._poppler_path
-        )
-        for pp, image in enumerate(tqdm(images, desc=f"OCR {len(images)} images...")):
-            text = pytesseract.image_to_string(image)
-            headers, table = _parse_tesseract_verbose(pytesseract.image_to_data(image))
-            self._pages.append(TextPage(pp, text, headers, table, self._source))
+        for _ in self.iter_extract():
+            pass
 
         return self._pages
 
-    def save(self, overwrite=False):
+    def save(self, overwrite=False, fingerprint=None):
         return self._artifact.write(
-            [asdict(p) for p in self._pages], overwrite=overwrite
+            self._pages,
+            overwrite=overwrite,
+            fingerprint=fingerprint,
         )
 
     def load(self):
-        self._pages = [TextPage(**p) for p in self._artifact.read()]
+        self._pages = [TextPage(**p) for p in self._readable_artifact.read()]
         return self._pages
@@ -1,15 +1,20 @@
 import os
 import openai
 import json
+import itertools
 from tqdm import tqdm
-from dataclasses import dataclass, asdict
+from collections import defaultdict
+from dataclasses import dataclass, asdict, replace
 
-from . import get_openai_key
+from . import get_openai_key, llm, context
 from .base import DocumentProcessor
+from .tokens import count_tokens
 from ..artifact import Artifact
+from ..cache import cache_key
 
 
 PROCESSOR_NAME = "summarize"
+VERSION = 1
 
 TAGS = [
     "INSTALLATION",
@@ -36,10 +41,42 @@ Rules:
 
 property address: {street}
 
+document: {text}
+"""
+BATCH_PROMPT = """For each of the given property addresses, identify issue, resolution, and summary of decision.
+Return the results as a json object keyed by property address like:
+
+    {{
+        "<insert property address>": {{
+            "status": "<insert either APPROVED or DENIED or NO_STATUS>",
+            "summary": "<insert short 3 sentence summary of the resolution with regard to the property>", or "", if missing
+            "tags": ["<insert comma separated list, all that apply: {tags}>"]
+        }},
+        ...
+    }}
+
+Rules:
+1. Think step by step for each property and each result field
+2. Use each property address exactly as given as its key
+3. The result must be in valid json format
+
+property addresses:
+{streets}
+
 document: {text}
 """
 MAX_TOKENS = 1500
+# Completion tokens per street of a batched request, streets that do not fit
+# in the model context next to the prompt are summarized one by one
+BATCH_TOKENS_PER_STREET = 400
+PROMPT_MARGIN = 100  # tokens held back for message formatting and estimates
 TEMPERATURE = 0
+BATCH = True  # one request for all streets detected on the same pages
+# Prompt tokens of page text per street: only the paragraphs around a street's
+# mentions go to the model. None sends whole pages
+CONTEXT_TOKENS = 300
+
+SUMMARY_FIELDS = ("status", "summary", "tags")
 
 
 @dataclass
@@ -52,9 +89,14 @@ class Summary:
 
 
 class Summarize(DocumentProcessor):
-    def __init__(self, source, pages):
+    transient_errors = ("API_ERROR",)
+
+    def __init__(self, source, pages, batch=BATCH, context_tokens=CONTEXT_TOKENS):
         self._source = source
         self._pages = pages
+        self._batch = batch
+        self._context_tokens = context_tokens
+        self._paragraphs = dict()  # page: paragraphs, pages may still arrive
         self._errors = []
         self._summaries = None
         self._artifact = Artifact(source, PROCESSOR_NAME)
@@ -67,12 +109,29 @@ class Summarize(DocumentProcessor):
 
     @property
     def result(self):
-        return self._summary
+        return self._summaries
 
     @property
     def artifact_exists(self):
         return self._artifact.exists
 
+    @property
+    def version(self):
+        return cache_key(
+            PROCESSOR_NAME,
+            VERSION,
+            llm.MODEL,
+            SYSTEM_NUDGE,
+            PROMPT,
+            TAGS,
+            TEMPERATURE,
+            MAX_TOKENS,
+            [BATCH_PROMPT, BATCH_TOKENS_PER_STREET, llm.CONTEXT_LENGTH, PROMPT_MARGIN]
+            if self._batch
+            else None,
+            [context.VERSION, self._context_tokens] if self._context_tokens else None,
+        )
+
     def _parse_key_value_response(self, result):
         summary = dict()
         for line in result.split("\n"):
@@ -94,8 +153,7 @@ class Summarize(DocumentProcessor):
         return summary
 
     def _summarize(self, text, street):
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
+        response = llm.chat_completion(
             messages=[
                 {
                     "role": "system",
@@ -111,7 +169,7 @@ class Summarize(DocumentProcessor):
             temperature=TEMPERATURE,
             max_tokens=MAX_TOKENS,
         )
-        result = response["choices"][0]["message"]["content"]
+        result = llm.response_content(response)
 
         # try to parse summary json
         summary = None
@@ -126,9 +184,55 @@ class Summarize(DocumentProcessor):
 
         return summary
 
-    def _extract_address_all(self, street, detection, n_consecutive_pages=2):
-        street_summaries = []
+    def _batch_max_tokens(self, prompt, n_streets):
+        # Completion tokens of a batched request, None when the prompt leaves
+        # too little room in the model context for every street's result
+        max_tokens = BATCH_TOKENS_PER_STREET * n_streets
+        prompt_tokens = count_tokens(SYSTEM_NUDGE) + count_tokens(prompt)
+        if prompt_tokens + PROMPT_MARGIN + max_tokens > llm.CONTEXT_LENGTH:
+            return None
+
+        return max_tokens
+
+    def _summarize_batch(self, text, streets):
+        # Returns: {street: summary, ...} for the streets with a valid result
+        prompt = BATCH_PROMPT.format(
+            tags=", ".join(TAGS), streets="\n".join(streets), text=text
+        )
+        max_tokens = self._batch_max_tokens(prompt, len(streets))
+        if max_tokens is None:
+            return {}
+
+        response = llm.chat_completion(
+            messages=[
+                {
+                    "role": "system",
+                    "content": SYSTEM_NUDGE,
+                },
+                {"role": "user", "content": prompt},
+            ],
+            temperature=TEMPERATURE,
+            max_tokens=max_tokens,
+        )
+
+        try:
+            results = json.loads(llm.response_content(response))
+            results = {k.lower(): v for k, v in results.items()}
+        except:
+            self._errors.append("INVALID_BATCH_JSON")
+            return {}
+
+        summaries = dict()
+        for street in streets:
+            result = results.get(street.lower())
+            if isinstance(result, dict) and all(f in result for f in SUMMARY_FIELDS):
+                summaries[street] = {f: result[f] for f in SUMMARY_FIELDS}
 
+        return summaries
+
+    def _windows(self, detection, n_consecutive_pages=2):
+        # Returns: [(first page, text), ...] page windows to summarize
+        windows = []
         processed = []
         for pp in sorted(detection.pages):
             if pp in processed:
@@ -140,17 +244,105 @@ class Summarize(DocumentProcessor):
                 text += self._pages[pp + offset].text
                 processed.append(pp + offset)
 
+            windows.append((pp, text))
+
+        return windows
+
+    def _context(self, pp, text, streets):
+        # Paragraphs around the streets' mentions on page pp, the page window
+        # text when a street is not found or the window would not be smaller
+        if not self._context_tokens:
+            return text
+
+        max_tokens = min(self._context_tokens * len(streets), count_tokens(text))
+        window = context.window(self._units(), pp, streets, max_tokens)
+        return text if window is None else window
+
+    def _units(self):
+        # Paragraphs of the pages collected so far, each page is split once.
+        # While streaming, pages keep being added to self._pages
+        for page in self._pages[len(self._paragraphs) :]:
+            self._paragraphs[page.page] = context.paragraphs(
+                [page], self._context_tokens
+            )
+
+        return [
+            unit for pp in sorted(self._paragraphs) for unit in self._paragraphs[pp]
+        ]
+
+    def _held_back(self, pp):
+        # Windows reach into the page after pp, while streaming a page is only
+        # summarized once the next one arrived, or the document ended, so the
+        # prompts are the ones extract() sends
+        return bool(self._context_tokens) and not (
+            self._pages and self._pages[-1].page > pp
+        )
+
+    def _extract_address_all(self, street, detection):
+        street_summaries = []
+        for pp, text in self._windows(detection):
             # summarize
-            summary = self._summarize(text, street)
+            try:
+                summary = self._summarize(self._context(pp, text, [street]), street)
+            except llm.Deferred:
+                continue
+            except openai.error.OpenAIError:
+                self._errors.append("API_ERROR")
+                continue
             if summary:
                 # street_summaries.append(summary | {"page": pp})
                 street_summaries.append(Summary(street, pp, **summary))
 
         return street_summaries
 
+    def _extract_batched(self, addresses):
+        # Streets sharing a page window are summarized in one request, streets
+        # missing from a batched response, or of a window too long or failed to
+        # batch, fall back to their own request
+        texts = dict()
+        window_streets = defaultdict(list)
+        for street, detection in addresses.items():
+            for pp, text in self._windows(detection):
+                texts[pp] = text
+                window_streets[pp].append(street)
+
+        summaries = {street: [] for street in addresses}
+        for pp in tqdm(sorted(texts), desc="Summaries by page window..."):
+            streets = window_streets[pp]
+            texts[pp] = self._context(pp, texts[pp], streets)
+            try:
+                batch = (
+                    self._summarize_batch(texts[pp], streets)
+                    if len(streets) > 1
+                    else {}
+                )
+            except llm.Deferred:
+                # the fallbacks depend on the batched response, wait for it
+                continue
+            except openai.error.OpenAIError:
+                self._errors.append("BATCH_API_ERROR")
+                batch = {}
+
+            for street in streets:
+                try:
+                    summary = batch.get(street) or self._summarize(texts[pp], street)
+                except llm.Deferred:
+                    continue
+                except openai.error.OpenAIError:
+                    self._errors.append("API_ERROR")
+                    continue
+                if summary:
+                    summaries[street].append(Summary(street, pp, **summary))
+
+        return summaries
+
     def extract(self, addresses):
         # Input:  {street: AddressDetection, ...}
         # Return: {street: [Summary, ...], ...}
+        if self._batch:
+            self._summaries = self._extract_batched(addresses)
+            return self._summaries
+
         self._summaries = dict()
         for street, detection in tqdm(
             addresses.items(), desc="Summaries by address..."
@@ -159,11 +351,62 @@ class Summarize(DocumentProcessor):
 
         return self._summaries
 
-    def save(self, overwrite=False):
+    def iter_extract(self, addresses):
+        # Streaming extract, pages a street was already summarized on are
+        # skipped when the street is detected again
+        # Input:  iterable of {street: AddressDetection, ...}
+        # Yields: {street: [Summary, ...], ...} per input batch with pages
+        #         ready to summarize, result is the union of all of them once
+        #         the input runs out
+        summarized = defaultdict(set)
+        held = dict()  # street: AddressDetection of the pages not summarized yet
+        self._summaries = dict()
+        for batch in itertools.chain(addresses, [None]):
+            for street, detection in (batch or {}).items():
+                pages = [pp for pp in detection.pages if pp not in summarized[street]]
+                summarized[street].update(pages)
+                held_pages = held[street].pages if street in held else []
+                held[street] = replace(detection, pages=held_pages + pages)
+
+            # held back pages are ready once the next page arrived, all of
+            # them once the input ran out, the pages stream ended before it
+            ready = dict()
+            for street, detection in list(held.items()):
+                pages = [
+                    pp
+                    for pp in detection.pages
+                    if batch is None or not self._held_back(pp)
+                ]
+                rest = [pp for pp in detection.pages if pp not in pages]
+                if pages:
+                    ready[street] = replace(detection, pages=pages)
+                if rest:
+                    held[street] = replace(detection, pages=rest)
+                else:
+                    del held[street]
+
+            if not ready:
+                continue
+
+            if self._batch:
+                summaries = self._extract_batched(ready)
+            else:
+                summaries = {
+                    street: self._extract_address_all(street, detection)
+                    for street, detection in ready.items()
+                }
+
+            for street, street_summaries in summaries.items():
+                self._summaries.setdefault(street, []).extend(street_summaries)
+
+            yield summaries
+
+    def save(self, overwrite=False, fingerprint=None):
         # TODO: summaries are in a list
         return self._artifact.write(
             {k: [asdict(s) for s in v] for k, v in self._summaries.items()},
             overwrite=overwrite,
+            fingerprint=fingerprint,
         )
 
     def load(self):
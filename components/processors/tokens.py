@@ -0,0 +1,30 @@
+try:
+    import tiktoken
+except ImportError:  # optional, token counts are estimated without it
+    tiktoken = None
+
+from . import llm
+
+
+CHARS_PER_TOKEN = 4  # estimate for english text when tiktoken is missing
+
+_encodings = {}
+
+
+def _encoding(model):
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except Exception:
+            # unknown model, or the encoding could not be fetched (offline)
+            _encodings[model] = None
+
+    return _encodings[model]
+
+
+def count_tokens(text, model=llm.MODEL):
+    encoding = _encoding(model) if tiktoken is not None else None
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+
+    return len(encoding.encode(text, disallowed_special=()))
@@ -0,0 +1,219 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from tabulate import tabulate
+
+from .pipeline import (
+    PIPELINE_CONFIG,
+    PipelineStageResults,
+    run_stage,
+    reshape_to_pipeline_result,
+)
+from .processors.pdf2text import PDF2Text
+from .dbwriter import DBWriter
+from .manifest import STATUS_DONE, STATUS_FAILED
+from .metrics import get_metrics, reset_metrics
+
+
+# Workers per stage output, pdf2text runs in a process pool, the network
+# bound stages run as async workers on threads
+WORKERS = {
+    "pages": os.cpu_count() or 1,
+    "addresses": 4,
+    "summaries": 4,
+    "coords": 2,
+}
+QUEUE_SIZE = 8  # sources buffered between stages
+WRITE_BATCH_SIZE = 16
+
+
+def _run_process_stage(stage, result):
+    # Runs in a worker process, returns the stage output, fingerprints and
+    # the metrics recorded while running it
+    metrics = reset_metrics()
+    run_stage(stage, result)
+    return getattr(result, stage["output"]), result.fingerprints, metrics.snapshot()
+
+
+class _StageStats(object):
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.done = 0
+        self.failed = 0
+        self.busy = 0.0
+
+    def row(self, wall):
+        return [
+            self.name,
+            self.workers,
+            self.done,
+            self.failed,
+            self.busy,
+            self.busy / (self.workers * wall) if wall else 0.0,
+            self.done / wall * 60 if wall else 0.0,
+        ]
+
+
+class CorpusScheduler(object):
+    """
+    Run the pipeline over many sources with every stage working concurrently.
+
+    Stages are connected by bounded queues. A source moves to the next stage
+    as soon as its current stage is done and all results go through a single
+    DBWriter.
+    """
+
+    def __init__(
+        self,
+        config=PIPELINE_CONFIG,
+        workers=WORKERS,
+        queue_size=QUEUE_SIZE,
+        persist=True,
+        db_filepath=None,
+        manifest=None,
+    ):
+        self._config = [
+            # one document per process, the pool already uses every core
+            stage | {"kwargs": stage.get("kwargs", {}) | {"n_workers": 1}}
+            if issubclass(stage["processor"], PDF2Text)
+            else stage
+            for stage in config
+        ]
+        self._workers = WORKERS | workers
+        self._queue_size = queue_size
+        self._persist = persist
+        self._db_filepath = db_filepath
+        self._manifest = manifest  # updated from the event loop thread only
+        self._stats = None
+        self._wall = None
+        self.ids = None
+
+    def _record(self, source, stage, status, fingerprint=None, n_pages=None):
+        if self._manifest is not None:
+            self._manifest.record_stage(source, stage, status, fingerprint, n_pages)
+
+    async def _stage_worker(self, stage, inbox, outbox, stats, pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            result = await inbox.get()
+            start = time.perf_counter()
+            try:
+                if issubclass(stage["processor"], PDF2Text):
+                    (
+                        output,
+                        result.fingerprints,
+                        snapshot,
+                    ) = await loop.run_in_executor(
+                        pool, _run_process_stage, stage, result
+                    )
+                    setattr(result, stage["output"], output)
+                    get_metrics().merge(snapshot)
+                else:
+                    await asyncio.to_thread(run_stage, stage, result)
+
+                stats.done += 1
+                self._record(
+                    result.source,
+                    stage["output"],
+                    STATUS_DONE,
+                    result.fingerprints.get(stage["output"]),
+                    n_pages=len(result.pages) if stage["output"] == "pages" else None,
+                )
+            except Exception as err:
+                stats.failed += 1
+                print(
+                    f"{stage['output']} failed for {result.source['filepath']}: {err}"
+                )
+                self._record(result.source, stage["output"], STATUS_FAILED)
+                result = None
+            finally:
+                stats.busy += time.perf_counter() - start
+
+            if result is not None:
+                await outbox.put(result)
+            inbox.task_done()
+
+    async def _writer(self, inbox, stats):
+        writer = None
+        if self._persist:
+            writer = DBWriter(self._db_filepath) if self._db_filepath else DBWriter()
+
+        while True:
+            batch = [await inbox.get()]
+            while not inbox.empty() and len(batch) < WRITE_BATCH_SIZE:
+                batch.append(inbox.get_nowait())
+
+            start = time.perf_counter()
+            results = [reshape_to_pipeline_result(r) for r in batch]
+            try:
+                if writer is not None:
+                    self.ids += await asyncio.to_thread(writer.insert_many, results)
+                stats.done += len(batch)
+                status = STATUS_DONE
+            except Exception as err:
+                stats.failed += len(batch)
+                print(f"write failed for {len(batch)} sources: {err}")
+                status = STATUS_FAILED
+            finally:
+                stats.busy += time.perf_counter() - start
+
+            for result in batch:
+                if writer is not None:
+                    self._record(result.source, "db", status)
+                inbox.task_done()
+
+    async def _run(self, sources):
+        queues = [asyncio.Queue()] + [
+            asyncio.Queue(self._queue_size) for _ in self._config
+        ]
+        self._stats = [
+            _StageStats(stage["output"], self._workers[stage["output"]])
+            for stage in self._config
+        ] + [_StageStats("db", 1)]
+        self.ids = []
+
+        with ProcessPoolExecutor(max_workers=self._workers["pages"]) as pool:
+            tasks = [
+                asyncio.create_task(
+                    self._stage_worker(stage, queues[ii], queues[ii + 1], stats, pool)
+                )
+                for ii, (stage, stats) in enumerate(zip(self._config, self._stats))
+                for _ in range(stats.workers)
+            ]
+            tasks.append(asyncio.create_task(self._writer(queues[-1], self._stats[-1])))
+
+            for source in sources:
+                await queues[0].put(PipelineStageResults(source, [], {}, {}, {}))
+
+            # stages drain in order, each queue is empty once its producer is
+            for queue in queues:
+                await queue.join()
+
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def run(self, sources):
+        start = time.perf_counter()
+        asyncio.run(self._run(sources))
+        self._wall = time.perf_counter() - start
+        return self.ids
+
+    def summary(self):
+        rows = [stats.row(self._wall) for stats in self._stats]
+        table = tabulate(
+            rows,
+            headers=[
+                "stage",
+                "workers",
+                "done",
+                "failed",
+                "busy s",
+                "util",
+                "docs/min",
+            ],
+            floatfmt=".2f",
+        )
+        return f"{table}\n\nwall: {self._wall:.1f}s"
@@ -1,11 +1,56 @@
 import os
 import json
+import threading
+from collections import defaultdict
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 SOURCE_ROOT = "sources"
 
+HTTP_POOL_SIZE = 8
+HTTP_RETRIES = 3
+HTTP_BACKOFF_SECONDS = 0.5
+HTTP_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024**2
+
+# Source.fetch outcomes
+DOWNLOADED = "downloaded"
+NOT_MODIFIED = "not_modified"
+EXISTS = "exists"
+EMPTY = "empty"
+
+# Concurrent fetches of the same pdf path share its .part file, they run one
+# at a time
+_path_locks = defaultdict(threading.Lock)
+_path_locks_lock = threading.Lock()
+
+
+def _path_lock(path):
+    with _path_locks_lock:
+        return _path_locks[os.path.abspath(path)]
+
+
+def http_session(pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES):
+    # Session with keep-alive connections for pool_size concurrent requests
+    # and retries with backoff on connection errors, 429s and 5xxs
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(
+            total=retries,
+            backoff_factor=HTTP_BACKOFF_SECONDS,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,  # the agenda center lists documents via POST
+        ),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 
 class Source(object):
     """
@@ -35,33 +80,120 @@ class Source(object):
     def source_files(self):
         return [f for f in os.listdir(self._source_dir) if f.endswith("pdf")]
 
-    def write(self, date, url, metadata, overwrite=False):
-        source_path = os.path.join(self._source_dir, f"{date}-minutes.pdf")
-        metadata_path = os.path.join(self._source_dir, f"{date}-minutes_metadata.json")
+    def source_path(self, date):
+        return os.path.join(self._source_dir, f"{date}-minutes.pdf")
 
-        if (
-            not overwrite
-            and os.path.exists(source_path)
-            and os.path.exists(metadata_path)
-        ):
-            return self
-
-        r = requests.get(url)
-        if r.content:
-            with open(source_path, "wb") as f:
-                f.write(r.content)
-
-            with open(metadata_path, "w") as f:
-                f.write(
-                    json.dumps(
-                        {
-                            "metadata": metadata,
-                            "timestamp": str(datetime.now()),
-                            "source_path": source_path,
-                        }
-                    )
-                )
+    def _paths(self, date):
+        return (
+            self.source_path(date),
+            os.path.join(self._source_dir, f"{date}-minutes_metadata.json"),
+        )
+
+    @staticmethod
+    def _read_json(path):
+        if not os.path.exists(path):
+            return {}
+
+        with open(path, "r") as f:
+            return json.loads(f.read())
+
+    @staticmethod
+    def _write_json(path, data):
+        # Atomic, readers never see a partially written file
+        with open(f"{path}.tmp", "w") as f:
+            f.write(json.dumps(data))
+        os.replace(f"{path}.tmp", path)
+
+    def fetch(self, date, url, metadata, overwrite=False, refresh=False, session=None):
+        """
+        Stream a source pdf to disk and write its metadata.
+
+        The body goes to a .part file that is renamed into place once complete,
+        an interrupted transfer is resumed with a range request on the next
+        call. With refresh, existing pdfs are re-requested conditionally on the
+        ETag/Last-Modified recorded in their metadata and kept if unchanged.
+        Fetches of the same pdf path in one process are serialized.
+
+        Returns: DOWNLOADED, NOT_MODIFIED, EXISTS or EMPTY
+        """
+        with _path_lock(self.source_path(date)):
+            return self._fetch(date, url, metadata, overwrite, refresh, session)
+
+    def _discard_partial(self, partial_path):
+        for path in (partial_path, f"{partial_path}.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _fetch(self, date, url, metadata, overwrite, refresh, session):
+        source_path, metadata_path = self._paths(date)
+        partial_path = f"{source_path}.part"
+        exists = os.path.exists(source_path) and os.path.exists(metadata_path)
+        if exists and not overwrite and not refresh:
+            return EXISTS
+
+        headers = dict()
+        if exists and not overwrite:
+            recorded = self._read_json(metadata_path)
+            if recorded.get("etag"):
+                headers["If-None-Match"] = recorded["etag"]
+            if recorded.get("last_modified"):
+                headers["If-Modified-Since"] = recorded["last_modified"]
+
+        # resume only if the server can tell whether the partial is still valid
+        partial = self._read_json(f"{partial_path}.json")
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        validator = partial.get("etag") or partial.get("last_modified")
+        if offset and partial.get("url") == url and validator:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+
+        with (session or requests).get(
+            url, headers=headers, stream=True, timeout=HTTP_TIMEOUT
+        ) as r:
+            if r.status_code == 304:
+                return NOT_MODIFIED
+
+            r.raise_for_status()
+            validators = {
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+            resumed = r.status_code == 206
+            if resumed and "Range" not in headers:
+                raise requests.RequestException(f"unrequested partial content {url}")
+            if resumed and not r.headers.get("Content-Range", "").startswith(
+                f"bytes {offset}-"
+            ):
+                # not the range asked for, start over without one
+                self._discard_partial(partial_path)
+                return self._fetch(date, url, metadata, overwrite, refresh, session)
+
+            if not resumed:
+                self._write_json(f"{partial_path}.json", {"url": url} | validators)
+
+            with open(partial_path, "ab" if resumed else "wb") as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+
+        if not os.path.getsize(partial_path):
+            self._discard_partial(partial_path)
+            return EMPTY
+
+        os.replace(partial_path, source_path)
+        self._write_json(
+            metadata_path,
+            {
+                "metadata": metadata,
+                "timestamp": str(datetime.now()),
+                "source_path": source_path,
+            }
+            | validators,
+        )
+        os.remove(f"{partial_path}.json")
+        return DOWNLOADED
 
+    def write(self, date, url, metadata, overwrite=False, session=None):
+        self.fetch(date, url, metadata, overwrite=overwrite, session=session)
         return self
 
     def read_metadata(self, source_name, artifact_data=False):
@@ -0,0 +1,156 @@
+import time
+import queue
+import threading
+
+from .pipeline import (
+    PIPELINE_CONFIG,
+    PipelineStageResults,
+    StageIncomplete,
+    stage_fingerprint,
+    record_stage_metrics,
+    _incomplete_message,
+    _is_fresh,
+)
+from .manifest import STATUS_FAILED
+from .metrics import get_metrics
+
+
+QUEUE_SIZE = 16  # items buffered between stages
+
+# Stream items of a stage output loaded from its artifact, in the shape the
+# processor's iter_extract yields them
+LOADED_ITEMS = {
+    "pages": lambda pages: iter(pages),
+    "addresses": lambda addresses: iter([addresses]),
+    "summaries": lambda summaries: iter([summaries]),
+    "coords": lambda coords: iter(coords.values()),
+}
+
+_DONE = object()
+
+
+class _Raised(object):
+    def __init__(self, err):
+        self.err = err
+
+
+def _threaded(items, queue_size=QUEUE_SIZE, stage=None):
+    # Consume an iterable on its own thread so the stage producing it keeps
+    # working while downstream stages process what it already produced,
+    # exceptions are re-raised on the consuming side. The stage timing covers
+    # the thread's whole life, stages overlap
+    q = queue.Queue(maxsize=queue_size)
+
+    def produce():
+        try:
+            with get_metrics().timer("stage", stage=stage, streaming=True):
+                for item in items:
+                    q.put(item)
+        except BaseException as err:
+            q.put(_Raised(err))
+        else:
+            q.put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = q.get()
+        if item is _DONE:
+            return
+        if isinstance(item, _Raised):
+            raise item.err
+        yield item
+
+
+def _collect(items, into):
+    for item in items:
+        into.append(item)
+        yield item
+
+
+def streaming_pipeline(
+    source, config=PIPELINE_CONFIG, verbose=False, queue_size=QUEUE_SIZE, manifest=None
+):
+    """
+    Run the pipeline on one source with every stage consuming the previous
+    stage's items (pages, address batches, summary batches) as they are
+    produced, so OCR, LLM requests and geocoding overlap.
+
+    Stages with fresh artifacts are loaded as in pipeline(), the others are
+    saved with their fingerprints once the last item went through.
+    """
+    start = time.perf_counter()
+    result = PipelineStageResults(source, [], {}, {}, {})
+    items = None
+    streaming = False  # items is the stream of a stage being extracted
+    streamed = []
+    first_result_s = None
+    try:
+        for stage in config:
+            assert len(stage["extract_args"]) <= 1, "stages must form a chain"
+
+            # pages is the list being filled by the pages stream, stages reading
+            # it (e.g. summarize windows) only look at pages already detected on
+            args = tuple(
+                getattr(result, k) if k in dir(result) else k for k in stage["args"]
+            )
+            processor = stage["processor"](*args, **stage.get("kwargs", {}))
+            fingerprint = stage_fingerprint(stage, processor, result)
+            result.fingerprints[stage["output"]] = fingerprint
+
+            if stage["load_from_cache"] and _is_fresh(processor, fingerprint):
+                if streaming:
+                    # nothing downstream reads the stream of the stage before,
+                    # run it to the end so its output is complete and saved
+                    for _ in items:
+                        pass
+
+                with get_metrics().timer("stage", stage=stage["output"]):
+                    setattr(result, stage["output"], processor.load())
+                get_metrics().count("stage_loaded", stage=stage["output"])
+                items = LOADED_ITEMS[stage["output"]](getattr(result, stage["output"]))
+                streaming = False
+            else:
+                items = _threaded(
+                    processor.iter_extract(*([items] if stage["extract_args"] else [])),
+                    queue_size,
+                    stage=stage["output"],
+                )
+                streaming = True
+                streamed.append((stage, processor, fingerprint))
+                if stage["output"] == "pages":
+                    items = _collect(items, result.pages)
+
+        for item in items:
+            if first_result_s is None:
+                first_result_s = time.perf_counter() - start
+            if verbose:
+                print(item)
+    except Exception:
+        # stages run concurrently, every stage that was streaming is failed
+        if manifest is not None:
+            for stage, _, _ in streamed:
+                manifest.record_stage(source, stage["output"], STATUS_FAILED)
+        raise
+
+    for n, (stage, processor, fingerprint) in enumerate(streamed):
+        if stage["output"] != "pages":
+            setattr(result, stage["output"], processor.result)
+        record_stage_metrics(stage, processor, result)
+        if not processor.complete:
+            # stages after it were computed from the incomplete output
+            if manifest is not None:
+                for failed, _, _ in streamed[n:]:
+                    manifest.record_stage(source, failed["output"], STATUS_FAILED)
+            raise StageIncomplete(_incomplete_message(stage, processor))
+        processor.save(overwrite=True, fingerprint=fingerprint)
+
+    if manifest is not None:
+        manifest.record_result(result)
+
+    if verbose:
+        print(
+            f"first result after {first_result_s or 0:.1f}s, "
+            f"done after {time.perf_counter() - start:.1f}s"
+        )
+
+    return result
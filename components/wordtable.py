@@ -0,0 +1,168 @@
+import io
+import numpy as np
+
+
+# pytesseract.image_to_data columns
+NUMERIC_COLUMNS = [
+    "level",
+    "page_num",
+    "block_num",
+    "par_num",
+    "line_num",
+    "word_num",
+    "left",
+    "top",
+    "width",
+    "height",
+    "conf",
+]
+TEXT_COLUMN = "text"
+HEADERS = NUMERIC_COLUMNS + [TEXT_COLUMN]
+
+DTYPE = np.dtype([(c, "<f4" if c == "conf" else "<i4") for c in NUMERIC_COLUMNS])
+
+
+class WordTable(object):
+    """
+    Tesseract word table of one page.
+
+    Numeric columns live in a structured array and word text in one string
+    with offsets, instead of a python list of strings per word. Tables read
+    from a columnar artifact are materialized on first access.
+    """
+
+    __slots__ = ("_values", "_text", "_offsets", "_loader", "_n_rows")
+
+    def __init__(self, values, text, offsets, loader=None, n_rows=None):
+        # values:  structured array of DTYPE
+        # text:    every word concatenated
+        # offsets: int64 array, word i is text[offsets[i]:offsets[i + 1]]
+        self._values = values
+        self._text = text
+        self._offsets = offsets
+        self._loader = loader
+        self._n_rows = len(values) if n_rows is None else n_rows
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, DTYPE), "", np.zeros(1, np.int64))
+
+    @classmethod
+    def lazy(cls, loader, n_rows):
+        # loader() -> (values, text, offsets)
+        return cls(None, None, None, loader=loader, n_rows=n_rows)
+
+    @classmethod
+    def from_words(cls, values, words):
+        offsets = np.zeros(len(words) + 1, np.int64)
+        np.cumsum([len(w) for w in words], out=offsets[1:])
+        return cls(values, "".join(words), offsets)
+
+    @classmethod
+    def from_rows(cls, headers, rows):
+        # From legacy [[value, ...], ...] tables (values as strings or numbers)
+        if not rows:
+            return cls.empty()
+
+        text_col = headers.index(TEXT_COLUMN)
+        numeric = np.array(
+            [[r[headers.index(c)] for c in NUMERIC_COLUMNS] for r in rows],
+            dtype=np.float64,
+        )
+        return cls.from_words(_to_values(numeric), [r[text_col] for r in rows])
+
+    @classmethod
+    def from_tesseract(cls, data):
+        # Parse pytesseract.image_to_data output, keeping rows with text
+        lines = data.split("\n")
+        headers = lines[0].split("\t")
+        rows = [line for line in lines[1:] if line and not line.endswith("\t")]
+        if not rows:
+            return cls.empty()
+
+        # all numeric columns precede the text column
+        numeric_part, words = zip(*(row.rsplit("\t", 1) for row in rows))
+        numeric = np.loadtxt(
+            io.StringIO("\n".join(numeric_part)),
+            delimiter="\t",
+            dtype=np.float64,
+            ndmin=2,
+        )
+        numeric = numeric[:, [headers.index(c) for c in NUMERIC_COLUMNS]]
+        return cls.from_words(_to_values(numeric), list(words))
+
+    def _materialize(self):
+        if self._loader is not None:
+            self._values, self._text, self._offsets = self._loader()
+            self._loader = None
+
+    @property
+    def values(self):
+        self._materialize()
+        return self._values
+
+    @property
+    def words(self):
+        self._materialize()
+        offsets = self._offsets.tolist()
+        return [self._text[offsets[i] : offsets[i + 1]] for i in range(self._n_rows)]
+
+    @property
+    def text_buffer(self):
+        # Returns: (text, offsets)
+        self._materialize()
+        return self._text, self._offsets
+
+    @property
+    def nbytes(self):
+        self._materialize()
+        return self._values.nbytes + self._offsets.nbytes + len(self._text)
+
+    def __len__(self):
+        return self._n_rows
+
+    def __getitem__(self, index):
+        # Row as [level, ..., conf, text] like the legacy list tables
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._n_rows))]
+
+        self._materialize()
+        index = range(self._n_rows)[index]
+        word = self._text[self._offsets[index] : self._offsets[index + 1]]
+        return list(self._values[index].tolist()) + [word]
+
+    def __iter__(self):
+        self._materialize()
+        for row, word in zip(self._values.tolist(), self.words):
+            yield list(row) + [word]
+
+    def __reduce__(self):
+        self._materialize()
+        return (WordTable, (self._values, self._text, self._offsets))
+
+    def to_text(self):
+        # pytesseract.image_to_string style text: words joined by spaces,
+        # lines by a newline, paragraphs by a blank line
+        if not self._n_rows:
+            return "\f"
+
+        values = self.values
+        new_par = (np.diff(values["block_num"]) != 0) | (
+            np.diff(values["par_num"]) != 0
+        )
+        new_line = new_par | (np.diff(values["line_num"]) != 0)
+        separators = np.where(new_par, "\n\n", np.where(new_line, "\n", " "))
+
+        parts = [None] * (2 * self._n_rows - 1)
+        parts[0::2] = self.words
+        parts[1::2] = separators.tolist()
+        return "".join(parts) + "\n\n\f"
+
+
+def _to_values(numeric):
+    # float64 matrix in NUMERIC_COLUMNS order -> structured array
+    values = np.empty(len(numeric), DTYPE)
+    for i, column in enumerate(NUMERIC_COLUMNS):
+        values[column] = numeric[:, i]
+
+    return values
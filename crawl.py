@@ -1,10 +1,42 @@
-from components.munisource.nj_millburn import NJMillburnCrawler, NJMillburnDownloader
+import fire
+from components.munisource.nj_millburn import (
+    DOCUMENTS_INDEX_URL,
+    MUTABLE_YEARS,
+    NJMillburnCrawler,
+    NJMillburnHTTPCrawler,
+    NJMillburnDownloader,
+)
 
 
-if __name__ == "__main__":
+def crawl(
+    browser=False,
+    index_url=DOCUMENTS_INDEX_URL,
+    download=True,
+    refresh=False,
+    delta=False,
+    years=None,
+):
     ### --- MILBURN --- ###
-    crawler = NJMillburnCrawler()
-    minutes = crawler.crawl()
+    if browser:
+        crawler = NJMillburnCrawler(index_url)
+    else:
+        crawler = NJMillburnHTTPCrawler(index_url)
+
+    if delta:
+        # recrawl only the years that can still change, merged into the
+        # latest saved crawl, e.g. --delta --years=2023,2022
+        years = [str(y) for y in years] if years else MUTABLE_YEARS
+        crawler.crawl_delta(years=years)
+    else:
+        crawler.crawl()
+
     timestamp = crawler.save()
     print("Latest @ ", timestamp)
-    NJMillburnDownloader(timestamp).download()
+    if download:
+        # refresh: re-check already downloaded pdfs, only changed ones are fetched
+        downloader = NJMillburnDownloader(timestamp, changes_only=delta)
+        print(downloader.download(refresh=refresh))
+
+
+if __name__ == "__main__":
+    fire.Fire(crawl)
@@ -1,17 +1,111 @@
 import os
-from components import pipeline
+import fire
+import functools
+from components import pipeline, streaming
+from components.scheduler import CorpusScheduler
+from components.manifest import Manifest
+from components.metrics import get_metrics
 from components.munisource import nj_millburn
+from components.processors import llm
 
 
 import pprint
 
+
+def process_serial(
+    sources, stream=False, manifest=None, config=pipeline.PIPELINE_CONFIG
+):
+    run = streaming.streaming_pipeline if stream else pipeline.pipeline
+    for source in sources:
+        pprint.pprint(source)
+        result = pipeline.reshape_to_pipeline_result(
+            run(source, config=config, manifest=manifest)
+        )
+        ids = pipeline.persist(source, result, manifest=manifest)
+        pipeline.print_pipeline_results(result)
+        print(ids)
+
+
+def changed_sources(sources, crawl_timestamp="latest"):
+    # Sources listed as new or changed by a delta crawl, all of them for a
+    # full crawl
+    crawler = nj_millburn.NJMillburnCrawler()
+    if crawl_timestamp == "latest":
+        crawl_timestamp = crawler.latest()
+    if crawl_timestamp is None:
+        raise ValueError("no saved crawl to take changes from")
+    crawler.load(crawl_timestamp)
+
+    if crawler.changes is None:
+        print(f"crawl {crawl_timestamp} is a full crawl, every source is new")
+        return sources
+
+    changed = {(c["doctype"], c["id"]) for c in crawler.changes}
+    return [s for s in sources if (s["doctype"], s["id"]) in changed]
+
+
+def process_all(
+    concurrent=False,
+    ocr_workers=None,
+    llm_workers=None,
+    stream=False,
+    changes=None,
+    reprocess=False,
+    rescan=False,
+    profile=False,
+    geocoder="nominatim",
+    gazetteer_path=None,
+):
+    # changes: crawl timestamp or "latest", only process the documents that
+    # delta crawl found new or changed
+    # reprocess: also sources the manifest has as done with unchanged inputs
+    # rescan: index sources added to the tree outside of the downloader
+    # profile: print the stages ranked by time, metrics are always exported
+    # geocoder: "nominatim", or "gazetteer" to geocode offline from the csv or
+    # parquet file at gazetteer_path
+    config = pipeline.geocoder_config(geocoder, gazetteer_path)
+    manifest = Manifest()
+    if rescan or not len(manifest):
+        manifest.backfill(
+            source
+            for doctype in nj_millburn.DOCTYPES
+            for year in nj_millburn.YEARS_TO_PROCESS
+            for source in nj_millburn.get_sources(doctype, year)
+        )
+
+    sources = manifest.sources(
+        nj_millburn.DOCTYPES,
+        nj_millburn.YEARS_TO_PROCESS,
+        pending_stage=None if reprocess else "db",
+        fingerprints=functools.partial(pipeline.expected_fingerprints, config=config),
+    )
+    print(f"{len(sources)} sources to process")
+    if changes:
+        sources = changed_sources(sources, changes)
+        print(f"{len(sources)} new or changed sources")
+
+    if concurrent:
+        workers = dict()
+        if ocr_workers:
+            workers["pages"] = ocr_workers
+        if llm_workers:
+            workers["addresses"] = workers["summaries"] = llm_workers
+
+        scheduler = CorpusScheduler(config=config, workers=workers, manifest=manifest)
+        scheduler.run(sources)
+        print(scheduler.summary())
+    else:
+        process_serial(sources, stream=stream, manifest=manifest, config=config)
+
+    print(f"manifest: {manifest.status()}")
+    if llm.get_cache() is not None:
+        print(f"llm cache: {llm.get_cache().stats}")
+
+    metrics = get_metrics()
+    print("metrics: {}, {}".format(*metrics.write()))
+    if profile:
+        print(metrics.report())
+
+
 if __name__ == "__main__":
-    for doctype in nj_millburn.DOCTYPES:
-        for year in nj_millburn.YEARS_TO_PROCESS:
-            sources = nj_millburn.get_sources(doctype, year)
-            for source in sources:
-                pprint.pprint(source)
-                result = pipeline.reshape_to_pipeline_result(pipeline.pipeline(source))
-                ids = pipeline.persist(source, result)
-                pipeline.print_pipeline_results(result)
-                print(ids)
+    fire.Fire(process_all)
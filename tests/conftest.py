@@ -0,0 +1,31 @@
+import openai
+import pytest
+
+from components import aliases, metrics
+from components.processors import llm
+from utils.standins import start_openai
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Artifacts, caches and the alias index of a test go to tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(aliases, "_index", None)
+    monkeypatch.setattr(llm, "_cache", False)
+    monkeypatch.setattr(llm, "_batch_job", None)
+    monkeypatch.setattr(metrics, "_metrics", None)
+    return tmp_path
+
+
+@pytest.fixture
+def openai_server(workdir, monkeypatch):
+    # Stand-in chat completions server the openai client talks to, retries
+    # back off for a millisecond
+    server = start_openai()
+    monkeypatch.setenv("OPENAI_KEY", "test")
+    monkeypatch.setattr(openai, "api_key", "test")
+    monkeypatch.setattr(openai, "api_base", f"{server.url}/v1")
+    monkeypatch.setattr(llm, "BACKOFF_SECONDS", 0.001)
+    yield server
+    server.shutdown()
+    server.server_close()
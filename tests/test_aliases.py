@@ -0,0 +1,58 @@
+from components.aliases import AliasIndex
+
+
+def _index(tmp_path):
+    return AliasIndex(str(tmp_path / "address_aliases.json"))
+
+
+def test_spellings_resolve_to_normalized_street(tmp_path):
+    index = _index(tmp_path)
+    assert index.resolve("12 Main Street", "Millburn", "NJ") == "12 main st"
+    assert index.resolve("l2 MAIN ST.", "Millburn", "NJ") == "12 main st"
+
+
+def test_suffix_less_spelling_independent_of_order(tmp_path):
+    before, after = _index(tmp_path / "before"), _index(tmp_path / "after")
+    before.resolve("12 Main Street", "Millburn", "NJ")
+    assert before.resolve("12 Main", "Millburn", "NJ") == "12 main st"
+
+    after.resolve("12 Main", "Millburn", "NJ")
+    after.resolve("12 Main Street", "Millburn", "NJ")
+    assert after.resolve("12 Main", "Millburn", "NJ") == "12 main st"
+
+
+def test_ambiguous_suffix_less_spelling_kept(tmp_path):
+    index = _index(tmp_path)
+    index.resolve("12 Main St", "Millburn", "NJ")
+    index.resolve("12 Main Ave", "Millburn", "NJ")
+    assert index.resolve("12 Main", "Millburn", "NJ") == "12 main"
+
+
+def test_scoped_per_city(tmp_path):
+    index = _index(tmp_path)
+    index.resolve("12 Main Street", "Millburn", "NJ")
+    assert index.resolve("12 Main", "Summit", "NJ") == "12 main"
+
+
+def test_revision_changes_on_merge_only(tmp_path):
+    index = _index(tmp_path)
+    revision = index.revision("Millburn", "NJ")
+    index.resolve("12 Main", "Millburn", "NJ")
+    index.resolve("12 Main Street", "Millburn", "NJ")
+    assert index.revision("Millburn", "NJ") == revision
+
+    index.merge("12 Main St", "14 Main St", "Millburn", "NJ")
+    assert index.revision("Millburn", "NJ") != revision
+    assert index.revision("Summit", "NJ") == revision
+
+
+def test_save_and_read(tmp_path):
+    index = _index(tmp_path)
+    index.resolve("12 Main", "Millburn", "NJ")
+    index.resolve("12 Main Street", "Millburn", "NJ")
+    index.merge("12 Main St", "14 Main St", "Millburn", "NJ")
+    index.save()
+
+    read = _index(tmp_path)
+    assert read.resolve("12 Main", "Millburn", "NJ") == "14 main st"
+    assert read.revision("Millburn", "NJ") == index.revision("Millburn", "NJ")
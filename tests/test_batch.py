@@ -0,0 +1,108 @@
+import pytest
+
+from components import batch, pipeline
+from components.processors import llm
+from components.processors.pdf2text import PDF2Text, TextPage
+from components.wordtable import WordTable
+from utils.standins import batch_responder
+
+
+SOURCE = {
+    "state_abbrv": "NJ",
+    "state": "NJ",
+    "city": "Millburn",
+    "doctype": "PLANNING",
+    "year": "2022",
+    "date": "2022-01-10",
+    "id": "1",
+    "filepath": "doc.pdf",
+}
+
+TEXTS = [
+    "The application for 12 Main Street was approved.",
+    "The applications for 14 Oak Road and 16 Oak Road were denied.",
+]
+
+
+class TextPages(PDF2Text):
+    # PDF2Text with the pages of TEXTS instead of OCR
+    def iter_extract(self):
+        self._pages = [
+            TextPage(pp, text, [], WordTable.empty(), self._source)
+            for pp, text in enumerate(TEXTS)
+        ]
+        yield from self._pages
+
+
+CONFIG = [pipeline.PIPELINE_CONFIG[0] | {"processor": TextPages}] + (
+    pipeline.PIPELINE_CONFIG[1:]
+)
+
+
+@pytest.fixture
+def cached(openai_server, monkeypatch):
+    # Response cache in the working directory, the server must not be asked
+    monkeypatch.setattr(llm, "_cache", None)
+    open("doc.pdf", "w").write("%PDF")
+    yield
+    assert openai_server.requests == 0
+
+
+def _round_trip(stage):
+    # Export the requests of stage, answer and ingest them
+    # Returns: (export counts, ingest counts)
+    job = batch.BatchJob()
+    counts = batch.run([SOURCE], stage, job, config=CONFIG)
+    path = job.write(batch.job_path(stage))
+    batch_responder(path, "output.jsonl")
+    return counts, batch.ingest_responses("output.jsonl")
+
+
+def test_round_trip(cached):
+    # both pages in one request
+    counts, ingested = _round_trip("addresses")
+    assert counts == {"done": 0, "deferred": 1, "failed": 0}
+    assert ingested == {"stored": 1, "failed": 0}
+
+    # addresses are served from the cache, summaries go to the next job, one
+    # request per page
+    counts, ingested = _round_trip("summaries")
+    assert counts == {"done": 0, "deferred": 1, "failed": 0}
+    assert ingested == {"stored": 2, "failed": 0}
+
+    job = batch.BatchJob()
+    assert batch.run([SOURCE], "summaries", job, config=CONFIG)["done"] == 1
+    assert len(job) == 0
+
+    result = pipeline.pipeline(SOURCE, batch.config_through("summaries", CONFIG))
+    assert {street: [s.page for s in v] for street, v in result.summaries.items()} == {
+        "12 main st": [0],
+        "14 oak rd": [1],
+        "16 oak rd": [1],
+    }
+
+
+def test_failed_responses_not_ingested(cached):
+    job = batch.BatchJob()
+    batch.run([SOURCE], "addresses", job, config=CONFIG)
+    job.write("job.jsonl")
+    batch_responder("job.jsonl", "output.jsonl")
+    with open("output.jsonl") as f:
+        lines = f.readlines()
+    with open("output.jsonl", "w") as f:
+        f.write(lines[0].replace('"status_code": 200', '"status_code": 500'))
+
+    assert batch.ingest_responses("output.jsonl") == {"stored": 0, "failed": 1}
+    job = batch.BatchJob()
+    assert batch.run([SOURCE], "addresses", job, config=CONFIG)["deferred"] == 1
+    assert len(job) == 1
+
+
+def test_batch_job_needs_cache(workdir):
+    with pytest.raises(ValueError):
+        batch.ingest_responses("output.jsonl")
+
+
+def test_stages_without_requests(workdir):
+    with pytest.raises(ValueError):
+        batch.run([SOURCE], "coords", batch.BatchJob())
@@ -0,0 +1,27 @@
+import pytest
+
+from components import normalize
+from components.processors import candidates
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "The application for 12 Main Street was approved.",
+        "12-14 Old Short Hills Rd.",
+        "premises at 7 Deer Trail",
+        "located at 12 Wyoming",
+        "Block 1203, Lot 5",
+    ],
+)
+def test_candidates(text):
+    assert candidates.has_candidates(text)
+
+
+def test_no_candidates():
+    assert not candidates.has_candidates("The minutes of the last meeting.")
+
+
+def test_every_normalized_suffix_is_a_candidate():
+    for suffix in normalize.STREET_SUFFIXES:
+        assert candidates.find_candidates(f"12 Foo {suffix}") == [f"12 Foo {suffix}"]
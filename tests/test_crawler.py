@@ -0,0 +1,101 @@
+import pytest
+
+from components.munisource import nj_millburn
+from components.munisource.nj_millburn import (
+    CHANGE_NEW,
+    MUTABLE_YEARS,
+    NJMillburnHTTPCrawler,
+)
+from utils.standins import (
+    AGENDA_DOCS_PER_YEAR,
+    AGENDA_VISIBLE_YEARS,
+    AGENDA_YEARS,
+    agenda_documents,
+    start_agenda_center,
+)
+
+
+# Sections of the fixture and the doctype the crawler files them under
+SECTIONS = {
+    1: "TOWNSHIP_COMMITTEE",
+    2: "ENVIRONMENTAL_COMMISSION",
+    3: "FLOOD_MITIGATION",
+    4: "HISTORIC_PRESERVATION",
+    5: "PEDESTRIAN_SAFETY",
+    6: "PLANNING",
+    7: "ZONING",
+}
+
+
+@pytest.fixture
+def agenda_center(workdir):
+    server = start_agenda_center(pdf_bytes=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _crawler(server):
+    return NJMillburnHTTPCrawler(f"{server.url}/AgendaCenter", n_workers=4)
+
+
+def test_year_links_behind_view_more(agenda_center):
+    categories = _crawler(agenda_center)._year_categories()
+
+    assert AGENDA_VISIBLE_YEARS < len(AGENDA_YEARS)
+    assert categories == {
+        doctype: {year: str(category_id) for year in AGENDA_YEARS}
+        for category_id, doctype in SECTIONS.items()
+    }
+
+
+def test_crawl(agenda_center):
+    years = [AGENDA_YEARS[0], AGENDA_YEARS[-1]]
+    minutes = _crawler(agenda_center).crawl(verbose=False, years=years)
+
+    assert set(minutes) == set(SECTIONS.values())
+    doc_id, label = agenda_documents(6, years[-1])[0]
+    assert minutes["PLANNING"][years[-1]][0] == {
+        "id": doc_id,
+        "label": label,
+        "year": years[-1],
+        "date": nj_millburn.minutes_docid_to_date_YYYYMMDD(doc_id),
+        "url": f"{agenda_center.url}/AgendaCenter/ViewFile/Minutes/_{doc_id}",
+    }
+    for by_year in minutes.values():
+        assert list(by_year) == years
+        # html renderings of the same minutes are skipped
+        assert all(len(docs) == AGENDA_DOCS_PER_YEAR for docs in by_year.values())
+
+
+def test_crawl_retries_failed_listings(agenda_center):
+    agenda_center.fail_every = 3
+    minutes = _crawler(agenda_center).crawl(verbose=False, years=AGENDA_YEARS[:2])
+
+    assert all(len(by_year) == 2 for by_year in minutes.values())
+    assert agenda_center.requests > 1 + len(SECTIONS) * 2
+
+
+def test_crawl_delta(agenda_center):
+    crawler = _crawler(agenda_center)
+    changes = crawler.crawl_delta(verbose=False)
+    n_docs = len(SECTIONS) * len(AGENDA_YEARS) * AGENDA_DOCS_PER_YEAR
+    assert len(changes) == n_docs
+    assert all(change["change"] == CHANGE_NEW for change in changes)
+    crawler.save()
+
+    # nothing changed since the saved crawl
+    crawler = _crawler(agenda_center)
+    assert crawler.crawl_delta(verbose=False) == []
+    crawler.save()
+
+    # a new meeting in every section of the mutable years
+    agenda_center.n_docs = AGENDA_DOCS_PER_YEAR + 1
+    crawler = _crawler(agenda_center)
+    changes = crawler.crawl_delta(verbose=False)
+    assert len(changes) == len(SECTIONS) * len(MUTABLE_YEARS)
+    assert {change["year"] for change in changes} == set(MUTABLE_YEARS)
+    assert all(change["change"] == CHANGE_NEW for change in changes)
+    assert sum(
+        len(docs) for by_year in crawler.minutes.values() for docs in by_year.values()
+    ) == n_docs + len(changes)
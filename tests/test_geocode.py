@@ -0,0 +1,80 @@
+import pytest
+from geopy.exc import GeocoderUnavailable
+
+from components import pipeline
+from components.processors import geocode
+from utils.standins import start_nominatim
+
+
+SOURCE = {
+    "state_abbrv": "NJ",
+    "state": "NJ",
+    "city": "Millburn",
+    "doctype": "PLANNING",
+    "year": "2022",
+    "date": "2022-01-10",
+    "id": "1",
+    "filepath": "doc.pdf",
+}
+
+
+@pytest.fixture
+def nominatim(workdir, monkeypatch):
+    monkeypatch.setattr(geocode, "_cache", None)
+    server = start_nominatim()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _geocode(server):
+    return geocode.Geocode(
+        SOURCE, requests_per_second=1000, domain=server.domain, scheme="http"
+    )
+
+
+def _unavailable(*args, **kwargs):
+    raise GeocoderUnavailable("down")
+
+
+def test_geocode(nominatim):
+    processor = _geocode(nominatim)
+    coords = processor.extract({"12 Main Street": [], "Main Street": []})
+
+    assert list(coords) == ["12 Main Street"]
+    assert processor.errors == ["GEOCODE_FAILED"]
+    assert processor.complete
+
+    # found and not found streets are both served from the cache
+    processor = _geocode(nominatim)
+    assert processor.extract({"12 Main St": [], "Main Street": []}).keys() == {
+        "12 Main St"
+    }
+    assert nominatim.requests == 2
+
+    # cache entries are named by hash, not by the street
+    key = processor._key("12 Main St")
+    assert key == processor._key("12 main street")
+    assert len(key) == 64 and " " not in key and "|" not in key
+
+
+def test_transient_errors_not_saved(nominatim, monkeypatch):
+    open("doc.pdf", "w").write("%PDF")
+    get_geocoder = geocode._get_geocoder
+    monkeypatch.setattr(geocode, "_get_geocoder", lambda *args: _unavailable)
+    stage = pipeline.PIPELINE_CONFIG[-1] | {
+        "kwargs": {"domain": nominatim.domain, "scheme": "http"}
+    }
+    result = pipeline.PipelineStageResults(SOURCE, [], {}, {"12 Main St": []}, {})
+    with pytest.raises(pipeline.StageIncomplete):
+        pipeline.run_stage(stage, result)
+
+    processor = geocode.Geocode(SOURCE)
+    assert not processor.artifact_exists
+    assert processor._lookup_cached(processor._key("12 Main St")) == (False, None)
+
+    # the next run looks the street up again
+    monkeypatch.setattr(geocode, "_get_geocoder", get_geocoder)
+    pipeline.run_stage(stage, result)
+    assert list(result.coords) == ["12 Main St"]
+    assert processor.artifact_exists
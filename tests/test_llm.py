@@ -0,0 +1,138 @@
+import pytest
+from openai import error
+
+from components.metrics import get_metrics
+from components.processors import llm
+from components.processors.address import Address
+from components.processors.pdf2text import TextPage
+from components.wordtable import WordTable
+
+
+SOURCE = {
+    "state_abbrv": "NJ",
+    "state": "NJ",
+    "city": "Millburn",
+    "doctype": "PLANNING",
+    "year": "2022",
+    "date": "2022-01-10",
+    "id": "1",
+    "filepath": "doc.pdf",
+}
+
+
+def _request(n=0):
+    return {
+        "messages": [
+            {"role": "user", "content": f"property address: {n} Main Street\n"}
+        ],
+        "temperature": 0,
+        "max_tokens": 100,
+    }
+
+
+def _pages(n):
+    return [
+        TextPage(
+            pp,
+            f"The application for {pp + 1} Main Street was approved.",
+            [],
+            WordTable.empty(),
+            SOURCE,
+        )
+        for pp in range(n)
+    ]
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    # Attempts chat_completion backed off after
+    attempts = []
+    backoff = llm._backoff
+    monkeypatch.setattr(
+        llm, "_backoff", lambda attempt: attempts.append(attempt) or backoff(attempt)
+    )
+    return attempts
+
+
+@pytest.mark.parametrize("fail_status", [429, 500, 503])
+def test_retries_transient_errors(openai_server, backoffs, fail_status):
+    openai_server.fail_every = 2
+    openai_server.fail_status = fail_status
+    for n in range(3):
+        response = llm.chat_completion(**_request(n))
+        assert f"{n} Main Street" in llm.response_content(response)
+
+    assert openai_server.requests == 5
+    assert backoffs == [0, 0]
+    assert get_metrics().counter("llm_retries") == 2
+
+
+def test_backs_off_exponentially(openai_server, backoffs):
+    openai_server.fail_every = 1
+    with pytest.raises(error.RateLimitError):
+        llm.chat_completion(**_request(), max_retries=3)
+
+    assert openai_server.requests == 4
+    assert backoffs == [0, 1, 2]
+    assert get_metrics().counter("llm_errors") == 1
+    for attempt in range(8):
+        delay = min(llm.MAX_BACKOFF_SECONDS, llm.BACKOFF_SECONDS * 2**attempt)
+        assert delay / 2 <= llm._backoff(attempt) <= delay
+
+
+def test_client_errors_not_retried(openai_server, backoffs):
+    openai_server.fail_every = 1
+    openai_server.fail_status = 400
+    with pytest.raises(error.InvalidRequestError):
+        llm.chat_completion(**_request())
+
+    assert openai_server.requests == 1
+    assert backoffs == []
+
+
+def test_concurrent_responses_in_request_order(openai_server):
+    openai_server.fail_every = 3
+    responses = llm.chat_completions([_request(n) for n in range(20)], 8)
+    for n, response in enumerate(responses):
+        assert f"{n} Main Street" in llm.response_content(response)
+
+
+def test_concurrent_failures_returned_in_place(openai_server):
+    openai_server.fail_every = 2
+    responses = llm.chat_completions(
+        [_request(n) | {"max_retries": 0} for n in range(4)], 1
+    )
+    assert [isinstance(r, error.RateLimitError) for r in responses] == [
+        False,
+        True,
+        False,
+        True,
+    ]
+    assert "2 Main Street" in llm.response_content(responses[2])
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_address_pages_in_order(openai_server, streaming):
+    openai_server.latency = 0.01
+    openai_server.fail_every = 4
+    pages = _pages(12)
+    processor = Address(SOURCE, concurrency=8, token_budget=None)
+    if streaming:
+        list(processor.iter_extract(iter(pages)))
+    else:
+        processor.extract(pages)
+
+    assert processor.complete
+    assert [(d.street, d.pages) for d in processor.result.values()] == [
+        (f"{pp + 1} main st", [pp]) for pp in range(12)
+    ]
+    assert processor.usage["requests"] == 12
+
+
+def test_address_incomplete_after_retries(openai_server):
+    openai_server.fail_every = 1
+    processor = Address(SOURCE, concurrency=2, token_budget=None)
+    processor.extract(_pages(2))
+
+    assert processor.errors == ["API_ERROR", "API_ERROR"]
+    assert not processor.complete
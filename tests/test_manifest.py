@@ -0,0 +1,42 @@
+import pytest
+
+from components.manifest import STATUS_DONE, Manifest
+
+
+def _source(workdir, name="doc.pdf"):
+    path = workdir / name
+    path.write_text("%PDF")
+    return {
+        "doctype": "PLANNING",
+        "year": "2022",
+        "date": "2022-01-10",
+        "id": "1",
+        "filepath": str(path),
+    }
+
+
+def test_pending(workdir):
+    manifest = Manifest("manifest.db")
+    source = _source(workdir)
+    manifest.add(source)
+    assert manifest.pending(["PLANNING"], ["2022"]) == [source]
+
+    manifest.record_stage(source, "pages", STATUS_DONE, "a")
+    manifest.record_stage(source, "db", STATUS_DONE)
+    assert manifest.pending(["PLANNING"], ["2022"]) == []
+    assert manifest.status()["db"] == {STATUS_DONE: 1}
+
+    # done from other inputs than the current ones
+    assert manifest.pending(
+        ["PLANNING"], ["2022"], fingerprints=lambda source, sha256: {"pages": "b"}
+    ) == [source]
+
+
+def test_unknown_stage(workdir):
+    manifest = Manifest("manifest.db")
+    source = _source(workdir)
+    manifest.add(source)
+    with pytest.raises(ValueError):
+        manifest.record_stage(source, "page", STATUS_DONE)
+    with pytest.raises(ValueError):
+        manifest.pending(["PLANNING"], ["2022"], stage="summary")
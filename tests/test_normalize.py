@@ -0,0 +1,86 @@
+import pytest
+
+from components.normalize import location_key, normalize_street
+
+
+@pytest.mark.parametrize(
+    "street, expected",
+    [
+        ("12 Main Street", "12 main st"),
+        ("12 Main Street.", "12 main st"),
+        ("12 MAIN ST, Block 3 Lot 4", "12 main st"),
+        ("12 Main St. Unit 2", "12 main st"),
+        ("12 Main St #4", "12 main st"),
+        ("12a Oak Road Millburn NJ 07041", "12a oak rd"),
+        ("Main St", "main st"),
+        ("12 Main", "12 main"),
+    ],
+)
+def test_suffixes_units_and_trailing_words(street, expected):
+    assert normalize_street(street) == expected
+
+
+@pytest.mark.parametrize(
+    "street, expected",
+    [
+        ("l2 Main St", "12 main st"),
+        ("1O2 Main St", "102 main st"),
+        ("l2a Main St", "12a main st"),
+        ("12 Main St.,", "12 main st"),
+        ("'12 Main St'", "12 main st"),
+    ],
+)
+def test_ocr_noise(street, expected):
+    assert normalize_street(street) == expected
+
+
+@pytest.mark.parametrize(
+    "street, expected",
+    [
+        ("1st Avenue", "1st ave"),
+        ("21st Street", "21st st"),
+        ("2nd Street", "2nd st"),
+        ("3rd Place", "3rd pl"),
+        ("5th Ave", "5th ave"),
+        ("12 1st Avenue", "12 1st ave"),
+        ("102 W 3rd St", "102 w 3rd st"),
+    ],
+)
+def test_ordinal_street_names(street, expected):
+    assert normalize_street(street) == expected
+
+
+@pytest.mark.parametrize(
+    "street, expected",
+    [
+        ("12 - 14 Main Street", "12-14 main st"),
+        ("12-14 Main St", "12-14 main st"),
+        ("12 & 14 Main St", "12-14 main st"),
+        ("12 thru 14 Main St", "12-14 main st"),
+    ],
+)
+def test_house_number_ranges(street, expected):
+    assert normalize_street(street) == expected
+
+
+@pytest.mark.parametrize(
+    "street, expected",
+    [
+        ("12 North Main Street", "12 n main st"),
+        ("12 Main Street West", "12 main st w"),
+        ("North Street", "north st"),
+        ("12 West Street", "12 west st"),
+    ],
+)
+def test_directionals(street, expected):
+    assert normalize_street(street) == expected
+
+
+def test_idempotent():
+    for street in ["12 Main Street", "1st Avenue", "12-14 North Main St", "l2 Oak Rd"]:
+        normalized = normalize_street(street)
+        assert normalize_street(normalized) == normalized
+
+
+def test_location_key():
+    assert location_key("12 Main Street", "Millburn", "NJ") == "12 main st|millburn|nj"
@@ -0,0 +1,51 @@
+import pytest
+
+from components import pipeline
+from components.processors.gazetteer import GazetteerGeocode
+from components.processors.geocode import Geocode
+
+
+SOURCE = {
+    "state_abbrv": "NJ",
+    "state": "NJ",
+    "city": "Millburn",
+    "doctype": "PLANNING",
+    "year": "2022",
+    "date": "2022-01-10",
+    "id": "1",
+    "filepath": "doc.pdf",
+}
+
+
+@pytest.fixture
+def gazetteer(workdir, monkeypatch):
+    monkeypatch.setenv("OPENAI_KEY", "test")
+    with open("points.csv", "w") as f:
+        f.write("street,lat,lon\n12 Main St,40.72,-74.30\n")
+    return "points.csv"
+
+
+def test_geocoder_config(gazetteer):
+    assert pipeline.geocoder_config() == pipeline.PIPELINE_CONFIG
+
+    config = pipeline.geocoder_config("gazetteer", gazetteer)
+    assert [s["processor"] for s in config][-1] is GazetteerGeocode
+    assert config[-1]["kwargs"] == {"gazetteer_path": gazetteer}
+    assert [s["processor"] for s in pipeline.PIPELINE_CONFIG][-1] is Geocode
+
+    with pytest.raises(ValueError):
+        pipeline.geocoder_config("gazetteer")
+    with pytest.raises(ValueError):
+        pipeline.geocoder_config("google")
+
+
+def test_expected_fingerprints_of_config(gazetteer):
+    nominatim = pipeline.expected_fingerprints(SOURCE, "sha256")
+    offline = pipeline.expected_fingerprints(
+        SOURCE, "sha256", pipeline.geocoder_config("gazetteer", gazetteer)
+    )
+
+    assert {k: v for k, v in offline.items() if k != "coords"} == {
+        k: v for k, v in nominatim.items() if k != "coords"
+    }
+    assert offline["coords"] != nominatim["coords"]
@@ -0,0 +1,84 @@
+import os
+
+from components import pipeline, streaming
+from components.processors.pdf2text import PDF2Text, TextPage
+from components.wordtable import WordTable
+
+
+SOURCE = {
+    "state_abbrv": "NJ",
+    "state": "NJ",
+    "city": "Millburn",
+    "doctype": "PLANNING",
+    "year": "2022",
+    "date": "2022-01-10",
+    "id": "1",
+    "filepath": "doc.pdf",
+}
+
+TEXTS = [
+    "The application for 12 Main Street was approved.",
+    "The minutes of the last meeting were adopted.",
+    "The application for 14 Oak Road was denied.",
+]
+
+
+class TextPages(PDF2Text):
+    # PDF2Text with the pages of TEXTS instead of OCR
+    def iter_extract(self):
+        pages = [
+            TextPage(pp, text, [], WordTable.empty(), self._source)
+            for pp, text in enumerate(TEXTS)
+        ]
+        yield from pages
+        self._pages = pages
+
+
+CONFIG = [pipeline.PIPELINE_CONFIG[0] | {"processor": TextPages}] + (
+    pipeline.PIPELINE_CONFIG[1:3]
+)
+
+
+def _run():
+    return streaming.streaming_pipeline(SOURCE, CONFIG)
+
+
+def _artifact(stage):
+    processor = pipeline._processor(
+        stage, pipeline.PipelineStageResults(SOURCE, [], {}, {}, {})
+    )
+    return processor._artifact.filepath
+
+
+def test_streaming_pipeline(openai_server):
+    open("doc.pdf", "w").write("%PDF")
+    result = _run()
+
+    assert [page.text for page in result.pages] == TEXTS
+    assert list(result.summaries) == ["12 main st", "14 oak rd"]
+    assert all(os.path.exists(_artifact(stage)) for stage in CONFIG)
+
+    # everything fresh
+    requests = openai_server.requests
+    assert _run().summaries == result.summaries
+    assert openai_server.requests == requests
+
+
+def test_pages_stale_addresses_fresh(openai_server):
+    open("doc.pdf", "w").write("%PDF")
+    summaries = _run().summaries
+
+    # nothing downstream of the pages reads them
+    os.remove(_artifact(CONFIG[0]))
+    result = _run()
+    assert [page.text for page in result.pages] == TEXTS
+    assert result.summaries == summaries
+    assert os.path.exists(_artifact(CONFIG[0]))
+
+    # summaries read the pages
+    os.remove(_artifact(CONFIG[0]))
+    os.remove(_artifact(CONFIG[2]))
+    result = _run()
+    assert [page.text for page in result.pages] == TEXTS
+    assert result.summaries == summaries
+    assert os.path.exists(_artifact(CONFIG[2]))
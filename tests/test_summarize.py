@@ -0,0 +1,68 @@
+import pytest
+
+from components import pipeline
+from components.processors.address import AddressDetection
+from components.processors.pdf2text import TextPage
+from components.processors.summarize import Summarize
+from components.wordtable import WordTable
+
+
+SOURCE = {
+    "state_abbrv": "NJ",
+    "state": "NJ",
+    "city": "Millburn",
+    "doctype": "PLANNING",
+    "year": "2022",
+    "date": "2022-01-10",
+    "id": "1",
+    "filepath": "doc.pdf",
+}
+
+STREETS = ["12 main st", "14 oak rd"]
+
+
+def _pages():
+    text = "The applications for 12 Main Street and 14 Oak Road were approved."
+    return [TextPage(0, text, [], WordTable.empty(), SOURCE)]
+
+
+def _addresses():
+    return {street: AddressDetection(street, [street], [0]) for street in STREETS}
+
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_summaries(openai_server, batch):
+    processor = Summarize(SOURCE, _pages(), batch=batch)
+    summaries = processor.extract(_addresses())
+
+    assert processor.complete
+    assert {street: [s.page for s in v] for street, v in summaries.items()} == {
+        street: [0] for street in STREETS
+    }
+    assert openai_server.requests == (1 if batch else 2)
+
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_failed_requests_recorded(openai_server, batch):
+    openai_server.fail_every = 1
+    processor = Summarize(SOURCE, _pages(), batch=batch)
+    summaries = processor.extract(_addresses())
+
+    assert summaries == {street: [] for street in STREETS}
+    assert processor.errors.count("API_ERROR") == 2
+    assert not processor.complete
+
+
+def test_failed_requests_not_saved(openai_server):
+    open("doc.pdf", "w").write("%PDF")
+    openai_server.fail_every = 1
+    stage = pipeline.PIPELINE_CONFIG[2]
+    result = pipeline.PipelineStageResults(SOURCE, _pages(), _addresses(), {}, {})
+    with pytest.raises(pipeline.StageIncomplete):
+        pipeline.run_stage(stage, result)
+    assert not Summarize(SOURCE, []).artifact_exists
+
+    openai_server.fail_every = 0
+    pipeline.run_stage(stage, result)
+    assert set(result.summaries) == set(STREETS)
+    assert Summarize(SOURCE, []).artifact_exists
@@ -0,0 +1,65 @@
+import os
+import json
+import fire
+
+from components.artifact import ARTIFACT_ROOT, Artifact, ColumnarArtifact
+from components.processors.pdf2text import PROCESSOR_NAME, TextPage
+
+
+def migrate_artifacts(root=ARTIFACT_ROOT, delete=False, dry_run=False):
+    """
+    Convert json pdf2text artifacts under root to the columnar format.
+
+    Usage: python -m utils.migrate_artifacts [--root=artifacts] [--delete]
+    """
+    n_migrated = 0
+    bytes_before = 0
+    bytes_after = 0
+    for dirpath, _, filenames in os.walk(root):
+        if f"{PROCESSOR_NAME}.json" not in filenames:
+            continue
+
+        json_path = os.path.join(dirpath, f"{PROCESSOR_NAME}.json")
+        with open(json_path, "r") as f:
+            artifact = json.loads(f.read())
+
+        source = artifact["source"]
+        legacy = Artifact(source, PROCESSOR_NAME, root=root)
+        columnar = ColumnarArtifact(source, PROCESSOR_NAME, root=root)
+        if os.path.abspath(legacy.filepath) != os.path.abspath(json_path):
+            print(f"skipping {json_path}, does not match its source")
+            continue
+
+        print(f"{json_path} -> {columnar.filepath}")
+        if dry_run:
+            continue
+
+        pages = [TextPage(**p) for p in artifact["data"]]
+        columnar.write(
+            pages,
+            overwrite=True,
+            fingerprint=artifact.get("fingerprint"),
+            timestamp=artifact["timestamp"],
+        )
+
+        # verify before removing anything, a bad conversion keeps the json
+        migrated = columnar.read()
+        texts_match = [p["text"] for p in migrated] == [p.text for p in pages]
+        tables_match = [len(p["table"]) for p in migrated] == [
+            len(p.table) for p in pages
+        ]
+        if not texts_match or not tables_match:
+            columnar.delete()
+            raise ValueError(f"{columnar.filepath} does not match {json_path}")
+
+        n_migrated += 1
+        bytes_before += os.path.getsize(json_path)
+        bytes_after += os.path.getsize(columnar.filepath)
+        if delete:
+            legacy.delete()
+
+    print(f"migrated {n_migrated} artifacts: {bytes_before} -> {bytes_after} bytes")
+
+
+if __name__ == "__main__":
+    fire.Fire(migrate_artifacts)
@@ -0,0 +1,467 @@
+import re
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+import fire
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ADDRESS_PATTERN = re.compile(
+    r"\b\d{1,5}(?:-\d{1,5})? (?:[A-Z][a-z]+ ){1,3}"
+    r"(?:Street|St|Avenue|Ave|Road|Rd|Drive|Dr|Lane|Ln|Place|Pl|Terrace|Way|Court|Ct)\b"
+)
+
+
+def _canned_summary(street):
+    return {
+        "status": "APPROVED",
+        "summary": f"The application for {street} was approved.",
+        "tags": ["EXTENSION"],
+    }
+
+
+def canned_chat_content(messages):
+    # Deterministic stand-in for the model, answers the prompts used by the
+    # processors with regex matches instead of inference
+    prompt = messages[-1]["content"]
+    if prompt.startswith("Find property addresses in the document pages"):
+        document = prompt.split("Document: ", 1)[-1]
+        addresses = []
+        for page, text in re.findall(
+            r"=== PAGE (\d+) ===\n(.*?)(?=\n=== PAGE \d+ ===|$)", document, re.S
+        ):
+            addresses += [
+                {"address": a, "page": int(page)}
+                for a in dict.fromkeys(ADDRESS_PATTERN.findall(text))
+            ]
+        return json.dumps({"addresses": addresses})
+
+    if prompt.startswith("Find property addresses"):
+        document = prompt.split("Document: ", 1)[-1]
+        addresses = list(dict.fromkeys(ADDRESS_PATTERN.findall(document)))
+        return json.dumps({"addresses": addresses})
+
+    if "property addresses:\n" in prompt:
+        streets = prompt.split("property addresses:\n", 1)[1]
+        streets = streets.split("\n\ndocument: ", 1)[0].split("\n")
+        return json.dumps({street: _canned_summary(street) for street in streets})
+
+    if "property address: " in prompt:
+        street = prompt.split("property address: ", 1)[1].split("\n", 1)[0]
+        return json.dumps(_canned_summary(street))
+
+    return "{}"
+
+
+def canned_completion(request, completion_id):
+    # Chat completion response body for a request body
+    content = canned_chat_content(request["messages"])
+    prompt_tokens = sum(len(m["content"]) for m in request["messages"]) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request["model"],
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        n_request = self.server.count()
+        time.sleep(self.server.latency)
+
+        if self.server.fail_every and n_request % self.server.fail_every == 0:
+            return self._send(
+                self.server.fail_status,
+                {"error": {"message": "Request failed", "type": "requests"}},
+            )
+
+        self._send(200, canned_completion(request, f"chatcmpl-{n_request}"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, latency=0.0, fail_every=0):
+        super().__init__(address, handler)
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    @property
+    def domain(self):
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    @property
+    def url(self):
+        return f"http://{self.domain}"
+
+
+def start_openai(port=0, latency=0.0, fail_every=0, fail_status=429):
+    """
+    Start a mock OpenAI chat completions server in a background thread.
+
+    Point the openai client at it with openai.api_base = f"{server.url}/v1"
+    (or the OPENAI_API_BASE env var). Every `fail_every`-th request gets a
+    `fail_status` error (429 by default) to exercise retries.
+    """
+    server = StandinServer(
+        ("127.0.0.1", port), _OpenAIHandler, latency=latency, fail_every=fail_every
+    )
+    server.fail_status = fail_status
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+AGENDA_SECTIONS = {
+    # category id: section name, as on the Millburn agenda center
+    1: "Township Committee",
+    2: "Environmental Commission",
+    3: "Flood Mitigation Advisory Committee",
+    4: "Historic Preservation Commission",
+    5: "Pedestrian Safety Advisory Board",
+    6: "Planning Board",
+    7: "Zoning Board of Adjustment",
+}
+AGENDA_YEARS = [str(y) for y in range(2013, 2024)][::-1]
+AGENDA_VISIBLE_YEARS = 3  # the rest is behind "View More"
+AGENDA_DOCS_PER_YEAR = 4
+AGENDA_PDF_BYTES = 64 * 1024
+AGENDA_LAST_MODIFIED = "Mon, 02 Jan 2023 00:00:00 GMT"
+
+
+def agenda_documents(category_id, year, n_docs=AGENDA_DOCS_PER_YEAR):
+    # Returns: [(doc id, label), ...] deterministic meetings of a section
+    section = AGENDA_SECTIONS[category_id]
+    return [
+        (
+            f"{month:02d}{10 + category_id:02d}{year}-{category_id * 100 + month}",
+            f"{section} Meeting",
+        )
+        for month in range(1, n_docs + 1)
+    ]
+
+
+def agenda_pdf(doc_id, size=0):
+    # Minimal single page pdf, unique per document, padded with comment lines
+    # to about size bytes
+    padding = f"% {doc_id} {'.' * 60}\n".encode("utf-8")
+    return (
+        b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+        b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+        b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\n"
+        + padding * max(size // len(padding), 1)
+        + b"trailer<</Root 1 0 R>>\n%%EOF\n"
+    )
+
+
+def _agenda_index_html():
+    sections = []
+    for category_id, section in AGENDA_SECTIONS.items():
+        links = [
+            f'<li><a href="javascript:void(0);" onclick="changeYear({year}, '
+            f'{category_id}, this); return false;" aria-label="{section} {year}">'
+            f"{year}</a></li>"
+            for year in AGENDA_YEARS
+        ]
+        sections.append(
+            f'<div class="listing" id="cat{category_id}"><h2><span>{section}</span></h2>'
+            f'<ul class="years">{"".join(links[:AGENDA_VISIBLE_YEARS])}</ul>'
+            f'<div class="moreYears"><a href="javascript:void(0);" '
+            f'onclick="showMoreYears(this); return false;">View More</a>'
+            f'<ul class="years">{"".join(links[AGENDA_VISIBLE_YEARS:])}</ul></div>'
+            f"</div>"
+        )
+    return f"<html><body>{''.join(sections)}</body></html>"
+
+
+def _agenda_rows_html(category_id, year, n_docs):
+    rows = [
+        f'<tr class="catAgendaRow"><td><p><a id="{doc_id}" '
+        f'href="/AgendaCenter/ViewFile/Agenda/_{doc_id}">{label}</a></p></td>'
+        f'<td class="minutes"><a href="/AgendaCenter/ViewFile/Minutes/_{doc_id}">'
+        f"Minutes</a></td>"
+        f'<td><a href="/AgendaCenter/ViewFile/Minutes/_{doc_id}?html=true">HTML</a></td>'
+        f"</tr>"
+        for doc_id, label in agenda_documents(category_id, year, n_docs)
+    ]
+    return f"<table><tbody>{''.join(rows)}</tbody></table>"
+
+
+class _AgendaCenterHandler(BaseHTTPRequestHandler):
+    def _send(self, status, body, content_type="text/html", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_pdf(self, doc_id):
+        # Conditional (If-None-Match, If-Modified-Since) and range requests
+        body = agenda_pdf(doc_id, self.server.pdf_bytes)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        validators = {"ETag": etag, "Last-Modified": AGENDA_LAST_MODIFIED}
+        if (
+            self.headers.get("If-None-Match") == etag
+            or self.headers.get("If-Modified-Since") == AGENDA_LAST_MODIFIED
+        ):
+            return self._send(304, b"", headers=validators)
+
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range") or "")
+        if match and self.headers.get("If-Range") in (etag, AGENDA_LAST_MODIFIED):
+            start = int(match.group(1))
+            return self._send(
+                206,
+                body[start:],
+                "application/pdf",
+                validators
+                | {"Content-Range": f"bytes {start}-{len(body) - 1}/{len(body)}"},
+            )
+
+        self._send(200, body, "application/pdf", validators)
+
+    def do_GET(self):
+        self.server.count()
+        time.sleep(self.server.latency)
+        path = urllib.parse.urlparse(self.path).path
+        if path.lower() == "/agendacenter":
+            html = _agenda_index_html()
+            return self._send(200, html.encode("utf-8"))
+
+        if path.startswith("/AgendaCenter/ViewFile/"):
+            return self._send_pdf(path.split("/")[-1][1:])
+
+        self._send(404, b"not found")
+
+    def do_POST(self):
+        n_request = self.server.count()
+        time.sleep(self.server.latency)
+        form = urllib.parse.parse_qs(
+            self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        )
+        if self.server.fail_every and n_request % self.server.fail_every == 0:
+            return self._send(503, b"unavailable")
+
+        if self.path != "/AgendaCenter/UpdateCategoryList":
+            return self._send(404, b"not found")
+
+        category_id = int(form["catID"][0])
+        html = _agenda_rows_html(category_id, form["year"][0], self.server.n_docs)
+        self._send(200, html.encode("utf-8"))
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_agenda_center(
+    port=0,
+    latency=0.0,
+    fail_every=0,
+    n_docs=AGENDA_DOCS_PER_YEAR,
+    pdf_bytes=AGENDA_PDF_BYTES,
+):
+    """
+    Start a fixture of the CivicPlus agenda center in a background thread:
+    the index page with every section's year links, the UpdateCategoryList
+    endpoint and the minutes pdfs.
+
+    Crawl it with NJMillburnHTTPCrawler(f"{server.url}/AgendaCenter").
+    """
+    server = StandinServer(
+        ("127.0.0.1", port),
+        _AgendaCenterHandler,
+        latency=latency,
+        fail_every=fail_every,
+    )
+    server.n_docs = n_docs
+    server.pdf_bytes = pdf_bytes
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Stand-in geocodes fall inside Millburn / Short Hills
+NOMINATIM_BBOX = (40.70, 40.76, -74.36, -74.29)  # south, north, west, east
+
+
+def canned_location(query):
+    # Deterministic point for a query, the same street always lands on the
+    # same spot. Queries without a house number are not found
+    if not re.search(r"\d", query):
+        return None
+
+    digest = hashlib.sha256(query.lower().encode("utf-8")).digest()
+    south, north, west, east = NOMINATIM_BBOX
+    lat = south + (north - south) * digest[0] / 255
+    lon = west + (east - west) * digest[1] / 255
+    return lat, lon
+
+
+class _NominatimHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        n_request = self.server.count()
+        time.sleep(self.server.latency)
+
+        if self.server.fail_every and n_request % self.server.fail_every == 0:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        query = urllib.parse.parse_qs(url.query).get("q", [""])[0]
+        location = canned_location(query) if url.path == "/search" else None
+        places = []
+        if location:
+            lat, lon = location
+            places.append(
+                {
+                    "place_id": n_request,
+                    "lat": f"{lat:.7f}",
+                    "lon": f"{lon:.7f}",
+                    "display_name": query,
+                    "class": "place",
+                    "type": "house",
+                    "importance": 0.5,
+                }
+            )
+
+        body = json.dumps(places).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_nominatim(port=0, latency=0.0, fail_every=0):
+    """
+    Start a mock of the Nominatim search endpoint in a background thread.
+
+    Point the geocoder at it with Geocode(source, domain=server.domain,
+    scheme="http") or the NOMINATIM_DOMAIN and NOMINATIM_SCHEME env vars.
+    """
+    server = StandinServer(
+        ("127.0.0.1", port), _NominatimHandler, latency=latency, fail_every=fail_every
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def agenda_center_server(port=8001, latency=0.0, fail_every=0):
+    server = start_agenda_center(port, latency=latency, fail_every=fail_every)
+    print(f"python crawl.py --index_url={server.url}/AgendaCenter")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def batch_responder(job, output, api_base=None, concurrency=16):
+    """
+    Answer a batch job file with the canned responses, or forward its requests
+    to an OpenAI compatible server at api_base, and write the batch output
+    file to ingest with `python batch_llm.py ingest <output>`.
+    """
+    with open(job) as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+
+    if api_base:
+        import openai
+        from components.processors import llm
+
+        openai.api_base = api_base
+        llm.set_cache(False)
+        bodies = llm.chat_completions([r["body"] for r in requests], concurrency)
+    else:
+        bodies = [
+            canned_completion(r["body"], f"chatcmpl-{n}")
+            for n, r in enumerate(requests)
+        ]
+
+    with open(output, "w") as f:
+        for n, (request, body) in enumerate(zip(requests, bodies)):
+            failed = isinstance(body, Exception)
+            line = {
+                "id": f"batch_req_{n}",
+                "custom_id": request["custom_id"],
+                "response": None
+                if failed
+                else {"status_code": 200, "request_id": str(n), "body": body},
+                "error": {"message": str(body)} if failed else None,
+            }
+            f.write(json.dumps(line) + "\n")
+
+    print(f"{len(requests)} responses: {output}")
+
+
+def openai_server(port=8000, latency=0.0, fail_every=0, fail_status=429):
+    server = start_openai(
+        port, latency=latency, fail_every=fail_every, fail_status=fail_status
+    )
+    print(f"export OPENAI_API_BASE={server.url}/v1")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def nominatim_server(port=8002, latency=0.0, fail_every=0):
+    server = start_nominatim(port, latency=latency, fail_every=fail_every)
+    print(f"export NOMINATIM_DOMAIN={server.domain} NOMINATIM_SCHEME=http")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    fire.Fire(
+        {
+            "openai": openai_server,
+            "agendacenter": agenda_center_server,
+            "nominatim": nominatim_server,
+            "respond": batch_responder,
+        }
+    )